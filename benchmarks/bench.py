@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 trollbufr developers
+#
+# Author(s):
+#
+#   trollbufr developers
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Benchmarks for trollbufr
+========================
+Measures the throughput of all decode and encode paths:
+
+- scan       : next_bufr() scanning files for BUFR.
+- meta       : decode_meta(), sections 0-5 without data.
+- data_comp  : next_data() on compressed BUFR.
+- data_uncomp: next_data() on un-compressed BUFR.
+- array      : next_data() with as_array=True (compressed BUFR).
+- json       : decode() to a JSON object.
+- encode     : encode() from a JSON object.
+- tables_*   : loading tables, for each table format given.
+
+Each benchmark runs "repeat" times, the best time is reported as
+messages/s, subsets/s, and values/s.
+
+The results of each run are stored as JSON file in the results directory,
+a run is compared to the previous one (or the file given with --compare).
+
+Example::
+
+    python benchmarks/bench.py -t test/bufrtables -T bufrdc \\
+        test/metop_mhs.bufr docs/source/_static/207003.bufr
+
+Table formats for table loading are added with "-L format:path".
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import sys
+import os
+import glob
+import json
+import time
+import timeit
+import platform
+import subprocess
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from trollbufr.bufr import Bufr
+from trollbufr import load_file
+from trollbufr.coder import load_tables
+from trollbufr.version import version
+
+import logging
+logger = logging.getLogger("trollbufr")
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+class Counter(object):
+    """Counts messages, subsets, and values processed by one benchmark run."""
+
+    def __init__(self):
+        self.messages = 0
+        self.subsets = 0
+        self.values = 0
+
+
+class BenchData(object):
+    """Holds the BUFR, loaded once, for all benchmarks."""
+
+    def __init__(self, files, tab_fmt, tab_path):
+        self.files = files
+        self.tab_fmt = tab_fmt
+        self.tab_path = tab_path
+        self.bufr = Bufr(tab_fmt, tab_path)
+        self.blobs = []
+        self.comp = []
+        self.uncomp = []
+        self.json = []
+        # Number of data values per BUFR, counted once for all benchmarks.
+        self.values = []
+        for fn in files:
+            for blob, _, _ in load_file.next_bufr(fn):
+                self.blobs.append(blob)
+                self.bufr.decode_meta(blob)
+                if self.bufr.is_compressed:
+                    self.comp.append(blob)
+                else:
+                    self.uncomp.append(blob)
+                blob.reset()
+                self.json.append(self.bufr.decode(blob))
+                cnt = Counter()
+                _bench_data(self, cnt, [blob])
+                self.values.append(cnt.values)
+                blob.reset()
+        self.meta = self.bufr.get_meta()
+
+
+def bench_scan(data, cnt):
+    for fn in data.files:
+        for blob, _, _ in load_file.next_bufr(fn):
+            cnt.messages += 1
+
+
+def bench_meta(data, cnt):
+    for blob in data.blobs:
+        blob.reset()
+        data.bufr.decode_meta(blob, load_tables=False)
+        cnt.messages += 1
+        cnt.subsets += data.bufr.subsets
+
+
+def _bench_data(data, cnt, blobs, as_array=False):
+    for blob in blobs:
+        blob.reset()
+        data.bufr.decode_meta(blob)
+        cnt.messages += 1
+        for subset in data.bufr.next_subset(as_array):
+            cnt.subsets += data.bufr.subsets if as_array else 1
+            for entry in subset.next_data():
+                if entry.mark is None:
+                    cnt.values += len(entry.value) if as_array else 1
+
+
+def bench_data_comp(data, cnt):
+    _bench_data(data, cnt, data.comp)
+
+
+def bench_data_uncomp(data, cnt):
+    _bench_data(data, cnt, data.uncomp)
+
+
+def bench_array(data, cnt):
+    _bench_data(data, cnt, data.comp, as_array=True)
+
+
+def bench_json(data, cnt):
+    for blob, values in zip(data.blobs, data.values):
+        blob.reset()
+        data.bufr.decode(blob)
+        cnt.messages += 1
+        cnt.subsets += data.bufr.subsets
+        cnt.values += values
+
+
+def bench_encode(data, cnt):
+    for json_bufr, values in zip(data.json, data.values):
+        data.bufr.encode(json_bufr)
+        cnt.messages += 1
+        cnt.subsets += data.bufr.subsets
+        cnt.values += values
+
+
+def bench_tables(tab_fmt, tab_path):
+    """Create benchmark for loading tables of one format."""
+    def bench(data, cnt):
+        load_tables.load_all(data.meta["master"],
+                             data.meta["center"],
+                             data.meta["subcenter"],
+                             data.meta["mver"],
+                             data.meta["lver"],
+                             tab_path,
+                             tab_fmt)
+        cnt.messages += 1
+    return bench
+
+
+"""Benchmarks: name, function, required BUFR in BenchData."""
+BENCHMARKS = [("scan", bench_scan, "blobs"),
+              ("meta", bench_meta, "blobs"),
+              ("data_comp", bench_data_comp, "comp"),
+              ("data_uncomp", bench_data_uncomp, "uncomp"),
+              ("array", bench_array, "comp"),
+              ("json", bench_json, "blobs"),
+              ("encode", bench_encode, "json"),
+              ]
+
+
+def run_bench(func, data, repeat):
+    """Run one benchmark repeatedly, return dict with best time and rates."""
+    best = None
+    for _ in range(repeat):
+        cnt = Counter()
+        t = timeit.default_timer()
+        func(data, cnt)
+        t = timeit.default_timer() - t
+        if best is None or t < best:
+            best = t
+    res = {"time": best,
+           "messages": cnt.messages,
+           "subsets": cnt.subsets,
+           "values": cnt.values,
+           }
+    for k in ("messages", "subsets", "values"):
+        res[k + "/s"] = cnt.__dict__[k] / best if best > 0 else 0.0
+    return res
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.STDOUT
+                                       ).decode().strip()
+    except Exception:
+        return None
+
+
+def last_result(exclude=None):
+    """Find the latest stored result file."""
+    files = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")))
+    files = [f for f in files if f != exclude]
+    return files[-1] if files else None
+
+
+def print_results(results, previous=None):
+    """Print table of results, with change to previous run in percent."""
+    cols = ("messages/s", "subsets/s", "values/s")
+    print("%-14s %10s %14s %14s %14s %9s" % (("benchmark", "time[s]") + cols + ("change",)))
+    for name, res in results["benchmarks"]:
+        line = "%-14s %10.4f" % (name, res["time"])
+        line += "".join(" %14.1f" % res[k] if res[k] else " %14s" % "-" for k in cols)
+        if previous is not None and name in previous and previous[name]["time"] > 0:
+            line += " %+8.1f%%" % ((previous[name]["time"] / res["time"] - 1) * 100
+                                   if res["time"] > 0 else 0.0)
+        print(line)
+
+
+def run(argv=None):
+    parser = ArgumentParser(description=__doc__,
+                            formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument("-t", "--tables_path",
+                        default=os.getenv("BUFR_TABLES"),
+                        help="path to tables, if not set in $BUFR_TABLES",
+                        metavar="path")
+    parser.add_argument("-T", "--tables_type",
+                        default=os.getenv("BUFR_TABLES_TYPE", load_tables.list_parser()[0]),
+                        choices=load_tables.list_parser(),
+                        help="type of table format",
+                        metavar="name")
+    parser.add_argument("-L", "--load-tables", dest="load_tables",
+                        action="append", default=[],
+                        metavar="format:path",
+                        help="benchmark table loading for this format and path")
+    parser.add_argument("-n", "--repeat", type=int, default=3,
+                        help="repeat each benchmark N times [default: 3]")
+    parser.add_argument("-b", "--bench", action="append", default=[],
+                        metavar="name",
+                        help="run only this benchmark (multiple allowed)")
+    parser.add_argument("-c", "--compare", metavar="file",
+                        help="compare with this result file [default: previous run]")
+    parser.add_argument("--no-store", dest="store", action="store_false",
+                        help="don't store the results")
+    parser.add_argument("in_file", nargs="+", metavar="file",
+                        help="file(s) with BUFR")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.tables_path is None:
+        sys.stderr.write("No path to tables given!\n")
+        return 1
+    data = BenchData(args.in_file, args.tables_type, args.tables_path)
+    benchmarks = list(BENCHMARKS)
+    load_spec = args.load_tables or ["%s:%s" % (args.tables_type, args.tables_path)]
+    for spec in load_spec:
+        tab_fmt, tab_path = spec.split(":", 1)
+        benchmarks.append(("tables_" + tab_fmt, bench_tables(tab_fmt, tab_path), "blobs"))
+    if args.bench:
+        benchmarks = [b for b in benchmarks if b[0] in args.bench]
+
+    results = {"date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "revision": git_revision(),
+               "version": version,
+               "python": platform.python_version(),
+               "machine": platform.machine(),
+               "files": [os.path.basename(fn) for fn in args.in_file],
+               "repeat": args.repeat,
+               "benchmarks": [],
+               }
+    for name, func, required in benchmarks:
+        if not getattr(data, required):
+            print("%-14s skipped, no BUFR for this benchmark" % name)
+            continue
+        results["benchmarks"].append((name, run_bench(func, data, args.repeat)))
+
+    compare_file = args.compare or last_result()
+    previous = None
+    if compare_file is not None:
+        with open(compare_file, "r") as fh:
+            prev = json.load(fh)
+        previous = dict((n, r) for n, r in prev["benchmarks"])
+        print("Compared with %s (%s)" % (os.path.basename(compare_file), prev.get("revision")))
+    print_results(results, previous)
+
+    if args.store:
+        if not os.path.isdir(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
+        fn_out = os.path.join(RESULTS_DIR, "%s_%s.json" % (time.strftime("%Y%m%d-%H%M%S"),
+                                                            results["revision"] or "local"))
+        with open(fn_out, "w") as fh:
+            json.dump(results, fh, indent=1)
+        print("Results stored in %s" % fn_out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -59,6 +59,7 @@ setup(name="trollbufr",
           "console_scripts": scripts_with_python_version},
       packages=["trollbufr", "trollbufr.coder"],
       install_requires=requires,
+      extras_require={"numpy": ["numpy"]},
       python_requires=">=2.6",
       zip_safe=False,
       )
@@ -19,9 +19,36 @@
 import os
 import unittest
 
+import pytest
+
 test_dir = os.path.dirname(os.path.abspath(__file__))
 
 
+@pytest.fixture
+def tables(monkeypatch):
+    """Tables for the tests, also set in the environment.
+
+    :return: tables type and path.
+    """
+    monkeypatch.setenv("BUFR_TABLES", os.path.join(test_dir, "bufrtables"))
+    monkeypatch.setenv("BUFR_TABLES_TYPE", "bufrdc")
+    return os.environ["BUFR_TABLES_TYPE"], os.environ["BUFR_TABLES"]
+
+
+def json_head(descr, subsets, compressed):
+    """Sections 0 to 3 of a BUFR Ed.4 as JSON object, see Bufr.encode_columns().
+
+    :param descr: descriptors of section 3.
+    :param subsets: number of subsets.
+    :param compressed: BUFR with compression.
+    :return: list of the sections 0 to 3.
+    """
+    return [["BUFR", 4],
+            [0, 78, 0, 0, False, 0, 0, 0, 13, 0, 2020, 1, 2, 3, 4, 0],
+            [],
+            [subsets, True, compressed, descr]]
+
+
 def test_bufr_read(monkeypatch):
     """Test reading data and data quality on Metop-A MHS BUFR file."""
     monkeypatch.setenv("BUFR_TABLES", os.path.join(test_dir, "bufrtables"))
@@ -66,5 +93,715 @@ def test_bufr_read(monkeypatch):
         break
 
 
+def test_bufr_encode_columns(tables):
+    """Test encoding from column arrays equals encoding from JSON."""
+    np = pytest.importorskip("numpy")
+    from trollbufr.bufr import Bufr
+    head = json_head(["001015", "005001", "006001",
+                      "101000", "031001", "012101"], 3, True)
+    json_data = [["ABC", 50.1, 8.5, [[273.15], [274.0]]],
+                 ["DEF", 51.0, None, [[None], [275.5]]],
+                 ["ABC", 52.25, 9.0, [[271.0], [270.0]]]]
+    columns = {0: np.array(["ABC", "DEF", "ABC"], dtype=object),
+               1: np.array([50.1, 51.0, 52.25]),
+               2: np.ma.masked_invalid([8.5, np.nan, 9.0]),
+               5: np.array([[273.15, 274.0], [np.nan, 275.5], [271.0, 270.0]])}
+    bufr = Bufr(*tables)
+    ref = bufr.encode(head + [json_data, ["7777"]])
+    bufr = Bufr(*tables)
+    assert bufr.encode_columns(head, columns) == ref
+    bufr = Bufr(*tables)
+    assert bufr.encode_columns(head, columns, loops={3: 2}) == ref
+
+
+def test_bufr_decode_columns(tables):
+    """Test decoding to column arrays, and back with encode_columns()."""
+    np = pytest.importorskip("numpy")
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    head = json_head(["001015", "005001", "006001",
+                      "101000", "031001", "012101"], 3, True)
+    json_data = [["ABC", 50.1, 8.5, [[273.15], [274.0]]],
+                 ["DEF", 51.0, None, [[None], [275.5]]],
+                 ["ABC", 52.25, 9.0, [[271.0], [270.0]]]]
+    bufr = Bufr(*tables)
+    bin_data = bufr.encode(head + [json_data, ["7777"]])
+    bufr.decode_meta(Blob(bin_data))
+    columns, loops = bufr.decode_columns()
+    assert loops == {3: 2}
+    assert sorted(columns) == [0, 1, 2, 5]
+    assert list(columns[0]) == ["ABC", "DEF", "ABC"]
+    assert columns[2].mask.tolist() == [False, True, False]
+    assert columns[5].shape == (3, 2)
+    assert np.ma.allclose(columns[5], [[273.15, 274.0], [0, 275.5], [271.0, 270.0]])
+    assert columns[5].mask[1, 0]
+    bufr = Bufr(*tables)
+    assert bufr.encode_columns(head, columns, loops) == bin_data
+
+
+def test_bufr_decode_as_array(tables):
+    """Test decode() with as_array=True, with repeated descriptors and
+    operator 221, and the round-trip through JSON text and encode()."""
+    np = pytest.importorskip("numpy")
+    import json
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    head = json_head(["012101", "221001", "005001", "012101",
+                      "101000", "031001", "012101"], 3, True)
+    bufr = Bufr(*tables)
+    bin_data = bufr.encode_columns(head, {
+        0: np.array([270.0, np.nan, 260.0]),
+        3: np.array([271.0, 272.5, np.nan]),
+        6: np.array([[273.15, 274.0], [np.nan, 275.5], [271.0, 270.0]])})
+    columns = bufr.decode(Blob(bin_data), as_array=True)[4]
+    # The data of 005001 at position 2 is not present.
+    assert sorted(columns) == [0, 3, 5, 6]
+    assert columns[0].tolist() == [270.0, None, 260.0]
+    assert columns[3].tolist() == [271.0, 272.5, None]
+    assert columns[5].tolist() == [2, 2, 2]
+    assert columns[6].shape == (3, 2)
+    assert columns[6].tolist() == [[273.15, 274.0], [None, 275.5], [271.0, 270.0]]
+    assert np.ma.allclose(columns[6], bufr.decode_columns()[0][6])
+    json_text = json.dumps(bufr.decode(Blob(bin_data), as_array=True),
+                           default=lambda obj: obj.tolist())
+    bufr = Bufr(*tables)
+    assert bufr.encode(json.loads(json_text)) == bin_data
+
+
+def test_bufr_decode_columns_dtype(tables):
+    """Test the dtype policies for column arrays."""
+    np = pytest.importorskip("numpy")
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    json_bufr = json_head(["001007", "005001", "012101"], 3, True) + [
+        [[3, 50.12345, 273.15], [4, -51.0, None], [None, 52.25, 250.02]],
+        ["7777"]]
+    bufr = Bufr(*tables)
+    bufr.decode_meta(Blob(bufr.encode(json_bufr)))
+    exact, _ = bufr.decode_columns()
+    assert [exact[i].dtype for i in range(3)] == [np.int64, np.float64, np.float64]
+    columns, _ = bufr.decode_columns(dtype="float32")
+    assert [columns[i].dtype for i in range(3)] == [np.int64, np.float32, np.float32]
+    columns, _ = bufr.decode_columns(dtype="compact")
+    # Code table (10 bit), latitude (25 bit, scale 5), temperature (16 bit, scale 2)
+    assert [columns[i].dtype for i in range(3)] == [np.uint16, np.float64, np.float32]
+    assert columns[0].tolist() == [3, 4, None]
+    assert np.round(columns[2].astype(float), 2).tolist() == exact[2].tolist()
+    # The dtype is given by Table B, values altered by an operator are exact.
+    from trollbufr.coder.bufr_types import AlterState, column_dtype
+    tab_b = bufr.get_tables().tab_b
+    assert column_dtype(tab_b[12101], None, "compact") == np.float32
+    assert column_dtype(tab_b[12101], AlterState(wnum=2), "compact") == np.float64
+    assert column_dtype(tab_b[7001], None, "float32") == np.int64
+    assert column_dtype(tab_b[7001], AlterState(scale=1), "float32") == np.float32
+    assert column_dtype(tab_b[1007], None, "exact") == np.int64
+
+
+def test_bufr_decode_columns_chunked(monkeypatch, tables):
+    """Test decoding column arrays in chunks of subsets."""
+    np = pytest.importorskip("numpy")
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    json_data = [["ABC", 50.0 + i, 8.5 if i % 3 else None, [[270.0 + i], [274.0]]]
+                 for i in range(7)]
+    for compress in (True, False):
+        json_bufr = json_head(["001015", "005001", "006001",
+                               "101000", "031001", "012101"], 7, compress) + [json_data, ["7777"]]
+        bufr = Bufr(*tables)
+        bufr.decode_meta(Blob(bufr.encode(json_bufr)))
+        columns, loops = bufr.decode_columns()
+        chunks = list(bufr.decode_columns_chunked(3))
+        assert [start for start, _, _ in chunks] == [0, 3, 6]
+        assert [len(c[0]) for _, c, _ in chunks] == [3, 3, 1]
+        assert all(l == loops for _, _, l in chunks)
+        for pos in (1, 2, 5):
+            joined = np.ma.concatenate([c[pos] for _, c, _ in chunks])
+            assert joined.tolist() == columns[pos].tolist()
+        # A subset takes 53 bytes: string reference, 2 floats, the count, 2
+        # floats replicated; with masks.
+        chunks = list(bufr.decode_columns_chunked(3, max_bytes=110))
+        assert [start for start, _, _ in chunks] == [0, 2, 4, 6]
+        assert np.ma.concatenate([c[5] for _, c, _ in chunks]).tolist() == columns[5].tolist()
+        assert [start for start, _, _ in bufr.decode_columns_chunked(3, max_bytes=1)] == list(range(7))
+    # The headers of the compressed value sets are read once, for all chunks.
+    from trollbufr.coder.bufr_types import ValueSetIndex
+    recorded = []
+    record_orig = ValueSetIndex.record
+
+    def record(self, *header):
+        recorded.append(header)
+        record_orig(self, *header)
+    monkeypatch.setattr(ValueSetIndex, "record", record)
+    json_bufr[3][2] = True
+    bufr.decode_meta(Blob(bufr.encode(json_bufr)))
+    assert len(list(bufr.decode_columns_chunked(2))) == 4
+    # 005001, 006001, 012101 twice
+    assert len(recorded) == 4
+
+
+def test_string_octets():
+    """Test reading strings as octets, byte-aligned or not."""
+    from trollbufr.coder.bdata import Blob
+    from trollbufr.coder.functions import octets2str
+    blob = Blob(b"AB\x01C\xff\xff" + b"\x0a\x4b")
+    assert octets2str(blob.read_octets(4)) == "ABC"
+    assert octets2str(blob.read_octets(2)) is None
+    blob.read_bits(4)
+    assert blob.read_octets(1) == b"\xa4"
+    assert blob.read_octets(0) == b""
+
+
+def test_bufr_decode_columns_linked(tables):
+    """Test quality and statistical values linked to their elements."""
+    pytest.importorskip("numpy")
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    # Positions: 012101 #3, 033007 #13, 224255 #19
+    desc = ["001007", "101000", "031002", "012101",
+            "222000", "236000", "101000", "031002", "031031",
+            "001031", "001032", "101000", "031001", "033007",
+            "224000", "237000", "008023", "101000", "031001", "224255"]
+    json_data = [[i, [[270.0 + i], [271.0], [272.0]],
+                  [[1], [1], [0], [1], [0]], 98, 5, [[90 + i], [80]],
+                  10, [[0.5 + i], [0.25]]]
+                 for i in range(2)]
+    for compress in (False, True):
+        json_bufr = json_head(desc, 2, compress) + [json_data, ["7777"]]
+        bufr = Bufr(*tables)
+        bufr.decode_meta(Blob(bufr.encode(json_bufr)))
+        columns, loops, linked = bufr.decode_columns(linked=True)
+        assert sorted(linked) == [13, 19]
+        assert list(linked[13]) == [3] and list(linked[19]) == [3]
+        assert linked[13][3].shape == columns[3].shape == (2, 3)
+        assert linked[13][3].tolist() == [[90, None, 80], [91, None, 80]]
+        assert linked[19][3].tolist() == [[0.5, None, 0.25], [1.5, None, 0.25]]
+
+
+def test_batch_decoder(tables, tmp_path):
+    """Test decoding BUFR with two templates into columns per template."""
+    pytest.importorskip("numpy")
+    from trollbufr.bufr import Bufr
+    from trollbufr.batch import BatchDecoder
+    from trollbufr.coder.bdata import Blob
+    bufr = Bufr(*tables)
+
+    def encode(desc, compress, data):
+        return Blob(bufr.encode(json_head(desc, len(data), compress) + [data, ["7777"]]))
+    desc_a = ["001015", "101000", "031001", "012101"]
+    desc_b = ["005001", "006001"]
+    batch = BatchDecoder(*tables)
+    batch.add(encode(desc_a, False, [["ABC", [[273.15], [274.0]]],
+                                     ["DEF", [[275.5]]]]))
+    batch.add(encode(desc_b, True, [[50.0, 8.5], [51.0, 9.0]]))
+    batch.add(encode(desc_a, True, [["GHI", [[270.0], [271.0], [272.0]]]]))
+    res_a, res_b = batch.results()
+    assert res_a.key[-1] == (1015, 101000, 31001, 12101)
+    assert res_a.origin.tolist() == [[0, 0], [0, 1], [2, 0]]
+    assert list(res_a.columns[0]) == ["ABC", "DEF", "GHI"]
+    assert res_a.loops[1].tolist() == [[2], [1], [3]]
+    assert res_a.columns[3].tolist() == [[273.15, 274.0, None],
+                                         [275.5, None, None],
+                                         [270.0, 271.0, 272.0]]
+    assert res_b.origin.tolist() == [[1, 0], [1, 1]]
+    assert res_b.columns[1].tolist() == [8.5, 9.0]
+    # A BUFR failing in the data section -- 5 subsets in section 3, data of
+    # 2 -- is dropped with the rows decoded already, and not counted.
+    good = encode(desc_a, False, [["ABC", [[273.15], [274.0]]], ["DEF", [[275.5]]]])
+    bad = bytearray(good.get_bytes())
+    bad[35] = 5
+    fn = str(tmp_path / "batch.bufr")
+    with open(fn, "wb") as fh:
+        fh.write(good.get_bytes() + bytes(bad)
+                 + encode(desc_a, True, [["GHI", [[270.0]]]]).get_bytes())
+    batch = BatchDecoder(*tables)
+    assert batch.add_file(fn) == batch.messages == 2
+    assert batch.inputs == 3
+    assert [e[:2] for e in batch.errors] == [(1, fn)]
+    res_a, = batch.results()
+    # The BUFR are numbered by input position.
+    assert res_a.origin.tolist() == [[0, 0], [0, 1], [2, 0]]
+    assert list(res_a.columns[0]) == ["ABC", "DEF", "GHI"]
+    assert res_a.columns[3].tolist() == [[273.15, 274.0], [275.5, None], [270.0, None]]
+
+
+def test_bufr_get_subset(tables):
+    """Test random access to subsets of an uncompressed BUFR."""
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    json_bufr = json_head(["001015", "005001", "006001",
+                           "101000", "031001", "012101"], 4, False) + [
+        [["ABC", 50.1, 8.5, [[273.15], [274.0]]],
+         ["DEF", 51.0, None, [[None]]],
+         ["GHI", -10.0, 170.0, []],
+         ["JKL", 52.25, 9.0, [[271.0], [270.0], [269.5]]]],
+        ["7777"]]
+    bufr = Bufr(*tables)
+    blob = Blob(bufr.encode(json_bufr))
+    bufr.decode_meta(blob)
+    sequential = [list(subset.next_data()) for subset in bufr.next_subset()]
+    offsets = bufr.subset_offsets()
+    assert len(offsets) == 4 and offsets == sorted(offsets)
+    for k in (3, 0, 2):
+        assert list(bufr.get_subset(k).next_data()) == sequential[k]
+    # Offsets stored for a new Bufr object.
+    bufr = Bufr(*tables)
+    blob.reset()
+    bufr.decode_meta(blob)
+    assert list(bufr.get_subset(1, offsets=offsets).next_data()) == sequential[1]
+
+
+def test_bufr_subset_filter(monkeypatch, tables):
+    """Test decoding only the subsets selected by a filter."""
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    from trollbufr.coder.bufr_types import SubsetFilter
+    from trollbufr.coder import functions
+    data = [[10, 384, 52.47, 13.4, 280.5],
+            [10, 637, 50.05, 8.6, None],
+            [6, 180, 55.63, 12.67, 275.0],
+            [10, 384, None, 13.4, 281.0]]
+    bufr = Bufr(*tables)
+    for compressed in (False, True):
+        json_bufr = json_head(["001001", "001002", "005001",
+                               "006001", "012101"], len(data), compressed) + [data, ["7777"]]
+        blob = Blob(bufr.encode(json_bufr))
+        bufr.decode_meta(blob)
+        subset_filter = SubsetFilter().stations([10384, 6180]).bbox(50, 60, 0, 15)
+        assert bufr.select_subsets(subset_filter) == [0, 2]
+        json_sel = bufr.decode_json(subset_filter=subset_filter)
+        assert json_sel[3][0] == 2
+        assert json_sel[4] == [data[0], data[2]]
+        if compressed:
+            # Section 4 as columns of the selected subsets
+            columns = bufr.decode_json(as_array=True, subset_filter=subset_filter)[4]
+            assert [columns[i].tolist() for i in sorted(columns)] == [list(v) for v in zip(*json_sel[4])]
+        else:
+            assert bufr.decode_json(as_array=True, subset_filter=subset_filter)[4] == json_sel[4]
+        assert [subset.subs_num[0] for subset in bufr.next_subset(subset_filter=[1, 3])] == [1, 3]
+        assert bufr.decode_json(subset_filter=SubsetFilter().stations([1]))[4] == []
+        compact = [subset.decode_subset_compact()
+                   for subset in bufr.next_subset(subset_filter=subset_filter)]
+        assert [[c.value[i] for i in range(len(c)) if c.mark[i] == 0]
+                for c in compact] == [data[0], data[2]]
+    # In array-mode the values of the subsets not selected are not converted.
+    conversions = []
+
+    def rval2num(tab_b_elem, alter, rval):
+        conversions.append(tab_b_elem.descr)
+        return rval2num_orig(tab_b_elem, alter, rval)
+    rval2num_orig = functions.rval2num
+    monkeypatch.setattr(functions, "rval2num", rval2num)
+    for subset in bufr.next_subset(True, subset_filter=subset_filter):
+        list(subset.next_data())
+    # Key values of all subsets, and all values of the subsets selected
+    assert len(conversions) == 4 * 4 + 2 * 5
+
+
+def test_decode_meta_lazy(tables):
+    """Test lazy decoding of the sections, equal to decoding all at once."""
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    json_bufr = [["BUFR", 4],
+                 [0, 78, 0, 0, True, 2, 0, 0, 13, 0, 2020, 1, 2, 3, 4, 5],
+                 ["0a", "ff"],
+                 [2, True, False, ["001015", "005001", "006001"]],
+                 [["ABC", 50.1, 8.5], ["DEF", 51.0, None]],
+                 ["7777"]]
+    bufr = Bufr(*tables)
+    blob = Blob(bufr.encode(json_bufr))
+    bufr = Bufr(*tables)
+    meta = dict(bufr.decode_meta(blob))
+    blob.reset()
+    lazy = Bufr(*tables)
+    lazy_meta = lazy.decode_meta(blob, lazy=True)
+    assert lazy_meta["cat"] == 2
+    assert lazy_meta["datetime"].second == 5
+    assert lazy._loaded_tables is None
+    assert lazy.subsets == 2 and not lazy.is_compressed
+    assert lazy_meta["sect2_data"] == ["0a", "ff"]
+    json_data = lazy.decode_json()
+    assert json_data[2] == ["0a", "ff"]
+    assert json_data == bufr.decode_json()
+    assert dict(lazy_meta) == meta
+
+
+def test_local_use_data(tables):
+    """Test local use data of sections 1 and 2, as hex strings and octets."""
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    bufr = Bufr(*tables)
+    for edition, sect1 in ((4, [0, 78, 0, 0, True, 2, 0, 0, 13, 0, 2020, 1, 2, 3, 4, 5]),
+                           (3, [0, 0, 78, 0, True, 2, 0, 13, 0, 2020, 1, 2, 3, 4, 0])):
+        json_bufr = [["BUFR", edition],
+                     sect1 + [["01", "a0", "7f"]],
+                     ["0a", "ff", "00"],
+                     [1, True, False, ["001015"]],
+                     [["ABC"]],
+                     ["7777"]]
+        bufr.decode_meta(Blob(bufr.encode(json_bufr)))
+        meta = bufr.get_meta()
+        # Rendered as hex strings only on access.
+        assert not dict.__contains__(meta, "sect2_data") and "sect2_data" in meta
+        assert meta["sect1_local_use"] == ["01", "a0", "7f"]
+        assert meta["sect2_data"][:3] == ["0a", "ff", "00"]
+        assert bytes(bufr.get_local_octets(1)) == b"\x01\xa0\x7f"
+        assert bytes(bufr.get_local_octets(2)) == bytes(bytearray.fromhex("".join(meta["sect2_data"])))
+        assert bufr.decode_json()[:3] == json_bufr[:3]
+    json_bufr[1] = sect1
+    json_bufr[2] = []
+    json_bufr[1][4] = False
+    bufr.decode_meta(Blob(bufr.encode(json_bufr)))
+    assert bufr.get_local_octets(1) is None and bufr.get_local_octets(2) is None
+
+
+def test_encode_jobs(tables, tmp_path):
+    """Test encoding JSON with --jobs gives the same output as one process."""
+    import argparse
+    import json
+    from trollbufr import bufr_main, load_file
+    msgs = []
+    for i in range(7):
+        msgs.append({"heading": "IUSN%02d EDZW 010203" % i if i % 3 else None,
+                     "bufr": [["BUFR", 4],
+                              [0, 78, 0, 0, False, 0, 0, 0, 13, 0, 2020, 1, 2, 3, 4, i],
+                              [],
+                              [i + 1, True, i % 2 == 1, ["001015", "005001", "012101"]],
+                              [["ST%03d" % k, 50.0 + k, 270.0 + i] for k in range(i + 1)],
+                              ["7777"]]})
+    fn_json = str(tmp_path / "msgs.json")
+    with open(fn_json, "w") as fh:
+        # White-space before the separators is valid JSON.
+        fh.write("[\n" + "\n ,\n".join(json.dumps(m, indent=1) for m in msgs) + "\n ]\n")
+    assert list(load_file.next_json(fn_json)) == msgs
+    # Elements split over the chunks read.
+    assert list(load_file.next_json(fn_json, chunk_size=7)) == msgs
+    fn_cut = str(tmp_path / "cut.json")
+    with open(fn_json) as fh_in, open(fn_cut, "w") as fh:
+        fh.write(fh_in.read()[:-20])
+    with pytest.raises(ValueError):
+        list(load_file.next_json(fn_cut, chunk_size=64))
+    out = []
+    for jobs in (1, 3):
+        args = argparse.Namespace(in_file=[fn_json], out_file=str(tmp_path / ("out%d.bin" % jobs)),
+                                  jobs=jobs, tables_type=tables[0],
+                                  tables_path=tables[1])
+        bufr_main.write_bufr(args)
+        with open(args.out_file, "rb") as fh:
+            out.append(fh.read())
+    assert out[0].count(b"7777") == 7
+    assert out[1] == out[0]
+
+
+def test_run_profile(monkeypatch, tables, tmp_path, capsys):
+    """Test the command-line options for profiling and the phase timing."""
+    import pstats
+    import sys
+    from trollbufr import bufr_main
+    # run() adds its arguments to sys.argv.
+    monkeypatch.setattr(sys, "argv", ["trollbufr"])
+    fn_prof = str(tmp_path / "decode.pstats")
+    assert bufr_main.run(["-j", "-a", "-t", tables[1], "-T", tables[0],
+                          "-o", str(tmp_path / "out.json"), "--profile", "tottime",
+                          "--profile-out", fn_prof,
+                          os.path.join(test_dir, "metop_mhs.bufr")]) == 0
+    assert pstats.Stats(fn_prof).total_calls > 0
+    err = capsys.readouterr().err
+    assert "tottime" in err
+    for phase in ("scan", "sections", "tables", "data", "output", "total"):
+        assert "\n%s " % phase in err
+    assert "BUFR: 4 " in err
+
+
+def test_bufr_template(tables):
+    """Test encoding with a template equals encoding from JSON."""
+    from trollbufr.bufr import Bufr
+    from trollbufr.template import BufrTemplate
+    json_bufr = json_head(["001015", "005001", "006001",
+                           "101000", "031001", "012101"], 2, False) + [
+        [["ABC", 50.1, 8.5, [[273.15], [274.0]]],
+         ["DEF", 51.0, None, [[None]]]],
+        ["7777"]]
+    template = BufrTemplate(tables[0], tables[1], json_bufr)
+    json_bufr[1][3] = 1
+    json_bufr[1][10:] = [2021, 12, 31, 23, 59, 30]
+    json_bufr[3][0] = 3
+    json_bufr[4].append(["GHI", -10.0, 170.0, []])
+    bufr = Bufr(*tables)
+    ref = bufr.encode(json_bufr)
+    assert template.key == BufrTemplate.head_key(json_bufr)
+    assert template.encode_json(json_bufr) == ref
+    assert template.encode(json_bufr[4], update=1,
+                           datetime=[2021, 12, 31, 23, 59, 30]) == ref
+
+
+def test_synthetic_roundtrip(tables):
+    """Test synthetic BUFR with all operators decode to the encoded values."""
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    from trollbufr.synthetic import SyntheticBufr, OPERATORS
+
+    def assert_same(a, b):
+        if isinstance(a, list):
+            assert len(a) == len(b)
+            for x, y in zip(a, b):
+                assert_same(x, y)
+        elif isinstance(a, float):
+            assert abs(a - b) < 1e-6 * max(1, abs(a))
+        elif isinstance(a, str):
+            assert a == b.rstrip()
+        else:
+            assert a == b
+
+    for compress in (True, False):
+        for edition in (3, 4):
+            synth = SyntheticBufr(*tables, subsets=5, compress=compress, depth=2,
+                                  operators=OPERATORS, edition=edition, seed=1)
+            json_bufr = synth.make_json(1)
+            assert synth.make_json(1) == json_bufr
+            bufr = Bufr(*tables)
+            json_dec = bufr.decode(Blob(synth.make_bufr(1)))
+            assert_same(json_bufr[4], json_dec[4])
+
+
+def test_decode_ed3_uncompressed(tables):
+    """Test uncompressed Ed.3 subsets are not aligned to octets, only the
+    end of section 4 is padded to an even number of octets.
+    """
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    # 26 bit per subset
+    data = [[i, 270.0 + i] for i in range(5)]
+    json_bufr = [["BUFR", 3],
+                 [0, 0, 78, 0, False, 0, 0, 13, 0, 2020, 1, 2, 3, 4, 0],
+                 [],
+                 [5, True, False, ["001007", "012101"]],
+                 data,
+                 ["7777"]]
+    bufr = Bufr(*tables)
+    assert bufr.decode(Blob(bufr.encode(json_bufr)))[4] == data
+    assert bufr.get_blob().p == bufr.get_meta()["data_end"]
+
+
+def test_cancel_bitmap(tables):
+    """Test decoding the cancel of a bitmap (237255)."""
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    desc = ["001007", "012101", "012101",
+            "222000", "236000", "101000", "031002", "031031",
+            "001031", "001032", "101000", "031001", "033007",
+            "237255", "001007"]
+    data = [[i, 270.0 + i, 271.0, [[0], [1]], 98, 5, [[90 + i]], 7] for i in range(2)]
+    bufr = Bufr(*tables)
+    for compress in (False, True):
+        json_bufr = json_head(desc, 2, compress) + [data, ["7777"]]
+        assert bufr.decode(Blob(bufr.encode(json_bufr)))[4] == data
+
+
+def test_decode_stats(tables):
+    """Test decoder statistics count the same values in all decode modes."""
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    from trollbufr.coder.bufr_types import DecodeStats
+    from trollbufr.synthetic import SyntheticBufr
+
+    total = DecodeStats()
+    for as_array in (False, True):
+        synth = SyntheticBufr(*tables, subsets=4, compress=True, missing=0.5, seed=1)
+        bufr = Bufr(*tables, stats=True)
+        for i in range(2):
+            bufr.decode(Blob(synth.make_bufr(i)), as_array=as_array)
+        assert bufr.stats.messages == 2
+        assert bufr.stats.subsets == 8
+        assert bufr.stats.cache_misses == 1 and bufr.stats.cache_hits == 1
+        assert 0 < bufr.stats.missing < bufr.stats.values
+        assert bufr.stats.bits > 0
+        total += bufr.stats
+    assert total.values == 2 * bufr.stats.values
+    total.reset()
+    assert total.as_dict()["values"] == 0
+    assert Bufr(*tables).stats is None
+
+
+def test_decode_compact(tables):
+    """Test compact decoding holds the same items as next_data()."""
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    from trollbufr.coder.bufr_types import MarkType
+    from trollbufr.synthetic import SyntheticBufr, OPERATORS
+
+    for compress in (True, False):
+        synth = SyntheticBufr(*tables, subsets=3, compress=compress,
+                              operators=OPERATORS, seed=2)
+        bufr = Bufr(*tables)
+        bufr.decode_meta(Blob(synth.make_bufr(0)))
+        compact = bufr.decode_compact()
+        entries = [e for subset in bufr.next_subset() for e in subset.next_data()]
+        marks = [e.mark for subset in bufr.next_subset(mark_objects=True)
+                 for e in subset.next_data()]
+        assert [str(m) if m is not None else None for m in marks] == [e.mark for e in entries]
+        assert len(compact) == len(entries)
+        assert len(compact.starts) == 3
+        for i, entry in enumerate(entries):
+            descr, mark, count, value, quality = compact[i]
+            assert compact.mark_str(i) == entry.mark
+            assert MarkType.parse(entry.mark)[0] == mark
+            assert value == entry.value and quality == entry.quality
+            if mark == MarkType.DATA:
+                assert descr == entry.descr
+
+
+def test_nested_replication_repetition(tables):
+    """Test nested delayed replication and repetition (031012) decode as
+    before the loop frames, with memory not growing with the iterations.
+    """
+    import tracemalloc
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+
+    def encode(n):
+        # The repeated data are given once per repetition, but written once.
+        json_bufr = json_head(["104000", "031002", "102000", "031001", "012101",
+                               "001007", "102000", "031012", "012101", "001007"], 1, False) + [
+            [[[[[[270.0 + i % 10 + k, 3] for k in range(i % 3)]] for i in range(n)],
+              [[280.5, 4]] * n]],
+            ["7777"]]
+        return bufr.encode(json_bufr)
+
+    def decode(bin_data):
+        bufr.decode_meta(Blob(bin_data))
+        subset = next(bufr.next_subset())
+        tracemalloc.start()
+        try:
+            count = sum(1 for _ in subset.next_data())
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return count, peak
+
+    bufr = Bufr(*tables)
+    bin_data = encode(3)
+    json_data = bufr.decode(Blob(bin_data))
+    assert json_data[4] == [[[[[]], [[[271.0, 3]]], [[[272.0, 3], [273.0, 3]]]], [[280.5, 4]]]]
+    bufr.decode_meta(Blob(bin_data))
+    entries = [tuple(entry) for entry in next(bufr.next_subset()).next_data()]
+    # Output of the decoder with one stack item per iteration.
+    assert entries == [
+        (None, "SUB", None, None), (None, "RPL 104000 *3", None, None),
+        (None, "RPL 1", None, None), (None, "RPL 102000 *0", None, None),
+        (None, "RPL NIL", None, None),
+        (None, "RPL 2", None, None), (None, "RPL 102000 *1", None, None),
+        (None, "RPL 1", None, None), (12101, None, 271.0, None), (1007, None, 3, None),
+        (None, "RPL END", None, None),
+        (None, "RPL 3", None, None), (None, "RPL 102000 *2", None, None),
+        (None, "RPL 1", None, None), (12101, None, 272.0, None), (1007, None, 3, None),
+        (None, "RPL 2", None, None), (12101, None, 273.0, None), (1007, None, 3, None),
+        (None, "RPL END", None, None), (None, "RPL END", None, None),
+        (None, "REP 102000 *3", None, None), (None, "REP 3", None, None),
+        (12101, None, 280.5, None), (1007, None, 4, None), (None, "REP END", None, None)]
+    count, peak = decode(encode(20))
+    count_long, peak_long = decode(encode(2000))
+    assert count_long > 50 * count
+    # With one stack item per iteration the peak grows by about 170 bytes
+    # per iteration.
+    assert peak_long < peak + 16384
+
+
+def test_replication_block_read(monkeypatch, tables):
+    """Test replications read as one block decode as value by value."""
+    pytest.importorskip("numpy")
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    from trollbufr.coder import functions
+
+    json_bufr = json_head(["001007", "102000", "031002", "005042", "012063"], 2, False) + [
+        [[224, [[ch, 200.0 + ch / 2.0] for ch in range(1, 41)]],
+         [None, [[ch, None if ch % 3 else 250.5] for ch in range(1, 21)]]],
+        ["7777"]]
+    bufr = Bufr(*tables)
+    bin_data = bufr.encode(json_bufr)
+
+    def decode():
+        bufr.decode_meta(Blob(bin_data))
+        return [e for subset in bufr.next_subset() for e in subset.next_data()]
+
+    entries = decode()
+    monkeypatch.setattr(functions, "np", None)
+    assert decode() == entries
+    bufr.decode_meta(Blob(bin_data))
+    assert bufr.decode_json()[4] == json_bufr[4]
+
+
+def test_bitmap_bulk_read():
+    """Test reading data present bitmaps at once, compressed or not."""
+    np = pytest.importorskip("numpy")
+    from trollbufr.coder.bdata import Blob
+    from trollbufr.coder.functions import bitmap2array
+    blob = Blob()
+    for bit in (0, 1, 1, 0):
+        blob.write_uint(bit, 1)
+    # Compressed: same bits in all subsets, then one differing bit
+    for min_val, cwidth, bits in ((0, 0, ()), (0, 1, (1, 0)), (1, 0, ())):
+        blob.write_uint(min_val, 1)
+        blob.write_uint(cwidth, 6)
+        for bit in bits:
+            blob.write_uint(bit, 1)
+    blob.write_align()
+    blob = Blob(blob.get_bytes())
+    assert bitmap2array(blob, 4, False, 1).tolist() == [False, True, True, False]
+    bitmap = bitmap2array(blob, 3, True, 2)
+    assert bitmap.dtype == np.bool_
+    assert bitmap.astype(int).tolist() == [[0, 1, 1], [0, 0, 1]]
+
+
+def test_ieee_float(monkeypatch, tables):
+    """Test IEEE floating point values (operator 209), in blocks and arrays."""
+    np = pytest.importorskip("numpy")
+    from trollbufr.bufr import Bufr
+    from trollbufr.coder.bdata import Blob
+    from trollbufr.coder import functions
+
+    for compress, ieee in ((False, "209064"), (True, "209032")):
+        json_bufr = json_head([ieee, "101000", "031002", "012101", "209000", "012101"],
+                              2, compress) + [
+            [[[[0.125 * ch] for ch in range(40)] + [[None]], 250.5],
+             [[[-0.5 * ch] for ch in range(40)] + [[None]], 260.25]],
+            ["7777"]]
+        bufr = Bufr(*tables)
+        bin_data = bufr.encode(json_bufr)
+
+        def decode():
+            bufr.decode_meta(Blob(bin_data))
+            return [e for subset in bufr.next_subset(compress) for e in subset.next_data()]
+
+        entries = decode()
+        monkeypatch.setattr(functions, "np", None)
+        assert decode() == entries
+        monkeypatch.setattr(functions, "np", np)
+        bufr.decode_meta(Blob(bin_data))
+        assert bufr.decode_json()[4] == json_bufr[4]
+
+
 if __name__ == "__main__":
     unittest.run()
+
+
+def test_alter_state():
+    """Test AlterState is immutable and interned, and recorded by reference."""
+    from trollbufr.coder.bufr_types import AlterState, BackrefRecord
+    default = AlterState()
+    with pytest.raises(AttributeError):
+        default.scale = 1
+    scaled = default.replace(scale=2)
+    assert scaled is AlterState(scale=2)
+    assert scaled is not default and default.scale == 0
+    assert scaled.replace(scale=0) is default
+    record = BackrefRecord()
+    record.append(12101, scaled)
+    record.append(12101, None)
+    assert record._backref_record[0][1] is scaled
+    assert record._backref_record[1][1] is default
+    # Clearing the interned objects keeps the default state.
+    for i in range(AlterState._INTERN_MAX_SIZE + 1):
+        AlterState(scale=i + 10)
+    assert AlterState() is default
+    assert AlterState(scale=2) is not scaled and AlterState(scale=2).scale == 2
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 trollbufr developers
+#
+# Author(s):
+#
+#   trollbufr developers
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+trollbufr.batch.BatchDecoder
+============================
+Decoder for many BUFR into one set of column arrays per template.
+
+BUFR with the same table versions and the same descriptors in section 3 are
+decoded with one expanded descriptor list, their values are collected into
+the same column arrays -- one row per subset. An origin index maps each row
+to the number of the BUFR and the subset in it.
+"""
+from collections import namedtuple
+from bitstring import ReadError
+from trollbufr.bufr import Bufr
+from trollbufr import load_file
+from trollbufr.coder.bufr_types import ColumnCollector
+from trollbufr.coder.errors import BufrDecodeError, BufrTableError
+try:
+    import numpy as np
+except ImportError:
+    np = None
+import logging
+
+logger = logging.getLogger("trollbufr")
+
+"""Decoded values of all BUFR with the same template.
+
+- key: (master, center, subcenter, mver, lver, descriptors).
+- descr_list: expanded descriptor list, the positions are keys to columns.
+- columns: dict {position: array}, one row per subset.
+- loops: dict {position: array} of the delayed replication counts, shape
+  (subsets, occurrences).
+- origin: array (subsets, 2), number of the BUFR (by input position, counting
+  from 0) and of the subset in it.
+"""
+BatchResult = namedtuple("BatchResult", ("key", "descr_list", "columns", "loops", "origin"))
+
+
+class BatchDecoder(object):
+    """Decodes BUFR, grouped by template, into column arrays."""
+
+    def __init__(self, tab_fmt, tab_path, table_cache=None, dtype="exact"):
+        """:param tab_fmt: format of tables.
+        :param tab_path: path to tables.
+        :param table_cache: TableCache to share, optional.
+        :param dtype: policy for the dtype of numeric arrays, see
+            Bufr.decode_columns().
+        """
+        if np is None:
+            raise BufrDecodeError("Batch decoding requires numpy.")
+        self._bufr = Bufr(tab_fmt, tab_path, table_cache=table_cache)
+        self._dtype = dtype
+        # {key: (collector, origin list)}, in order of first occurrence
+        self._groups = {}
+        self._keys = []
+        self.inputs = 0
+        """ Number of BUFR passed to add(), the number of a BUFR in origin."""
+        self.messages = 0
+        """ Number of BUFR added."""
+        self.errors = []
+        """ List of (number of the BUFR, source, error message) for the BUFR
+        failing to decode."""
+
+    @staticmethod
+    def template_key(meta, desc):
+        """Key identifying the template of a BUFR.
+
+        :param meta: meta-data, see Bufr.get_meta().
+        :param desc: descriptors from section 3.
+        :return: tuple (master, center, subcenter, mver, lver, descriptors).
+        """
+        return (meta["master"], meta["center"], meta["subcenter"],
+                meta["mver"], meta["lver"], tuple(desc))
+
+    def add(self, blob):
+        """Decode one BUFR and add its subsets to the group of its template.
+
+        The expanded descriptor list is evaluated once per template.
+        Each BUFR gets the next number, by input position, also if decoding
+        fails; then the rows of the BUFR are dropped, and it is not counted
+        in messages.
+
+        :param blob: Blob with one BUFR.
+        :return: key of the template.
+        :raise BufrDecodeError: error that stops decoding.
+        :raise BufrTableError: descriptor not in the tables.
+        """
+        bufr = self._bufr
+        number = self.inputs
+        self.inputs += 1
+        bufr.decode_meta(blob)
+        key = BatchDecoder.template_key(bufr.get_meta(), bufr._desc)
+        group = self._groups.get(key)
+        if group is None:
+            group = (ColumnCollector(bufr._column_plan(self._dtype), 0, ragged=True), [])
+        collector, origin = group
+        offset = collector.subsets
+        collector.subsets += bufr.subsets
+        try:
+            bufr._read_columns(collector, start=offset)
+        except Exception:
+            collector.truncate(offset)
+            raise
+        if key not in self._groups:
+            self._groups[key] = group
+            self._keys.append(key)
+        origin.extend((number, i) for i in range(bufr.subsets))
+        self.messages += 1
+        return key
+
+    def add_file(self, fn):
+        """Decode all BUFR in a file.
+
+        Errors are logged and recorded in errors, a BUFR failing to decode
+        is skipped.
+
+        :param fn: file name.
+        :return: number of BUFR added.
+        """
+        n = 0
+        for blob, size, header in load_file.next_bufr(fn):
+            try:
+                self.add(blob)
+                n += 1
+            except (BufrDecodeError, BufrTableError, ReadError) as e:
+                logger.error("%s: %s", header or fn, e)
+                self.errors.append((self.inputs - 1, header or fn, str(e)))
+        return n
+
+    def results(self):
+        """Column arrays per template, in order of first occurrence.
+
+        :return: list of BatchResult.
+        """
+        res = []
+        for key in self._keys:
+            collector, origin = self._groups[key]
+            res.append(BatchResult(key,
+                                   collector.plan.desc_list,
+                                   collector.columns(),
+                                   collector.loops(),
+                                   np.array(origin, dtype=np.int64).reshape(-1, 2)))
+        return res
@@ -37,15 +37,32 @@ from trollbufr.coder import bufr_sect as sect
 from trollbufr.coder.subset import SubsetReader, SubsetWriter
 from trollbufr.coder.bdata import Blob
 from trollbufr.coder.tables import TabBElem
+from trollbufr.coder.bufr_types import (DecodeStats, CompactSubset, ColumnCollector, ColumnPlan,
+                                        MarkType, SubsetFilter, ValueSetIndex)
 from trollbufr.coder.functions import (descr_is_data, descr_is_loop, descr_is_oper,
-                                       descr_is_seq, descr_is_nil, get_descr_list)
+                                       descr_is_seq, descr_is_nil, get_descr_list,
+                                       get_descr_extents)
 from trollbufr.coder.errors import (SUPPORTED_BUFR_EDITION, BufrDecodeError,
                                     BufrDecodeWarning, BufrTableError, BufrEncodeError)
+from timeit import default_timer
 import logging
 
 logger = logging.getLogger("trollbufr")
 
 
+def _sect3_property(name, doc):
+    """Property for an attribute from section 3, which is set on first access
+    after decode_meta(lazy=True)."""
+    def getter(self):
+        if self._lazy_sect3:
+            self._decode_lazy_sect3()
+        return getattr(self, name)
+
+    def setter(self, value):
+        setattr(self, name, value)
+    return property(getter, setter, doc=doc)
+
+
 class Bufr(object):
     """Holds and decodes a BUFR"""
     # Holds byte-array-like object with bufr
@@ -53,41 +70,101 @@ class Bufr(object):
     # Meta bin_data
     _meta = {}
     # Initial list of descr (from Sect3)
-    _desc = []
+    _descr = []
     # Start of bin_data
     _data_s = -1
     # End of bin_data
     _data_e = -1
+    # Bit offsets of the subsets in an uncompressed BUFR, see subset_offsets()
+    _subset_offsets = None
     # Path to tables
     _tab_p = None
     # Format of tables
     _tab_f = None
     # Holds table object
     _table_cache = None
-    _tables = None
+    _loaded_tables = None
     # Edition
     edition = 4
     # Number of subsets
-    subsets = -1
+    _subsets = -1
     # Compressed bin_data
-    is_compressed = False
+    _is_compressed = False
+    # After decode_meta(lazy=True): section 3 is decoded on first access,
+    # tables are loaded when decoding the data starts.
+    _lazy_sect3 = False
+    _lazy_tables = False
+    # Decoder statistics (DecodeStats), None if not collected
+    stats = None
 
-    def __init__(self, tab_fmt, tab_path, bin_data=None, json_obj=None):
+    def __init__(self, tab_fmt, tab_path, bin_data=None, json_obj=None, table_cache=None,
+                 stats=False):
+        """Create a BUFR object, optionally decode or encode a BUFR.
+
+        :param tab_fmt: format of tables.
+        :param tab_path: path to tables.
+        :param bin_data: Blob with BUFR to decode.
+        :param json_obj: JSON object to encode.
+        :param table_cache: TableCache to share between Bufr objects, optional.
+        :param stats: collect decoder statistics in attribute stats, if True
+            or a DecodeStats object (to sum up for several Bufr objects).
+        """
         self._tab_p = tab_path
         self._tab_f = tab_fmt
-        self._table_cache = TableCache(tab_path, tab_fmt)
+        if stats is True:
+            self.stats = DecodeStats()
+        elif stats:
+            self.stats = stats
+        if table_cache is None:
+            self._table_cache = TableCache(tab_path, tab_fmt)
+        else:
+            self._table_cache = table_cache
         if bin_data is not None:
             self._blob = bin_data
             self._meta = self.decode(bin_data)
         elif json_obj is not None:
             self._meta = self.encode(json_obj)
 
+    subsets = _sect3_property("_subsets", "Number of subsets.")
+    is_compressed = _sect3_property("_is_compressed", "BUFR uses compression.")
+    _desc = _sect3_property("_descr", "Descriptors from section 3.")
+
+    def _decode_lazy_sect3(self):
+        self._lazy_sect3 = False
+        self._subsets = self._meta["subsets"]
+        self._is_compressed = self._meta["comp"]
+        self._descr = self._meta["descr"]
+
+    def _get_tables(self):
+        if self._lazy_tables:
+            self._lazy_tables = False
+            self.load_tables()
+        return self._loaded_tables
+
+    def _set_tables(self, tables):
+        self._loaded_tables = tables
+
+    _tables = property(_get_tables, _set_tables)
+
     def get_tables(self):
         return self._tables
 
     def get_meta(self):
         return self._meta
 
+    def get_local_octets(self, sect_num=2):
+        """Data for local use as memoryview of the octets in the BUFR.
+
+        The meta-data holds the same data as list of hex strings, this
+        accessor returns them without a copy.
+
+        :param sect_num: 2 for the data of section 2, 1 for the local use
+            data of section 1.
+        :return: memoryview, None if the BUFR has no such data.
+        :raise BufrDecodeError: not a complete BUFR.
+        """
+        return sect.local_octets(self._blob.get_octets(), sect_num)
+
     def get_supported_edition(self):
         return SUPPORTED_BUFR_EDITION
 
@@ -140,14 +217,21 @@ class Bufr(object):
 
     def load_tables(self):
         """Load all tables referenced by the BUFR"""
-        if not len(self._meta):
+        if "master" not in self._meta:
             raise BufrTableError("No table loaded!")
+        if self.stats is not None:
+            t = default_timer()
+            hits, misses = self._table_cache.hits, self._table_cache.misses
         self._tables = self._table_cache.load(self._meta['master'],
                                               self._meta['center'],
                                               self._meta['subcenter'],
                                               self._meta['mver'],
                                               self._meta['lver'],
                                               )
+        if self.stats is not None:
+            self.stats.times["tables"] += default_timer() - t
+            self.stats.cache_hits += self._table_cache.hits - hits
+            self.stats.cache_misses += self._table_cache.misses - misses
         if self._tables is None:
             raise BufrTableError("No table loaded!")
         return self._tables
@@ -204,9 +288,9 @@ class Bufr(object):
             di += 1
         return desc_text
 
-    def next_subset_array(self):
+    def next_subset_array(self, mark_objects=False, select=None):
         logger.info("SUBSETS %d", self.subsets)
-        if self._blob.p >= self._data_e:
+        if self._blob.p >= self._data_e or select is not None and not select:
             #raise StopIteration # XXX:
             return
         # Create new Subset object
@@ -218,8 +302,13 @@ class Bufr(object):
                               self._data_e,
                               edition=self.edition,
                               has_backref=self._has_backref_oper,
-                              as_array=True)
+                              as_array=True,
+                              stats=self.stats,
+                              mark_objects=mark_objects,
+                              select=select)
+        bit_start = self._bitpos()
         yield subset
+        self._count_subsets(self.subsets if select is None else len(select), bit_start)
         # Padding bits (and to next even byte) for bin_data pointer if necessary
         if self.edition < 4:
             p = self._blob.p
@@ -230,9 +319,13 @@ class Bufr(object):
         #raise StopIteration # XXX:
         return
 
-    def next_subset_single(self):
+    def next_subset_single(self, mark_objects=False, subset_filter=None, select=None):
         subset = None
+        if select is not None:
+            select = set(select)
         for i in range(self.subsets):
+            if select is not None and self.is_compressed and i not in select:
+                continue
             logger.info("SUBSET #%d", i)
             if subset is not None and subset.inprogress:
                 raise BufrDecodeWarning("Subset decoding still in progress!")
@@ -241,6 +334,9 @@ class Bufr(object):
                 self._blob.reset(self._data_s)
             if self._blob.p >= self._data_e:
                 raise BufrDecodeError("Unexpected end of bin_data section!")
+            if not self.is_compressed and select is not None and i not in select:
+                self._skip_reader((i, self.subsets)).skip_subset()
+                continue
             # Create new Subset object
             subset = SubsetReader(self._tables,
                                   self._blob,
@@ -248,42 +344,81 @@ class Bufr(object):
                                   self.is_compressed,
                                   (i, self.subsets),
                                   self._data_e,
-                                  has_backref=self._has_backref_oper)
+                                  has_backref=self._has_backref_oper,
+                                  stats=self.stats,
+                                  mark_objects=mark_objects)
+            bit_start = self._bitpos()
+            if subset_filter is not None and not subset_filter(
+                    subset.read_keys(subset_filter.descriptors)):
+                # The values read are kept for next_data(), a subset not
+                # selected is skipped from the last key value on.
+                subset.skip_rest()
+                continue
             yield subset
-            i += 1
-            # Padding bits (and to next even byte) for bin_data pointer if necessary
-            if self.edition < 4:
-                p = self._blob.p
-                bc = self._blob.bc
-                self._blob.read_align(even=True)
-                logger.debug("Padding  p:%d  bc:%d  -->  p:%d",
-                             p, bc, self._blob.p)
+            self._count_subsets(1, bit_start)
         #raise StopIteration # XXX:
         return
 
-    def next_subset(self, as_array=False):
+    def _bitpos(self):
+        """Current bit position in the BUFR, if statistics are collected."""
+        if self.stats is None:
+            return 0
+        return self._blob.get_point() * 8 + self._blob.get_bitcons()
+
+    def _count_subsets(self, subsets, bit_start):
+        """Count decoded subsets and bits read since bit_start in statistics."""
+        if self.stats is not None:
+            self.stats.subsets += subsets
+            self.stats.bits += self._bitpos() - bit_start
+
+    def next_subset(self, as_array=False, mark_objects=False, subset_filter=None):
         """Iterator for subsets in Sect. 4
 
         .. IMPORTANT::
            allways consume all values from next_data() before retrieving the next report!
 
+        :param as_array: values of all subsets as list per descriptor,
+            for compressed BUFR only.
+        :param mark_objects: next_data() returns markers as DescrMark objects,
+            instead of strings.
+        :param subset_filter: SubsetFilter, or list of subset numbers as from
+            select_subsets(); only the selected subsets are decoded. In
+            array-mode the value lists hold the selected subsets only.
+
         :return: first/next subset object
         :rtype: read.Subset
         :raise BufrDecodeWarning: recoverable error.
         :raise BufrDecodeError: error that stops decoding.
         """
-        self._blob.reset(self._data_s)
+        select = None
+        if isinstance(subset_filter, SubsetFilter):
+            if self.is_compressed:
+                select = self.select_subsets(subset_filter)
+                subset_filter = None
+        elif subset_filter is not None:
+            select, subset_filter = subset_filter, None
+        if self.is_compressed and select is not None and not select:
+            logger.info("No subset selected")
+            return
         # Determine if descriptors need recording for back-reference operator
         self._desc_exp, self._has_backref_oper = get_descr_list(self._tables, self._desc)
+        for subset in self._next_subset(as_array, mark_objects, subset_filter, select):
+            yield subset
+
+    def _next_subset(self, as_array=False, mark_objects=False, subset_filter=None, select=None):
+        """Iterator for subsets in Sect. 4, see next_subset(); with
+        _has_backref_oper set already.
+        """
+        self._blob.reset(self._data_s)
         logger.info("BUFR START")
         if as_array:
-            for subset in self.next_subset_array():
+            for subset in self.next_subset_array(mark_objects, select):
                 yield subset
         else:
-            for subset in self.next_subset_single():
+            for subset in self.next_subset_single(mark_objects, subset_filter, select):
                 yield subset
-        # Padding bits after last subset
-        self._blob.read_align()
+        # Padding bits after last subset (and to next even byte if Ed.3)
+        self._blob.read_align(even=self.edition < 4)
         # Check if sect.5 is reached
         if self._blob.p != self._data_e:
             logger.warning("Data section did not end properly, %d <> %d",
@@ -292,20 +427,169 @@ class Bufr(object):
         #raise StopIteration # XXX:
         return
 
-    def decode_meta(self, bin_data, load_tables=True):
+    def subset_offsets(self):
+        """Bit offsets of the subsets' starts in the BUFR.
+
+        For uncompressed BUFR the subsets are walked once, reading only the
+        replication counts, bitmaps, etc. to follow the descriptors, the
+        elements' values are skipped. With compression all subsets start at
+        the beginning of the data section.
+
+        The offsets are kept for get_subset(), they can be stored and given to
+        get_subset() when reading the same BUFR again.
+
+        :return: list of bit offsets, one per subset.
+        :raise BufrDecodeError: error that stops decoding.
+        """
+        if self._subset_offsets is not None:
+            return self._subset_offsets
+        if self.is_compressed:
+            self._subset_offsets = [self._data_s * 8] * self.subsets
+            return self._subset_offsets
+        self._blob.reset(self._data_s)
+        _, self._has_backref_oper = get_descr_list(self._tables, self._desc)
+        offsets = []
+        for i in range(self.subsets):
+            if self._blob.p >= self._data_e:
+                raise BufrDecodeError("Unexpected end of bin_data section!")
+            offsets.append(self._blob.get_point() * 8 + self._blob.get_bitcons())
+            self._skip_reader((i, self.subsets)).skip_subset()
+        self._subset_offsets = offsets
+        return offsets
+
+    def _skip_reader(self, subset_num, keep=()):
+        """Subset reader skipping all values, except those of the descriptors
+        in keep. With compression it reads in array-mode.
+        """
+        return SubsetReader(self._tables,
+                            self._blob,
+                            self._desc,
+                            self.is_compressed,
+                            subset_num,
+                            self._data_e,
+                            edition=self.edition,
+                            has_backref=self._has_backref_oper,
+                            as_array=self.is_compressed,
+                            skip_values=True,
+                            keep=keep)
+
+    @staticmethod
+    def _key_values(subset):
+        """Values of the key descriptors, first occurrence in the subset.
+
+        :param subset: subset reader, created by _skip_reader().
+        :return: dict {descriptor: value}.
+        """
+        values = {}
+        keep = subset._keep
+        for entry in subset.next_data():
+            if entry.mark is None and entry.descr in keep and entry.descr not in values:
+                values[entry.descr] = entry.value
+        return values
+
+    def select_subsets(self, subset_filter):
+        """Numbers of the subsets selected by a filter.
+
+        Only the values of the filter's key descriptors are read, all other
+        values are skipped without conversion. With compression the key
+        values are read for all subsets at once.
+
+        The list can be given to next_subset() as subset_filter, to decode
+        the selected subsets without testing them again.
+
+        :param subset_filter: SubsetFilter.
+        :return: list of subset numbers, counting from 0.
+        :raise BufrDecodeError: error that stops decoding.
+        """
+        self._blob.reset(self._data_s)
+        _, self._has_backref_oper = get_descr_list(self._tables, self._desc)
+        keep = subset_filter.descriptors
+        if self.is_compressed:
+            values = Bufr._key_values(self._skip_reader((-1, self.subsets), keep))
+            return [i for i in range(self.subsets)
+                    if subset_filter(dict((d, v[i]) for d, v in values.items()))]
+        selected = []
+        for i in range(self.subsets):
+            if self._blob.p >= self._data_e:
+                raise BufrDecodeError("Unexpected end of bin_data section!")
+            if subset_filter(Bufr._key_values(self._skip_reader((i, self.subsets), keep))):
+                selected.append(i)
+        return selected
+
+    def get_subset(self, k, offsets=None, mark_objects=False):
+        """Subset number k, for decoding without the subsets before.
+
+        .. IMPORTANT::
+           consume the values from next_data() before getting another subset!
+
+        :param k: number of the subset, counting from 0.
+        :param offsets: bit offsets of the subsets, as from subset_offsets()
+            for this BUFR, default: determined with subset_offsets().
+        :param mark_objects: next_data() returns markers as DescrMark objects,
+            instead of strings.
+        :return: subset object
+        :raise BufrDecodeError: error that stops decoding.
+        """
+        if not 0 <= k < self.subsets:
+            raise BufrDecodeError("Subset #%d not in 0..%d" % (k, self.subsets - 1))
+        if offsets is None:
+            offsets = self.subset_offsets()
+        elif len(offsets) != self.subsets:
+            raise BufrDecodeError("%d offsets for %d subsets" % (len(offsets), self.subsets))
+        _, self._has_backref_oper = get_descr_list(self._tables, self._desc)
+        self._blob.reset(offsets[k] // 8)
+        self._blob.set_bitcons(offsets[k] % 8)
+        return SubsetReader(self._tables,
+                            self._blob,
+                            self._desc,
+                            self.is_compressed,
+                            (k, self.subsets),
+                            self._data_e,
+                            edition=self.edition,
+                            has_backref=self._has_backref_oper,
+                            stats=self.stats,
+                            mark_objects=mark_objects)
+
+    def decode_meta(self, bin_data, load_tables=True, lazy=False):
         """Decodes all meta-data of the BUFR.
 
         This function prepares the iterators for reading data.
 
+        With lazy=True only the section lengths are read. The sections 1 to 3
+        are decoded on first access of their values -- in the dict from
+        get_meta(), or the attributes subsets and is_compressed -- and the
+        tables are loaded when decoding the data starts.
+
         :param bin_data: Blob: data object with complete BUFR.
         :param load_tables: bool: automatically load load_tables.
+        :param lazy: decode sections and load tables on first use.
+        :return: dict with the meta-data.
         :raise BufrDecodeWarning: recoverable error.
         :raise BufrDecodeError: error that stops decoding.
         """
         if bin_data is None or not len(bin_data):
             raise BufrDecodeWarning("Data buffer is empty!")
         self._blob = bin_data
-        self._meta = {}
+        self._meta = sect.SectionMeta()
+        self._lazy_sect3 = self._lazy_tables = False
+        if self.stats is not None:
+            t = default_timer()
+            t_tables = self.stats.times["tables"]
+        if lazy:
+            octets = bin_data.get_octets()
+            meta, offsets = sect.index_sections(octets)
+            self.edition = meta["edition"]
+            meta.update(data_start=offsets[4] + 4, data_end=offsets[5])
+            self._meta = sect.SectionMeta(octets, offsets, meta)
+            self._data_s = offsets[4] + 4
+            self._data_e = offsets[5]
+            self._subset_offsets = None
+            self._lazy_sect3 = True
+            self._lazy_tables = load_tables
+            if self.stats is not None:
+                self.stats.messages += 1
+                self.stats.times["sections"] += default_timer() - t
+            return self._meta
         logger.info("SECT 0..5 DECODE")
         #
         # Section 0
@@ -353,6 +637,7 @@ class Bufr(object):
         logger.debug("SECT_4\t offs:%d len:%d = %s", o, l, r)
         self._data_s = r['data_start']
         self._data_e = r['data_end']
+        self._subset_offsets = None
         #
         # Section 5
         #
@@ -365,24 +650,61 @@ class Bufr(object):
         if self._meta['size'] != o:
             logger.error("size/offset error: size %d <> offset %d", self._meta['size'], o)
             raise BufrDecodeError("Size/offset error")
+        if self.stats is not None:
+            self.stats.messages += 1
+            self.stats.times["sections"] += (default_timer() - t
+                                             - (self.stats.times["tables"] - t_tables))
         if tables_fail is not None:
             raise tables_fail
         return self._meta
 
-    def decode(self, bin_data, load_tables=True, as_array=False):
+    def decode(self, bin_data, load_tables=True, as_array=False, subset_filter=None):
         """Decodes the BUFR into a JSON compatible data object.
 
         The created JSON compatible data object is a list of the BUFR sections,
         where each section itself is a list of the values, in the same order as
         stored in a BUFR.
+        With as_array=True the data section of a compressed BUFR is a dict of
+        numpy arrays instead, see decode_json().
 
         :param bin_data: Blob: data object with complete BUFR.
         :param load_tables: bool: automatically load load_tables.
-        :return: JSON object
+        :param as_array: data section as column arrays, for compressed BUFR,
+            see decode_json().
+        :param subset_filter: SubsetFilter, see decode_json().
+        :return: JSON object, or with as_array=True and compression a list
+            with the data section as dict {position: array}.
         :raise BufrDecodeWarning: recoverable error.
         :raise BufrDecodeError: error that stops decoding.
         """
         self.decode_meta(bin_data, load_tables)
+        return self.decode_json(as_array, subset_filter)
+
+    def decode_json(self, as_array=False, subset_filter=None):
+        """Decodes the data section into a JSON compatible data object.
+
+        The meta-data must be decoded and the tables loaded already,
+        see decode_meta().
+
+        With as_array=True the data section of a compressed BUFR is a dict
+        {position: array} of column arrays (numpy.ma, requires numpy), the same
+        as from decode_columns() with the counts of the delayed replications at
+        the positions of their replication factors. Replicated descriptors have
+        one more dimension per replication, i.e. the shape is (subsets,
+        iterations). This object is not JSON compatible: for json.dump() convert
+        the arrays with tolist(), e.g. default=lambda a: a.tolist(); encode()
+        takes both the arrays and the lists.
+
+        With a subset_filter only the selected subsets are decoded, the number
+        of subsets in section 3 is set accordingly.
+
+        :param as_array: data section as column arrays, for compressed BUFR.
+        :param subset_filter: SubsetFilter, see next_subset().
+        :return: JSON object, or with as_array=True and compression a list
+            with the data section as dict {position: numpy.ma array}.
+        :raise BufrDecodeWarning: recoverable error.
+        :raise BufrDecodeError: error that stops decoding.
+        """
         json_bufr = []
         #
         # Section 0
@@ -427,69 +749,243 @@ class Bufr(object):
         #
         # Section 4
         #
-        stack = []
         if as_array and self.is_compressed:
-            def hook_over():
-                xpar = stack[-self.subsets:]
-                del stack[-self.subsets:]
-                for s in range(-self.subsets, 0):
-                    stack[s].append(xpar[s])
-
-            def add_empty():
-                stack.extend([[] for _ in range(self.subsets)])
-
-            def add_value(value):
-                for s in range(-self.subsets, 0):
-                    stack[s].append(value[s])
-        else:
-            def hook_over():
-                xpar = stack.pop()
-                stack[-1].append(xpar)
+            if isinstance(subset_filter, SubsetFilter):
+                subset_filter = self.select_subsets(subset_filter)
+            collector = ColumnCollector(self._column_plan(), self.subsets
+                                        if subset_filter is None else len(subset_filter))
+            self._read_columns(collector, subset_filter)
+            sect_buf[0] = collector.subsets
+            json_bufr.append(collector.columns(counts=True))
+            json_bufr.append(["7777"])
+            return json_bufr
+        stack = []
+
+        def hook_over():
+            xpar = stack.pop()
+            stack[-1].append(xpar)
 
-            def add_empty():
-                stack.append([])
+        def add_empty():
+            stack.append([])
 
-            def add_value(value):
-                stack[-1].append(value)
+        def add_value(value):
+            stack[-1].append(value)
 
-        for report in self.next_subset(as_array and self.is_compressed):
+        reports = 0
+        for report in self.next_subset(mark_objects=True, subset_filter=subset_filter):
+            reports += 1
             add_empty()
             rpl_i = [0]
             for descr_entry in report.next_data():
                 if descr_entry.mark is not None:
-                    mark_el = descr_entry.mark.split(" ")
-                    if mark_el[0] in ("RPL", "REP"):
-                        if len(mark_el) == 3:
-                            # Replication starts
-                            add_empty()
-                            rpl_i.append(0)
-                        elif mark_el[1] == "END":
-                            # Replication ends
-                            hook_over()
-                            hook_over()
-                            rpl_i.pop()
-                        elif mark_el[1] == "NIL":
-                            # No iterations
+                    mark = descr_entry.mark.mark
+                    if mark == MarkType.RPL or mark == MarkType.REP:
+                        # Replication starts
+                        add_empty()
+                        rpl_i.append(0)
+                    elif mark == MarkType.RPL_ITER or mark == MarkType.REP_ITER:
+                        # For each iteration:
+                        if rpl_i[-1]:
                             hook_over()
-                            rpl_i.pop()
-                        else:
-                            # For each iteration:
-                            if rpl_i[-1]:
-                                hook_over()
-                            rpl_i[-1] += 1
-                            add_empty()
-                    elif descr_entry.mark == "BMP DEF":
-                        for s in range(-self.subsets if as_array else -1, 0):
-                            stack[s].append([[b] for b in descr_entry.value])
+                        rpl_i[-1] += 1
+                        add_empty()
+                    elif mark == MarkType.RPL_END or mark == MarkType.REP_END:
+                        # Replication ends
+                        hook_over()
+                        hook_over()
+                        rpl_i.pop()
+                    elif mark == MarkType.RPL_NIL or mark == MarkType.REP_NIL:
+                        # No iterations
+                        hook_over()
+                        rpl_i.pop()
+                    elif mark == MarkType.BMP_DEF:
+                        stack[-1].append([[b] for b in descr_entry.value])
                 else:
                     if (descr_entry.quality is not None
                             and not isinstance(descr_entry.quality, TabBElem)):
                         add_value(descr_entry.quality)
                     add_value(descr_entry.value)
+        if subset_filter is not None:
+            sect_buf[0] = reports
         json_bufr.append(stack)
         json_bufr.append(["7777"])
         return json_bufr
 
+    def decode_compact(self, as_array=False, result=None):
+        """Decodes the data section of all subsets into parallel arrays.
+
+        The meta-data must be decoded and the tables loaded already,
+        see decode_meta().
+
+        :param as_array: values of all subsets as list per descriptor,
+            for compressed BUFR only.
+        :param result: CompactSubset to append to, a new one if None.
+        :return: CompactSubset
+        :raise BufrDecodeWarning: recoverable error.
+        :raise BufrDecodeError: error that stops decoding.
+        """
+        if result is None:
+            result = CompactSubset()
+        for subset in self.next_subset(as_array):
+            subset.decode_subset_compact(result)
+        return result
+
+    def decode_columns(self, linked=False, dtype="exact"):
+        """Decodes the data section into column arrays (requires numpy).
+
+        The meta-data must be decoded and the tables loaded already,
+        see decode_meta().
+
+        This is the counterpart to encode_columns(): the values of all subsets
+        are returned per descriptor, in a dict {position: array}, where
+        position is the index of the descriptor in the expanded descriptor
+        list (see get_descr_full()). Replicated descriptors have one more
+        dimension per replication, i.e. the shape is (subsets, iterations).
+        The replication counts must be the same in all subsets, which is
+        always the case with compression.
+
+        Missing values are masked (numpy.ma), or None in arrays of strings.
+        Associated fields are not included.
+
+        Numeric arrays are int64 or float64 with dtype="exact". With
+        dtype="float32" non-integer values are float32, with dtype="compact"
+        each array gets the smallest dtype fitting the element's width, scale,
+        and reference value, see bufr_types.column_dtype().
+
+        With linked=True, quality information (222000) and statistical values
+        (224000, 225000) are also returned linked to the elements they refer
+        to by the data present bitmap: for the position of such a value, a
+        dict with the position of each element referred to, and an array of
+        the same shape as the element's column array.
+
+        :param linked: also return values linked by a bitmap.
+        :param dtype: policy for the dtype of numeric arrays,
+            "exact", "float32", or "compact".
+        :return: dict {position: array}, dict {position: count} of the
+            delayed replications, and if linked=True
+            dict {position: {referred position: array}}.
+        :raise BufrDecodeWarning: recoverable error.
+        :raise BufrDecodeError: error that stops decoding.
+        """
+        collector = ColumnCollector(self._column_plan(dtype), self.subsets)
+        self._read_columns(collector)
+        if linked:
+            return collector.columns(), collector.loops(), collector.linked()
+        return collector.columns(), collector.loops()
+
+    def _column_plan(self, dtype="exact"):
+        """ColumnPlan for the descriptors of this BUFR."""
+        dl, has_backref = get_descr_list(self._tables, self._desc)
+        return ColumnPlan(dl, get_descr_extents(self._tables, dl), self._tables.tab_b, dtype,
+                          has_backref)
+
+    def _read_columns(self, collector, select=None, start=0):
+        """Decode the subsets into the collector's column arrays.
+
+        The descriptors are taken from the collector's plan, which has to be
+        made for the same template, see _column_plan().
+
+        :param select: list of subset numbers to decode, default all.
+        :param start: row in the collector for the first subset.
+        """
+        self._has_backref_oper = collector.plan.has_backref
+        if self.is_compressed:
+            if select is not None and not select:
+                return
+            rows = slice(start, start + (self.subsets if select is None else len(select)))
+            for subset in self._next_subset(True, select=select):
+                subset.read_columns(collector, rows)
+            return
+        for row, subset in enumerate(self._next_subset(select=select), start):
+            subset.read_columns(collector, row)
+
+    def decode_columns_chunked(self, chunk_size, linked=False, dtype="exact", max_bytes=None):
+        """Decodes the data section into column arrays, in chunks of subsets.
+
+        The same as decode_columns(), but the arrays hold at most chunk_size
+        subsets, so the memory required is limited by the chunk size instead
+        of the number of subsets in the BUFR.
+        With max_bytes the size of the arrays per chunk is limited as well,
+        about the data and mask of all arrays (strings counted by reference).
+
+        With compression, the headers of all value sets are read once into an
+        index, before the first chunk; for each chunk only the part of each
+        value set for the subsets in the chunk is read.
+
+        :param chunk_size: max. number of subsets per chunk.
+        :param linked: also return values linked by a bitmap.
+        :param dtype: policy for the dtype of numeric arrays.
+        :param max_bytes: max. size of the arrays per chunk, at least one
+            subset per chunk.
+        :yield: tuple (number of first subset, columns, loops) and linked if
+            linked=True, see decode_columns().
+        :raise BufrDecodeWarning: recoverable error.
+        :raise BufrDecodeError: error that stops decoding.
+        """
+        if chunk_size < 1:
+            raise BufrDecodeError("Chunk size %d < 1" % chunk_size)
+        plan = self._column_plan(dtype)
+        self._has_backref_oper = plan.has_backref
+
+        def chunk(start, collector):
+            if linked:
+                return start, collector.columns(), collector.loops(), collector.linked()
+            return start, collector.columns(), collector.loops()
+
+        if self.is_compressed:
+            index = ValueSetIndex()
+
+            def read_chunk(start, stop, stats):
+                # Each chunk starts with the value sets of the first descriptor.
+                self._blob.reset(self._data_s)
+                subset = SubsetReader(self._tables,
+                                      self._blob,
+                                      self._desc,
+                                      self.is_compressed,
+                                      (-1, self.subsets),
+                                      self._data_e,
+                                      edition=self.edition,
+                                      has_backref=self._has_backref_oper,
+                                      as_array=True,
+                                      stats=stats,
+                                      rows=(start, stop),
+                                      index=index)
+                collector = ColumnCollector(plan, stop - start)
+                subset.read_columns(collector)
+                index.rewind()
+                return collector
+
+            # Pre-pass with the first subset only, recording the headers of the
+            # value sets (the replication counts are values of the subsets).
+            collector = read_chunk(0, min(1, self.subsets), None)
+            if max_bytes is not None:
+                chunk_size = min(chunk_size, max(1, max_bytes // max(1, collector.row_nbytes())))
+            for start in range(0, self.subsets, chunk_size):
+                stop = min(start + chunk_size, self.subsets)
+                collector = read_chunk(start, stop, self.stats)
+                if self.stats is not None:
+                    self.stats.subsets += stop - start
+                yield chunk(start, collector)
+            return
+        collector = None
+        for subset in self.next_subset():
+            i = subset.subs_num[0]
+            if collector is None:
+                start = i
+                if max_bytes is None:
+                    collector = ColumnCollector(plan, min(chunk_size, self.subsets - i))
+                else:
+                    # The arrays grow with the subsets, up to max_bytes.
+                    collector = ColumnCollector(plan, 0)
+            if max_bytes is not None:
+                collector.subsets += 1
+            subset.read_columns(collector, i - start)
+            if (i - start + 1 == min(chunk_size, self.subsets - start)
+                    or max_bytes is not None
+                    and (collector.subsets + 1) * collector.row_nbytes() > max_bytes):
+                yield chunk(start, collector)
+                collector = None
+
     def encode(self, json_data, load_tables=True):
         """Encodes the JSON object as BUFR.
 
@@ -499,6 +995,10 @@ class Bufr(object):
         logical structure of a BUFR, where each section itself is a list of
         values in the same order as in a BUFR.
 
+        The data section is either a list of subsets, or a dict with column
+        arrays per descriptor position as returned by decode_json() with
+        as_array=True, see encode_columns().
+
         :param json_data: JSON object.
         :param load_tables: automatically load tables
         :return: BUFR, a byte array object
@@ -507,8 +1007,56 @@ class Bufr(object):
         """
         if len(json_data) != 6:
             raise BufrEncodeError("JSON data has %d sections (not 6)." % len(json_data))
-        sect_start = [0] * 6
+        if isinstance(json_data[4], dict):
+            # Keys are strings after a JSON dump.
+            columns = dict((int(k), v) for k, v in json_data[4].items())
+            return self.encode_columns(json_data[:4], columns, load_tables=load_tables)
+        bin_data = Blob()
+        sect_start = self._encode_head(bin_data, json_data, load_tables)
+        subset_writer = self._encode_sect4(bin_data, sect_start)
+        subset_writer.process(json_data[4])
+        return self._encode_tail(bin_data, sect_start)
+
+    def encode_columns(self, json_head, columns, loops=None, load_tables=True):
+        """Encodes a compressed BUFR with its data taken from column arrays.
+
+        The sections 0 to 3 are set by json_head, with the same structure as
+        the first four sections of the JSON object for encode(). Compression
+        must be set in section 3.
+
+        The data section is encoded from columns, a dict {position: array}.
+        The position is the index of a descriptor in the expanded descriptor
+        list, the same as in get_descr_full(). Each array holds the values of
+        all subsets, replicated descriptors have one more dimension per
+        replication, i.e. (subsets, iterations).
+
+        The count for a delayed replication is either set in loops
+        {position: count}, or taken from the shape of the replicated arrays.
+
+        :param json_head: JSON object with sections 0 to 3.
+        :param columns: dict {position: array}.
+        :param loops: dict {position: count}, optional.
+        :param load_tables: automatically load tables
+        :return: BUFR, a byte array object
+        :raise BufrEncodeError: error that stops encoding.
+        """
+        if len(json_head) < 4:
+            raise BufrEncodeError("JSON data has %d sections (not 4)." % len(json_head))
         bin_data = Blob()
+        sect_start = self._encode_head(bin_data, json_head, load_tables)
+        if not self.is_compressed:
+            raise BufrEncodeError("Column encoding requires compression.")
+        subset_writer = self._encode_sect4(bin_data, sect_start)
+        subset_writer.process_columns(columns, loops)
+        return self._encode_tail(bin_data, sect_start)
+
+    def _encode_head(self, bin_data, json_data, load_tables=True):
+        """Encodes sections 0 to 3 from the JSON object.
+
+        :return: list with start offsets of the sections.
+        """
+        sect_start = [0] * 6
+        self._lazy_sect3 = self._lazy_tables = False
         #
         # Section 0
         #
@@ -553,28 +1101,41 @@ class Bufr(object):
         self.is_compressed = sect_meta['comp']
         self._desc = sect_meta['descr']
         # Determine if descriptors need recording for back-reference operator
-        _, has_backref_oper = get_descr_list(self._tables, self._desc)
+        _, self._has_backref_oper = get_descr_list(self._tables, self._desc)
+        return sect_start
+
+    def _encode_sect4(self, bin_data, sect_start):
+        """Encodes the head of section 4.
+
+        :return: SubsetWriter for the data.
+        """
         #
         # Section 4
         #
-        sect_i += 1
+        sect_i = 4
         subset_writer = SubsetWriter(self._tables,
                                      bin_data,
                                      self._desc,
                                      self.is_compressed,
                                      self.subsets,
                                      edition=self.edition,
-                                     has_backref=has_backref_oper)
+                                     has_backref=self._has_backref_oper)
         sect_start[sect_i] = sect.encode_sect4(bin_data,
                                                self.edition)
         logger.debug("SECT %d start:%d", sect_i, sect_start[sect_i])
-        subset_writer.process(json_data[sect_i])
+        return subset_writer
+
+    def _encode_tail(self, bin_data, sect_start):
+        """Encodes section 5 after the data section, and sets the sizes.
+
+        :return: BUFR, a byte array object
+        """
         # Pad last octet if needed, align to even octet number if Ed.3
         bin_data.write_align(self.edition == 3)
         #
         # Section 5
         #
-        sect_i += 1
+        sect_i = 5
         sect_start[sect_i] = sect.encode_sect5(bin_data)
         logger.debug("SECT %d start:%d", sect_i, sect_start[sect_i])
         #
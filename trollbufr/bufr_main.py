@@ -32,9 +32,11 @@ from __future__ import absolute_import
 
 import sys
 import os
+from timeit import default_timer
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 from trollbufr.version import version
 from trollbufr.bufr import Bufr
+from trollbufr.template import BufrTemplate
 from trollbufr.coder.bufr_types import TabBType
 from trollbufr import load_file
 from trollbufr.coder import load_tables
@@ -42,14 +44,87 @@ from trollbufr.coder import load_tables
 import logging
 logger = logging.getLogger("trollbufr")
 
+# Max. number of encoder templates kept while encoding.
+TEMPLATE_CACHE_MAX_SIZE = 100
+# Number of lines printed from profile statistics.
+PROFILE_STATS_LINES = 40
 
-def read_bufr_data(args):
+
+class PhaseTimer(object):
+    """Sums up the time spent in the processing phases, with counts of BUFR
+    and subsets.
+
+    Time not spent in any of the timed phases is attributed to "output".
+    If not enabled, all methods do nothing.
+    """
+    PHASES = ("scan", "sections", "tables", "data", "output")
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.times = dict((k, 0.0) for k in PhaseTimer.PHASES)
+        self.messages = 0
+        self.subsets = 0
+        self._start = default_timer()
+
+    def start(self):
+        """:return: start time for a phase."""
+        if not self.enabled:
+            return 0
+        return default_timer()
+
+    def stop(self, phase, start):
+        """Add time since start to phase."""
+        if self.enabled:
+            self.times[phase] += default_timer() - start
+
+    def count(self, subsets):
+        """Count one BUFR with its subsets."""
+        self.messages += 1
+        self.subsets += subsets
+
+    def iter(self, phase, iterable):
+        """Iterate over iterable, adding the time for each item to phase."""
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(phase, iterable)
+
+    def _timed_iter(self, phase, iterable):
+        it = iter(iterable)
+        while True:
+            t = default_timer()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.times[phase] += default_timer() - t
+                return
+            self.times[phase] += default_timer() - t
+            yield item
+
+    def summary(self):
+        """:return: multi-line string with time per phase and throughput."""
+        total = default_timer() - self._start
+        self.times["output"] = max(0.0, total - sum(self.times[k] for k in PhaseTimer.PHASES
+                                                    if k != "output"))
+        s = ["%-10s %10s %7s" % ("PHASE", "TIME[s]", "%")]
+        for k in PhaseTimer.PHASES:
+            s.append("%-10s %10.4f %6.1f%%" % (k, self.times[k],
+                                                100.0 * self.times[k] / total if total else 0.0))
+        s.append("%-10s %10.4f" % ("total", total))
+        s.append("BUFR: %d (%.1f/s)  SUBSETS: %d (%.1f/s)" % (
+            self.messages, self.messages / total if total else 0.0,
+            self.subsets, self.subsets / total if total else 0.0))
+        return "\n".join(s)
+
+
+def read_bufr_data(args, timer=None):
     """Read BUFR(s), decode data section and write to file-handle.
 
     Depending on command argument "--array", either process the subsets in
     sequence, which is ideal for un-compressed BUFR, or process each descriptor
     per all subsets at once, which improves performance for compressed BUFR.
     """
+    if timer is None:
+        timer = PhaseTimer(False)
     try:
         fh_out = open(args.out_file, "w")
     except:
@@ -58,7 +133,7 @@ def read_bufr_data(args):
     for fn_in in args.in_file:
         print("FILE\t%s" % os.path.basename(fn_in), file=fh_out)
         i = 0
-        for blob, size, header in load_file.next_bufr(fn_in):
+        for blob, size, header in timer.iter("scan", load_file.next_bufr(fn_in)):
             if args.bulletin is not None and i != args.bulletin:
                 i += 1
                 continue
@@ -66,13 +141,20 @@ def read_bufr_data(args):
             i += 1
             print("HEADER\t%s" % header, file=fh_out)
             try:
+                t = timer.start()
                 bufr.decode_meta(blob, load_tables=False)
+                timer.stop("sections", t)
+                t = timer.start()
                 tabl = bufr.load_tables()
+                timer.stop("tables", t)
+                timer.count(bufr.subsets)
                 print("META:\n%s" % bufr.get_meta_str(), file=fh_out)
-                for report in bufr.next_subset(args.array and bufr.is_compressed):
+                for report in timer.iter("data",
+                                         bufr.next_subset(args.array and bufr.is_compressed,
+                                                          mark_objects=True)):
                     print("SUBSET\t#%d/%d" % report.subs_num, file=fh_out)
                     if args.sparse or (args.array and bufr.is_compressed):
-                        for descr_entry in report.next_data():
+                        for descr_entry in timer.iter("data", report.next_data()):
                             if descr_entry.mark is not None:
                                 if isinstance(descr_entry.value, (list)):
                                     descr_value = "".join([str(x) for x
@@ -95,7 +177,7 @@ def read_bufr_data(args):
                                 print("%06d: %s" % (descr_entry.descr,
                                                     str(descr_entry.value)), file=fh_out)
                     else:
-                        for descr_entry in report.next_data():
+                        for descr_entry in timer.iter("data", report.next_data()):
                             if descr_entry.mark is not None:
                                 if isinstance(descr_entry.value, (list)):
                                     descr_value = "".join([str(x) for x
@@ -152,14 +234,16 @@ def read_bufr_data(args):
         fh_out.close()
 
 
-def read_bufr_to_json(args):
+def read_bufr_to_json(args, timer=None):
     """Read and decode BUFR, write as JSON formatted file.
     """
+    if timer is None:
+        timer = PhaseTimer(False)
     bufr = Bufr(args.tables_type, args.tables_path)
     json_data = []
     bufr_i = -1
     for fn_in in args.in_file:
-        for blob, _, header in load_file.next_bufr(fn_in):
+        for blob, _, header in timer.iter("scan", load_file.next_bufr(fn_in)):
             bufr_i += 1
             if args.bulletin is not None and bufr_i != args.bulletin:
                 continue
@@ -171,9 +255,16 @@ def read_bufr_to_json(args):
                               "bufr": None,
                               }
             try:
-                json_bufr = bufr.decode(blob,
-                                        load_tables=True,
-                                        as_array=args.array)
+                t = timer.start()
+                bufr.decode_meta(blob, load_tables=False)
+                timer.stop("sections", t)
+                t = timer.start()
+                bufr.load_tables()
+                timer.stop("tables", t)
+                timer.count(bufr.subsets)
+                t = timer.start()
+                json_bufr = bufr.decode_json(as_array=args.array)
+                timer.stop("data", t)
             except Exception as e:
                 logger.error(e, exc_info=1 and logger.isEnabledFor(logging.DEBUG))
                 json_data_item["error"] = str(e)
@@ -183,17 +274,25 @@ def read_bufr_to_json(args):
             finally:
                 json_data.append(json_data_item)
     import json
+
+    def to_list(obj):
+        """Column arrays (numpy) as lists, masked values as None."""
+        if hasattr(obj, "tolist"):
+            return obj.tolist()
+        raise TypeError("%r is not JSON serializable" % obj)
     out_fh = open(args.out_file, "w") or sys.stdout
     with out_fh as fh_out:
         if args.sparse:
-            json.dump(json_data, fh_out)
+            json.dump(json_data, fh_out, default=to_list)
         else:
-            json.dump(json_data, fh_out, indent=3, separators=(',', ': '))
+            json.dump(json_data, fh_out, indent=3, separators=(',', ': '), default=to_list)
 
 
-def read_bufr_desc(args):
+def read_bufr_desc(args, timer=None):
     """Read BUFR(s), decode meta-data and descriptor list, write to file-handle.
     """
+    if timer is None:
+        timer = PhaseTimer(False)
     try:
         fh_out = open(args.out_file, "w")
     except:
@@ -201,7 +300,7 @@ def read_bufr_desc(args):
     for fn_in in args.in_file:
         print("FILE\t%s" % os.path.basename(fn_in), file=fh_out)
         i = 0
-        for blob, size, header in load_file.next_bufr(fn_in):
+        for blob, size, header in timer.iter("scan", load_file.next_bufr(fn_in)):
             if args.bulletin is not None and i != args.bulletin:
                 i += 1
                 continue
@@ -210,7 +309,14 @@ def read_bufr_desc(args):
             print("HEADER\t%s" % header, file=fh_out)
             try:
                 bufr = Bufr(args.tables_type, args.tables_path)
-                bufr.decode_meta(blob, load_tables=(not args.sparse))
+                t = timer.start()
+                bufr.decode_meta(blob, load_tables=False)
+                timer.stop("sections", t)
+                if not args.sparse:
+                    t = timer.start()
+                    bufr.load_tables()
+                    timer.stop("tables", t)
+                timer.count(bufr.subsets)
                 print("META\n%s" % bufr.get_meta_str(), file=fh_out)
                 if args.sparse:
                     d = bufr.get_descr_short()
@@ -225,32 +331,104 @@ def read_bufr_desc(args):
         fh_out.close()
 
 
-def write_bufr(args):
+def write_bufr(args, timer=None):
     """Read JSON file, encode as BUFR and write to file-handle.
+
+    With "--jobs N", N worker processes encode the BUFR, the order of the
+    output is the same as the order in the JSON file(s).
+
+    For the phase timing, reading JSON counts as "scan", encoding as "data".
     """
-    import json
+    if timer is None:
+        timer = PhaseTimer(False)
     try:
         fh_out = open(args.out_file, "wb")
     except:
         fh_out = sys.stdout
     multi_bul = False
-    for fn_in in args.in_file:
-        with open(fn_in, "r") as fh_in:
-            json_data = json.load(fh_in)
-        for json_data_msg in json_data:
-            if not "bufr" in json_data_msg or json_data_msg["bufr"] is None:
-                continue
-            bufr = Bufr(tab_fmt=args.tables_type,
-                        tab_path=args.tables_path)
-            bin_data = bufr.encode(json_data_msg["bufr"],
-                                   load_tables=True)
-            if json_data_msg["heading"] is not None:
+
+    def next_json_msg():
+        for fn_in in args.in_file:
+            for json_data_msg in timer.iter("scan", load_file.next_json(fn_in)):
+                if "bufr" in json_data_msg and json_data_msg["bufr"] is not None:
+                    timer.count(json_data_msg["bufr"][3][0])
+                    yield json_data_msg
+
+    json_msgs = next_json_msg()
+    pool = None
+    if args.jobs and args.jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(args.jobs,
+                                    initializer=_encode_worker_init,
+                                    initargs=(args.tables_type, args.tables_path))
+        # Time waiting for the workers counts as "data".
+        encoded = timer.iter("data", pool.imap(_encode_worker, json_msgs, chunksize=4))
+    else:
+        encoder = BufrEncoder(args.tables_type, args.tables_path)
+
+        def encode(json_data_msg):
+            t = timer.start()
+            r = encoder(json_data_msg)
+            timer.stop("data", t)
+            return r
+
+        encoded = (encode(json_data_msg) for json_data_msg in json_msgs)
+    try:
+        for heading, bin_data in encoded:
+            if heading is not None:
                 multi_bul and fh_out.write(b"\r\r\n\r\r\n")
-                fh_out.write(("%s\r\r\n" % json_data_msg["heading"]).encode())
+                fh_out.write(("%s\r\r\n" % heading).encode())
             fh_out.write(bin_data)
             multi_bul = True
-    if fh_out is not sys.stdout:
-        fh_out.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if fh_out is not sys.stdout:
+            fh_out.close()
+
+
+class BufrEncoder(object):
+    """Encodes BUFR-JSON objects, keeping encoder templates and tables."""
+
+    def __init__(self, tab_fmt, tab_path):
+        self._tab_fmt = tab_fmt
+        self._tab_path = tab_path
+        # Encoder templates, for all BUFR with same sections 0-3.
+        self._table_cache = load_tables.TableCache(tab_path, tab_fmt)
+        self._templates = {}
+
+    def __call__(self, json_data_msg):
+        """Encode one BUFR.
+
+        :param json_data_msg: dict with keys "bufr" and "heading".
+        :return: heading, BUFR byte array
+        """
+        key = BufrTemplate.head_key(json_data_msg["bufr"])
+        if key not in self._templates:
+            if len(self._templates) >= TEMPLATE_CACHE_MAX_SIZE:
+                self._templates.clear()
+            self._templates[key] = BufrTemplate(self._tab_fmt,
+                                                self._tab_path,
+                                                json_data_msg["bufr"],
+                                                table_cache=self._table_cache)
+        bin_data = self._templates[key].encode_json(json_data_msg["bufr"])
+        return json_data_msg["heading"], bin_data
+
+
+"""Encoder of a worker process, with tables loaded once per worker."""
+_worker_encoder = None
+
+
+def _encode_worker_init(tab_fmt, tab_path):
+    global _worker_encoder
+    _worker_encoder = BufrEncoder(tab_fmt, tab_path)
+
+
+def _encode_worker(json_data_msg):
+    return _worker_encoder(json_data_msg)
 
 
 def run(argv=None):
@@ -319,6 +497,30 @@ def run(argv=None):
                                ),
                                metavar="name"
                                )
+        parser.add_argument("-J", "--jobs", dest="jobs",
+                            default=1,
+                            type=int,
+                            metavar="N",
+                            help="encode with N processes in parallel [default: 1]"
+                            )
+        group_prof = parser.add_argument_group(title="performance")
+        group_prof.add_argument("--timing", dest="timing",
+                                action="store_true",
+                                help="print time per phase (scan, sections, tables, "
+                                + "data, output) to STDERR"
+                                )
+        group_prof.add_argument("--profile", dest="profile",
+                                nargs="?",
+                                const="cumulative",
+                                choices=("cumulative", "tottime"),
+                                help="profile with cProfile, print statistics sorted by "
+                                + "'cumulative' (default) or 'tottime' to STDERR, "
+                                + "includes --timing"
+                                )
+        group_prof.add_argument("--profile-out", dest="profile_out",
+                                metavar="file",
+                                help="write profile statistics to file (pstats format)"
+                                )
         parser.add_argument("-b", "--bulletin", dest="bulletin",
                             default=None,
                             type=int,
@@ -356,27 +558,32 @@ def run(argv=None):
             sys.stderr.write("Unknown operation!")
             return 1
 
-        PROFILE = False
-        if PROFILE:
+        if args.profile_out and not args.profile:
+            args.profile = "cumulative"
+        if args.profile:
             import cProfile
             import pstats
             pr = cProfile.Profile()
             pr.enable()
+        timer = PhaseTimer(bool(args.timing or args.profile))
 
         if args.desc:
-            read_bufr_desc(args)
+            read_bufr_desc(args, timer)
         if args.reader:
-            read_bufr_data(args)
+            read_bufr_data(args, timer)
         elif args.json_dump:
-            read_bufr_to_json(args)
+            read_bufr_to_json(args, timer)
         elif args.json_encode:
-            write_bufr(args)
+            write_bufr(args, timer)
 
-        if PROFILE:
+        if args.profile:
             pr.disable()
-            sortby = 'cumulative'
-            ps = pstats.Stats(pr, stream=sys.stderr).sort_stats(sortby)
-            ps.print_stats()
+            if args.profile_out:
+                pr.dump_stats(args.profile_out)
+            ps = pstats.Stats(pr, stream=sys.stderr).sort_stats(args.profile)
+            ps.print_stats(PROFILE_STATS_LINES)
+        if timer.enabled:
+            sys.stderr.write(timer.summary() + "\n")
 
     except KeyboardInterrupt:
         return 0
@@ -29,12 +29,19 @@ Created on Nov 17, 2016
 @author: amaul
 """
 from bitstring import Bits, BitStream, ConstBitStream
+import binascii
 import six
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class Blob(object):
 
     _data = None
+    # Octets of a read-only Blob, for slicing octets directly
+    _octets = None
 
     def __init__(self, bin_data=None, rw=False):
         """Initialising the class with an byte (octet) array or make a new, empty one.
@@ -46,7 +53,8 @@ class Blob(object):
         elif rw:
             self._data = BitStream(bytes=bin_data)
         else:
-            self._data = ConstBitStream(bytes=bin_data)
+            self._octets = bytes(bin_data)
+            self._data = ConstBitStream(bytes=self._octets)
         self.reset()
 
     def __str__(self):
@@ -68,6 +76,12 @@ class Blob(object):
     def get_bytes(self):
         return self._data.bytes
 
+    def get_octets(self):
+        """Octets of the bitstream, without a copy if the Blob is read-only."""
+        if self._octets is not None:
+            return self._octets
+        return self._data.bytes
+
     def get_point(self):
         return self._data.pos // 8
 
@@ -126,6 +140,22 @@ class Blob(object):
     def read_bytes(self, width=1):
         return self._data.read("bytes:%d" % width)
 
+    def read_octets(self, count):
+        """Read count octets, e.g. of a string.
+
+        If the position is byte-aligned, the octets are sliced directly from
+        the buffer, otherwise they are shifted out of an integer.
+
+        :return: bytes
+        """
+        if not count:
+            return b""
+        pos = self._data.pos
+        if not pos & 7 and self._octets is not None and (pos >> 3) + count <= len(self._octets):
+            self._data.pos = pos + count * 8
+            return self._octets[pos >> 3:(pos >> 3) + count]
+        return _uint2octets(self._data.read("uint:%d" % (count * 8)), count)
+
     def read_bits(self, width):
         """Read width bits from internal buffer.
 
@@ -136,6 +166,25 @@ class Blob(object):
         else:
             return self._data.read("uintbe:%d" % width)
 
+    def read_uint_block(self, widths, count):
+        """Read count repetitions of a row of unsigned integers at once.
+
+        :param widths: bit-widths of the integers in one row, each < 64.
+        :param count: number of rows.
+        :return: list of numpy arrays (uint64) with count values, one per width.
+        """
+        row = sum(widths)
+        bits = self._data.read(row * count)
+        bits = np.unpackbits(np.frombuffer(bits.tobytes(), dtype=np.uint8))
+        bits = bits[:row * count].reshape(count, row)
+        columns = []
+        offs = 0
+        for width in widths:
+            weights = np.uint64(1) << np.arange(width - 1, -1, -1, dtype=np.uint64)
+            columns.append(bits[:, offs:offs + width].dot(weights))
+            offs += width
+        return columns
+
     def write_bytes(self, value, width=None):
         """
         :param value: character array (String)
@@ -161,9 +210,29 @@ class Blob(object):
                        "uint:{}={}").format(width, value)
         return len(self._data)
 
+    def write_uint_array(self, values, width):
+        """Append all values of an integer array, each with width bits.
+
+        :param values: numpy array of unsigned integers.
+        :param width: the bit-width for each value.
+        """
+        values = np.asarray(values, dtype=np.uint64)
+        shifts = np.arange(width - 1, -1, -1, dtype=np.uint64)
+        bits = ((values[:, None] >> shifts) & np.uint64(1)).astype(np.uint8)
+        self._data += Bits(bytes=np.packbits(bits).tobytes(), length=values.size * width)
+        return len(self._data)
+
     def set_uint(self, value, width, bitpos):
         if width // 8 == 0:
             bins = Bits(uint=value, length=width)
         else:
             bins = Bits(uintbe=value, length=24)
         self._data[bitpos: bitpos + width] = bins
+
+
+if six.PY3:
+    def _uint2octets(value, count):
+        return value.to_bytes(count, "big")
+else:
+    def _uint2octets(value, count):
+        return binascii.unhexlify("%0*x" % (count * 2, value))
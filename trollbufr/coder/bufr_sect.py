@@ -28,8 +28,10 @@ Ported to Py3  09/2018
 
 @author: amaul
 '''
-from .errors import SUPPORTED_BUFR_EDITION, BufrEncodeError
-from .functions import str2dtg, dtg2str
+import struct
+import binascii
+from .errors import SUPPORTED_BUFR_EDITION, BufrDecodeError, BufrEncodeError
+from .functions import str2dtg, dtg2str, octets2hex
 
 """
 Section 0
@@ -51,6 +53,174 @@ def decode_sect0(bin_data, offset):
     return bin_data.get_point(), 8, dict(list(zip(keys[1:], vals[1:])))
 
 
+def index_sections(octets):
+    """Find the sections of a BUFR by their lengths, without decoding them.
+
+    :return: {size, edition}, list of the offsets of sections 0 to 5, with
+        None for a missing section 2.
+    :raise BufrDecodeError: not a complete BUFR.
+    """
+    if octets[:4] != b"BUFR":
+        raise BufrDecodeError("Data does not start with 'BUFR'")
+    size, edition = divmod(struct.unpack_from(">I", octets, 4)[0], 256)
+    if edition not in SUPPORTED_BUFR_EDITION:
+        raise BufrDecodeError("BUFR edition %d not supported" % edition)
+    offsets = [0, 8, None]
+    # Flag for section 2 in section 1
+    if bytearray(octets[8 + (7 if edition == 3 else 9):][:1])[0] & 0x80:
+        offsets[2] = 8 + (struct.unpack_from(">I", octets, 8)[0] >> 8)
+    for _ in range(3):
+        o = offsets[-1] or offsets[-2]
+        offsets.append(o + (struct.unpack_from(">I", octets, o)[0] >> 8))
+    if octets[offsets[5]:offsets[5] + 4] != b"7777":
+        raise BufrDecodeError("End '7777' not found")
+    if size != offsets[5] + 4:
+        raise BufrDecodeError("Size/offset error")
+    return {"size": size, "edition": edition}, offsets
+
+
+def local_octets(octets, sect_num=2):
+    """Data for local use in section 2, or in section 1, without copying it.
+
+    :param octets: the BUFR.
+    :param sect_num: 2 for the data of section 2, 1 for the local use data
+        of section 1.
+    :return: memoryview of the octets, None if the BUFR has none.
+    """
+    meta, offsets = index_sections(octets)
+    if sect_num == 2:
+        if offsets[2] is None:
+            return None
+        return memoryview(octets)[offsets[2] + 4:offsets[3]]
+    start = offsets[1] + SECT1_STRUCT[meta["edition"]][1].size
+    end = offsets[2] or offsets[3]
+    # Ed.3 pads the section to an even number of octets.
+    if start == end or meta["edition"] == 3 and octets[start:end] == b"\x00":
+        return None
+    return memoryview(octets)[start:end]
+
+
+class SectionMeta(dict):
+    """Meta-data of a BUFR, decoding the sections 1 to 3 on first access.
+
+    Accessing a key of a section not yet decoded decodes this section;
+    iterating, copying, or printing the dict decodes all sections.
+    The local use data are kept as memoryview, and rendered as list of hex
+    strings on first access.
+    """
+
+    """Keys of the sections 2 and 3, all other keys are from section 1."""
+    SECT_KEYS = {2: ("sect2_data",), 3: ("subsets", "obs", "comp", "descr")}
+
+    """Keys of the local use data, set as memoryview by unpack_sect1/2()."""
+    LOCAL_KEYS = ("sect1_local_use", "sect2_data")
+
+    def __init__(self, octets=None, offsets=None, meta=None):
+        """:param octets: the BUFR.
+        :param offsets: section offsets, see index_sections(); None if the
+            sections are decoded with update().
+        :param meta: meta-data already decoded, including the edition.
+        """
+        dict.__init__(self, meta or {})
+        self._octets = octets
+        self._local = {}
+        if offsets is None:
+            self._pending = {}
+        else:
+            self._pending = dict((i, offsets[i]) for i in (1, 2, 3) if offsets[i] is not None)
+
+    def _decode(self, sect_num):
+        offset = self._pending.pop(sect_num)
+        if sect_num == 1:
+            _, rd = unpack_sect1(self._octets, offset, self["edition"])
+        elif sect_num == 2:
+            _, rd = unpack_sect2(self._octets, offset)
+        else:
+            _, rd = unpack_sect3(self._octets, offset)
+        self.update(rd)
+        if not self._pending:
+            self._octets = None
+
+    def _decode_all(self):
+        for sect_num in sorted(self._pending):
+            self._decode(sect_num)
+        for key in list(self._local):
+            self._render(key)
+
+    def _render(self, key):
+        value = octets2hex(self._local.pop(key))
+        dict.__setitem__(self, key, value)
+        return value
+
+    def update(self, other):
+        """Update from a dict, keeping local use data as memoryview."""
+        for key, value in other.items():
+            if key in SectionMeta.LOCAL_KEYS and isinstance(value, memoryview):
+                self._local[key] = value
+            else:
+                dict.__setitem__(self, key, value)
+
+    def __missing__(self, key):
+        if key in self._local:
+            return self._render(key)
+        for sect_num in (2, 3):
+            if key in SectionMeta.SECT_KEYS[sect_num]:
+                break
+        else:
+            sect_num = 1
+        if sect_num in self._pending:
+            self._decode(sect_num)
+        else:
+            self._decode_all()
+        if key in self._local:
+            return self._render(key)
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if not dict.__contains__(self, key) and key not in self._local:
+            try:
+                self[key]
+            except KeyError:
+                return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        self._decode_all()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._decode_all()
+        return dict.__len__(self)
+
+    def __repr__(self):
+        self._decode_all()
+        return dict.__repr__(self)
+
+    def keys(self):
+        self._decode_all()
+        return dict.keys(self)
+
+    def values(self):
+        self._decode_all()
+        return dict.values(self)
+
+    def items(self):
+        self._decode_all()
+        return dict.items(self)
+
+    def copy(self):
+        self._decode_all()
+        return dict(self)
+
+
 def encode_sect0(bin_data, edition=4):
     """
     :return: section start offset, meta-dict
@@ -114,26 +284,43 @@ BUFR Vers. 4
 """
 
 
+"""Keys and struct format of section 1, per edition. The first item holds
+the section length and the master table."""
+SECT1_STRUCT = {
+    3: (("master", "subcenter", "center", "update", "sect2", "cat", "cat_loc", "mver", "lver", "datetime"),
+        struct.Struct(">IBBBBBBBB5s")
+        ),
+    4: (("master", "center", "subcenter", "update", "sect2", "cat", "cat_int", "cat_loc", "mver", "lver", "datetime"),
+        struct.Struct(">IHHBBBBBBB7s")
+        ),
+}
+
+
+def unpack_sect1(octets, offset, edition=4):
+    """Decode section 1 from the octets of a BUFR.
+
+    :return: length, {master, center, subcenter, update, cat, cat_int, cat_loc, mver, lver, datetime, sect2},
+        and sect1_local_use as memoryview if present, see SectionMeta.
+    """
+    keys, sect1_struct = SECT1_STRUCT[edition]
+    vals = list(sect1_struct.unpack_from(octets, offset))
+    l = vals[0] >> 8
+    vals[0] &= 0xFF
+    rd = dict(zip(keys, vals))
+    rd["sect2"] = bool(rd["sect2"] & 0x80)
+    rd["datetime"] = str2dtg(rd["datetime"], ed=edition)
+    if sect1_struct.size < l:
+        # Ed.3 pads the section to an even number of octets.
+        if not (edition == 3 and octets[offset + sect1_struct.size:offset + l] == b"\x00"):
+            rd["sect1_local_use"] = memoryview(octets)[offset + sect1_struct.size:offset + l]
+    return l, rd
+
+
 def decode_sect1(bin_data, offset, edition=4):
     """
     :return: offset, length, {master, center, subcenter, update, cat, cat_int, cat_loc, mver, lver, datetime, sect2}
     """
-    key_offs = {
-        3: (("length", "master", "subcenter", "center", "update", "sect2", "cat", "cat_loc", "mver", "lver", "datetime"),
-            "uint:24, uint:8, uint:8, uint:8, uint:8, bool, pad:7, uint:8, uint:8, uint:8, uint:8, bytes:5"
-            ),
-        4: (("length", "master", "center", "subcenter", "update", "sect2", "cat", "cat_int", "cat_loc", "mver", "lver", "datetime"),
-            "uint:24, uint:8, uint:16, uint:16, uint:8, bool, pad:7, uint:8, uint:8, uint:8, uint:8, uint:8, bytes:7"
-            ),
-    }
-    vals = bin_data.readlist(key_offs[edition][1])
-    rd = dict(list(zip(key_offs[edition][0], vals)))
-    rd["datetime"] = str2dtg(rd["datetime"], ed=edition)
-    l = rd.pop("length")
-    if bin_data.get_point() < offset + l:
-        rd["sect1_local_use"] = bin_data.readlist("hex:8," * (offset + l - bin_data.get_point()))
-        if edition == 3 and rd["sect1_local_use"] == [b"00"]:
-            rd.pop("sect1_local_use")
+    l, rd = unpack_sect1(bin_data.get_octets(), offset, edition)
     bin_data.reset(offset + l)
     return offset + l, l, rd
 
@@ -185,7 +372,7 @@ def encode_sect1(bin_data, json_data, edition=4):
     else:
         bin_data.write_bytes(rd["datetime"], 7 * 8)
     if loc_use:
-        bin_data.writelist("hex:8={}," * len(loc_use), loc_use)
+        bin_data.write_bytes(_hex2octets(loc_use))
     (edition == 3) and bin_data.write_align(True)
     rd["length"] = (len(bin_data) - section_start) // 8
     bin_data.set_uint(rd["length"], 24, section_start)
@@ -201,14 +388,33 @@ Section 2
 """
 
 
+def _hex2octets(data):
+    """Octets from a list of hex strings (as in JSON), or bytes-like data.
+
+    :return: bytes
+    """
+    if isinstance(data, (list, tuple)):
+        return binascii.unhexlify("".join(data))
+    return bytes(bytearray(data))
+
+
+def unpack_sect2(octets, offset):
+    """Decode section 2 from the octets of a BUFR.
+
+    :return: length, {sect2_data}, the data as memoryview, see SectionMeta.
+    """
+    l = struct.unpack_from(">I", octets, offset)[0] >> 8
+    return l, {"sect2_data": memoryview(octets)[offset + 4:offset + l]}
+
+
 def decode_sect2(bin_data, offset):
     """
     :return: offset, length, {}
     """
-    l = bin_data.readlist("uint:24, pad:8")[0]
-    s2data = bin_data.readlist("hex:8," * (l - 4))
+    l, rd = unpack_sect2(bin_data.get_octets(), offset)
+    rd.update(data_start=offset + 4, data_end=offset + l)
     bin_data.reset(offset + l)
-    return offset + l, l, {"data_start": offset + 4, "data_end": offset + l, "sect2_data": s2data}
+    return offset + l, l, rd
 
 
 def encode_sect2(bin_data, json_data):
@@ -217,7 +423,7 @@ def encode_sect2(bin_data, json_data):
     """
     section_start = len(bin_data)
     bin_data.writelist("uint:24={}, pad:8", (0,))
-    bin_data.writelist("hex:8={}," * len(json_data), json_data)
+    bin_data.write_bytes(_hex2octets(json_data))
     sz = (len(bin_data) - section_start) // 8
     bin_data.set_uint(sz, 24, section_start)
     return section_start // 8
@@ -236,21 +442,29 @@ Section 3
 """
 
 
+def unpack_sect3(octets, offset):
+    """Decode section 3 from the octets of a BUFR.
+
+    :return: length, {subsets, obs, comp, descr}
+    """
+    l, subsets, flags = struct.unpack_from(">IHB", octets, offset)
+    l >>= 8
+    # Ed.3 pads the section to an even number of octets.
+    raw = struct.unpack_from(">%dH" % ((l - 7) // 2), octets, offset + 7)
+    desc = [(d >> 14) * 100000 + (d >> 8 & 0x3F) * 1000 + (d & 0xFF) for d in raw]
+    return l, {"subsets": subsets,
+               "obs": bool(flags & 0x80),
+               "comp": bool(flags & 0x40),
+               "descr": desc}
+
+
 def decode_sect3(bin_data, offset):
     """
     Use {}[desc] for bin_data-iterator iter_data().
 
     :return: offset, length, {subsets, obs, comp, desc}
     """
-    keys = ("length", "subsets", "obs", "comp")
-    vals = bin_data.readlist("uint:24, pad:8, uint:16, bool, bool, pad:6")
-    rd = dict(list(zip(keys, vals)))
-    l = rd.pop("length")
-    desc = []
-    while bin_data.get_point() < offset + l - 1:
-        df, dx, dy = bin_data.readlist("uint:2, uint:6, uint:8")
-        desc.append(int("%d%02d%03d" % (df, dx, dy)))
-    rd["descr"] = desc
+    l, rd = unpack_sect3(bin_data.get_octets(), offset)
     bin_data.reset(offset + l)
     return offset + l, l, rd
 
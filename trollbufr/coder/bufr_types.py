@@ -28,7 +28,14 @@ Created on Mar 13, 2018
 
 @author: amaul
 """
-from copy import deepcopy
+from array import array
+from datetime import datetime
+from timeit import default_timer
+from .errors import BufrDecodeError
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 from collections import namedtuple
 DescrDataEntry = namedtuple("DescrDataEntry", "descr mark value quality")
@@ -44,7 +51,9 @@ REP END  : End of desriptor and data repetition.
 OPR desc : Operator, which read and returned data values.
 BMP DEF  : Use the data present bit-map to refer to the data descriptors
            which immediately precede the operator to which it relates.
-           The bitmap is returned in the named tuple item 'value'.
+           The bitmap is returned in the named tuple item 'value', the
+           numbers of the data entries referred to by the bitmap (counting
+           the data entries of the subset from 0) in 'quality'.
 BMP USE  : Re-use the previously defined data present bit-map. Same as "BMP DEF".
 LOC desc : Local descriptor skipped, its bit-width was declared by operator.
 """
@@ -68,6 +77,195 @@ BufrMetadataKeys = ("master",  # BUFR master version, WMO=0.
                     )
 
 
+class MarkType(object):
+    """Integer codes for the marker types in decoded data.
+
+    A marker is described by its type, a descriptor, and a count, the
+    descriptor and count are only set for some types (see FORMAT).
+    """
+    DATA = 0
+    """No marker, a data value."""
+    SUB = 1
+    SEQ = 2
+    SEQ_END = 3
+    RPL = 4
+    RPL_ITER = 5
+    RPL_END = 6
+    RPL_NIL = 7
+    REP = 8
+    REP_ITER = 9
+    REP_END = 10
+    REP_NIL = 11
+    OPR = 12
+    BMP_DEF = 13
+    BMP_USE = 14
+    LOC = 15
+
+    FORMAT = {SUB: "SUB",
+              SEQ: "SEQ {descr:06d}",
+              SEQ_END: "SEQ END",
+              RPL: "RPL {descr:06d} *{count}",
+              RPL_ITER: "RPL {count}",
+              RPL_END: "RPL END",
+              RPL_NIL: "RPL NIL",
+              REP: "REP {descr:06d} *{count}",
+              REP_ITER: "REP {count}",
+              REP_END: "REP END",
+              REP_NIL: "REP NIL",
+              OPR: "OPR",
+              BMP_DEF: "BMP DEF",
+              BMP_USE: "BMP USE",
+              LOC: "LOC {descr:06d}",
+              }
+    """String form of the markers, as 'mark' in DescrDataEntry."""
+
+    @staticmethod
+    def format(mark, descr=None, count=None):
+        """Marker as string, as used for 'mark' in DescrDataEntry.
+
+        :return: string, or None for DATA.
+        """
+        if mark == MarkType.DATA:
+            return None
+        fmt, args = _MARK_PRINTF[mark]
+        if args == 0:
+            return fmt
+        if args == 1:
+            return fmt % descr
+        if args == 2:
+            return fmt % count
+        return fmt % (descr, count)
+
+    @staticmethod
+    def parse(mark_str):
+        """Marker type, descriptor, and count from the string form.
+
+        :return: tuple (mark, descr, count), unset items are None.
+        """
+        if mark_str is None:
+            return MarkType.DATA, None, None
+        mark = _MARK_FIXED.get(mark_str)
+        if mark is not None:
+            return mark, None, None
+        name, _, arg = mark_str.partition(" ")
+        if name in ("RPL", "REP"):
+            if "*" in arg:
+                descr, count = arg.split(" *")
+                return (MarkType.RPL if name == "RPL" else MarkType.REP), int(descr), int(count)
+            return (MarkType.RPL_ITER if name == "RPL" else MarkType.REP_ITER), None, int(arg)
+        if name == "SEQ":
+            return MarkType.SEQ, int(arg), None
+        if name == "LOC":
+            return MarkType.LOC, int(arg), None
+        raise ValueError("Unknown marker '%s'" % mark_str)
+
+
+_MARK_FIXED = dict((v, k) for k, v in MarkType.FORMAT.items() if "{" not in v)
+"""Markers without descriptor or count, {string: type}."""
+
+_MARK_PRINTF = dict((k, (v.replace("{descr:06d}", "%06d").replace("{count}", "%d"),
+                         ("{descr" in v) + 2 * ("{count" in v)))
+                    for k, v in MarkType.FORMAT.items())
+"""MarkType.FORMAT as printf-style format, with the arguments used:
+{type: (format, 0=none|1=descr|2=count|3=descr,count)}.
+"""
+
+
+class DescrMark(namedtuple("DescrMark", "mark descr count")):
+    """Marker in decoded data, as 'mark' in DescrDataEntry.
+
+    The items are the marker type (MarkType), and the descriptor and count,
+    both int or None (see MarkType.FORMAT). str() returns the string form.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return MarkType.format(self.mark, self.descr, self.count)
+
+
+class CompactSubset(object):
+    """Decoded data of one or more subsets in parallel arrays.
+
+    For each item -- data value or marker, in the order as from
+    SubsetReader.next_data() -- the arrays hold:
+
+    - descr   : descriptor, of the data element or operator; for markers SEQ,
+                RPL, and REP the sequence or replication descriptor.
+    - mark    : marker type, MarkType.DATA (0) for data values.
+    - count   : replication count (RPL, REP) or iteration number (RPL_ITER,
+                REP_ITER), subset number (SUB), local descriptor (LOC).
+    - value   : value, or list of values in array-mode.
+    - quality : quality information (associated field).
+
+    Unset descriptors and counts are 0, unset values and quality None.
+    The index of the first item (marker SUB) of each subset is in 'starts'.
+    """
+    __slots__ = ("descr", "mark", "count", "value", "quality", "starts")
+
+    def __init__(self):
+        self.descr = array("l")
+        self.mark = array("b")
+        self.count = array("l")
+        self.value = []
+        self.quality = []
+        self.starts = array("l")
+
+    def __len__(self):
+        return len(self.mark)
+
+    def __getitem__(self, i):
+        """:return: tuple (descr, mark, count, value, quality) of item i."""
+        return self.descr[i], self.mark[i], self.count[i], self.value[i], self.quality[i]
+
+    def __str__(self):
+        return "CompactSubset *%d, %d subset(s)" % (len(self.mark), len(self.starts))
+
+    def clear(self):
+        """Remove all items, for re-using the object."""
+        del self.descr[:]
+        del self.mark[:]
+        del self.count[:]
+        del self.value[:]
+        del self.quality[:]
+        del self.starts[:]
+
+    def append(self, descr, mark, count, value, quality):
+        """Append one item, with descriptor and count as int or None."""
+        if mark == MarkType.SUB:
+            self.starts.append(len(self.mark))
+        self.descr.append(descr or 0)
+        self.mark.append(mark)
+        self.count.append(count or 0)
+        self.value.append(value)
+        self.quality.append(quality)
+
+    def append_entry(self, entry):
+        """Append a DescrDataEntry, as returned by operators."""
+        if entry.mark is None:
+            mark, descr, count = MarkType.DATA, None, None
+        elif isinstance(entry.mark, DescrMark):
+            mark, descr, count = entry.mark
+        else:
+            mark, descr, count = MarkType.parse(entry.mark)
+        if mark == MarkType.LOC:
+            descr, count = entry.descr, descr
+        self.append(descr or entry.descr, mark, count, entry.value, entry.quality)
+
+    def subset_range(self, k):
+        """Index range of items for subset k.
+
+        :return: (start, end)
+        """
+        end = self.starts[k + 1] if k + 1 < len(self.starts) else len(self.mark)
+        return self.starts[k], end
+
+    def mark_str(self, i):
+        """Marker of item i as string, or None for a data value."""
+        if self.mark[i] == MarkType.LOC:
+            return MarkType.format(MarkType.LOC, self.count[i])
+        return MarkType.format(self.mark[i], self.descr[i], self.count[i])
+
+
 class TabBType(object):
     """Types of Table-B entries."""
     NUMERIC = 0
@@ -79,31 +277,627 @@ class TabBType(object):
 
 
 class AlterState(object):
-    """Holding the states for altering descriptors."""
+    """Holding the states for altering descriptors.
 
-    def __init__(self):
-        self.reset()
+    An AlterState object is an immutable snapshot, objects with equal states
+    are the same (interned) object. An operator changing the state replaces the
+    current object with a new one from replace(), so recording the state for
+    each decoded value only stores a reference.
+
+    Attributes:
+
+    - wnum   : Add to width, for number data fields.
+    - wchr   : Change width for string data fields.
+    - refval : {desc:ref}, dict with new reference values for descriptors.
+               Do not modify, it is shared by all references to the state.
+    - refmul : Multiplier, for all reference values of following descriptors (207yyy).
+    - scale  : Add to scale, for number data fields.
+    - assoc  : Add width for associated quality field. A tuple as stack,
+               always use last value.
+    - ieee   : 0|32|64 All numerical values encoded as IEEE floating point number.
+    """
+    __slots__ = ("wnum", "wchr", "refval", "refmul", "scale", "assoc", "ieee")
+    # Interned objects, {key: AlterState}
+    _interned = {}
+    _INTERN_MAX_SIZE = 1000
+    # Key of the default state, which is kept when the interned objects are
+    # cleared: "alter is AlterState()" tests for the unaltered state.
+    _DEFAULT_KEY = (0, 0, (), 1, 0, (0,), 0)
+
+    def __new__(cls, wnum=0, wchr=0, refval=None, refmul=1, scale=0, assoc=(0,), ieee=0):
+        if refval is None:
+            refval = {}
+        assoc = tuple(assoc)
+        key = (wnum, wchr, tuple(sorted(refval.items())), refmul, scale, assoc, ieee)
+        self = cls._interned.get(key)
+        if self is None:
+            if len(cls._interned) >= cls._INTERN_MAX_SIZE:
+                default = cls._interned.get(cls._DEFAULT_KEY)
+                cls._interned.clear()
+                if default is not None:
+                    cls._interned[cls._DEFAULT_KEY] = default
+            self = object.__new__(cls)
+            for k, v in zip(cls.__slots__, (wnum, wchr, refval, refmul, scale, assoc, ieee)):
+                object.__setattr__(self, k, v)
+            cls._interned[key] = self
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError("AlterState is immutable, use replace()")
 
     def __str__(self):
         return "wnum={} wchr={} refmul={} scale={} assoc={} ieee={} refval={}".format(
             self.wnum, self.wchr, self.refmul, self.scale, self.assoc[-1], self.ieee, self.refval
         )
 
-    def reset(self):
-        self.wnum = 0
-        """Add to width, for number data fields."""
-        self.wchr = 0
-        """ Change width for string data fields."""
-        self.refval = {}
-        """ {desc:ref}, dict with new reference values for descriptors."""
-        self.refmul = 1
-        """ Multiplier, for all reference values of following descriptors (207yyy)."""
-        self.scale = 0
-        """ Add to scale, for number data fields."""
-        self.assoc = [0]
-        """ Add width for associated quality field. A stack, always use last value."""
-        self.ieee = 0
-        """ 0|32|64 All numerical values encoded as IEEE floating point number."""
+    def __reduce__(self):
+        return (AlterState, tuple(getattr(self, k) for k in AlterState.__slots__))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def replace(self, **changes):
+        """Return the state with the attributes given as keyword arguments changed.
+
+        :return: AlterState
+        """
+        values = dict((k, getattr(self, k)) for k in AlterState.__slots__)
+        values.update(changes)
+        return AlterState(**values)
+
+
+class ColumnView(object):
+    """Presents column arrays, selected by descriptor position, for encoding.
+
+    The columns are a dict {position: array}, where position is the index of a
+    descriptor in the expanded descriptor list.
+    Each array holds the values for all subsets in its first dimension; for
+    replicated descriptors a further dimension is added per replication, e.g.
+    the shape of an array for a once-replicated descriptor is
+    (subsets, iterations). Nested lists, e.g. from JSON, are taken as arrays.
+    """
+
+    def __init__(self, columns, subsets):
+        self.columns = dict((k, np.array(v, dtype=object) if isinstance(v, list) else v)
+                            for k, v in columns.items())
+        """ {position: array}, the column arrays."""
+        self.subsets = subsets
+        """ Number of subsets."""
+        self.index = ()
+        """ Current iteration of each enclosing replication."""
+
+    def __getitem__(self, position):
+        """Values for all subsets at the descriptor position, in the current
+        iteration of all enclosing replications.
+        """
+        column = self.columns.get(position)
+        if column is None or not self.index:
+            return column
+        return column[(slice(None),) + self.index]
+
+
+DTYPE_POLICIES = ("exact", "float32", "compact")
+"""Policies for the numpy dtype of column arrays, see column_dtype()."""
+
+
+def column_dtype(tab_b_elem, alter=None, policy="exact"):
+    """Numpy dtype for a column array of an element, by policy.
+
+    The dtype is determined from the Table B entry, before any value is
+    decoded:
+
+    - exact: int64 or float64, as decoded; object for strings.
+    - float32: float32 instead of float64.
+    - compact: the smallest dtype holding all values of the element, as
+      given by width, scale, and reference value in Table B; unsigned
+      integers for code and flag tables.
+
+    Numbers altered by operators (width, scale, reference value, IEEE) get the
+    exact dtype with policy compact, as their range is not given by Table B.
+
+    :param tab_b_elem: Table B element of the values.
+    :param alter: AlterState the values are decoded with.
+    :param policy: one of DTYPE_POLICIES.
+    :return: numpy dtype
+    """
+    if policy not in DTYPE_POLICIES:
+        raise BufrDecodeError("Unknown dtype policy '%s'" % policy)
+    if alter is None:
+        alter = AlterState()
+    typ = tab_b_elem.typ
+    if typ == TabBType.STRING:
+        return np.dtype(object)
+    if typ == TabBType.CODE or typ == TabBType.FLAG:
+        scale = tab_b_elem.scale
+    else:
+        scale = tab_b_elem.scale + alter.scale
+    is_float = (alter.ieee and typ in (TabBType.DOUBLE, TabBType.LONG)
+                or typ == TabBType.DOUBLE or scale > 0)
+    if policy == "exact" or (policy == "float32" and not is_float):
+        return np.dtype(np.float64 if is_float else np.int64)
+    if policy == "float32":
+        return np.dtype(np.float32)
+    if alter.wnum or alter.scale or alter.refval or alter.refmul != 1 or alter.ieee:
+        return np.dtype(np.float64 if is_float else np.int64)
+    top = (1 << tab_b_elem.width) - 1
+    if is_float:
+        # float32 holds integers up to 2^24 exactly, i.e. the raw value plus
+        # reference value, the value with the scale's decimals.
+        if max(abs(tab_b_elem.refval), abs(tab_b_elem.refval + top)) >= 1 << 24:
+            return np.dtype(np.float64)
+        return np.dtype(np.float32)
+    if typ == TabBType.LONG:
+        lo = tab_b_elem.refval * 10 ** -scale
+        hi = (tab_b_elem.refval + top - 1) * 10 ** -scale
+    else:
+        lo, hi = 0, top
+    return np.result_type(np.min_scalar_type(lo), np.min_scalar_type(hi))
+
+
+class ColumnPlan(object):
+    """Positions in the expanded descriptor list, for decoding into column arrays.
+
+    The plan is made once per template -- tables and section 3 descriptors --
+    and is used for all subsets and all BUFR with the same template.
+
+    - desc_list : expanded descriptor list, see get_descr_list().
+    - desc_ext  : extents of desc_list, see get_descr_extents().
+    - elems     : Table B element at each position, None if not an element.
+    - dtypes    : numpy dtype at each position of an element, for values not
+                  altered by operators; None if not an element.
+    - dtype     : policy for the dtype of numeric arrays.
+    - has_backref : descriptors need recording for back-reference operators.
+    """
+
+    def __init__(self, desc_list, desc_ext, tab_b, dtype="exact", has_backref=False):
+        """:param desc_list: expanded descriptor list, see get_descr_list().
+        :param desc_ext: extents of desc_list, see get_descr_extents().
+        :param tab_b: Table B.
+        :param dtype: policy for the dtype of numeric arrays, see column_dtype().
+        :param has_backref: as returned by get_descr_list().
+        """
+        if dtype not in DTYPE_POLICIES:
+            raise BufrDecodeError("Unknown dtype policy '%s'" % dtype)
+        if np is None:
+            raise BufrDecodeError("Column decoding requires numpy.")
+        self.desc_list = desc_list
+        self.desc_ext = desc_ext
+        self.elems = [tab_b.get(d) if 1000 <= d < 100000 else None for d in desc_list]
+        self.dtypes = [column_dtype(e, None, dtype) if e is not None else None
+                       for e in self.elems]
+        self.dtype = dtype
+        self.has_backref = has_backref
+
+    def value_dtype(self, pos, alter):
+        """Numpy dtype for the values at a position, decoded with alter."""
+        if alter is AlterState():
+            return self.dtypes[pos]
+        return column_dtype(self.elems[pos], alter, self.dtype)
+
+
+class ValueSetIndex(object):
+    """Headers and offsets of the value sets in a compressed data section.
+
+    Reading the value sets of only some subsets, e.g. in chunks, first
+    records the header of each numeric value set -- minimum value, width of
+    the increments, and the bit offset of the increments -- in the order they
+    are read. Further reads of other subsets replay the index: the headers are
+    taken from it, and the bitstream is positioned directly at the increments
+    of the subsets in question.
+    """
+
+    def __init__(self):
+        self.headers = []
+        """ List of (minimum value, increment width, bit offset)."""
+        self._replay = None
+
+    def rewind(self):
+        """Start replaying the recorded headers, from the first."""
+        self._replay = 0
+
+    @property
+    def replaying(self):
+        return self._replay is not None
+
+    def record(self, min_val, cwidth, offset):
+        """Append the header of a value set, read at bit offset."""
+        self.headers.append((min_val, cwidth, offset))
+
+    def next(self):
+        """Header of the next value set, while replaying."""
+        try:
+            header = self.headers[self._replay]
+        except IndexError:
+            raise BufrDecodeError("Value set #%d not in index." % self._replay)
+        self._replay += 1
+        return header
+
+
+class ColumnCollector(object):
+    """Collects decoded values into column arrays, by descriptor position.
+
+    This is the counterpart to ColumnView for decoding: the values of each
+    data descriptor are collected for all subsets, with the position of the
+    descriptor in the expanded descriptor list as key. Replicated descriptors
+    get one more dimension per replication, i.e. (subsets, iterations).
+
+    The values are written by SubsetReader.read_columns() into arrays
+    allocated with the dtype from the ColumnPlan, for all subsets at once
+    with compression, otherwise one subset (row) after the other.
+    The replication counts must be the same in all subsets, unless collecting
+    ragged data: then the counts are kept per subset. Arrays are padded with
+    missing values where a replication has fewer iterations.
+
+    Values referring to other elements by a data present bitmap -- quality
+    information (222000, class 33) and statistical values (224255, 225255)
+    -- are also linked to the position of the element they refer to.
+    """
+
+    def __init__(self, plan, subsets, ragged=False):
+        """:param plan: ColumnPlan.
+        :param subsets: number of subsets (rows).
+        :param ragged: replication counts may differ between subsets.
+        """
+        self.plan = plan
+        """ ColumnPlan with the descriptor positions."""
+        self.subsets = subsets
+        """ Number of subsets."""
+        self.ragged = ragged
+        """ Replication counts may differ between subsets."""
+        # {position: [data array, mask array or None for strings]}
+        self._arrays = {}
+        # Positions of delayed replication factors
+        self._factors = set()
+        # {position: [count, ...]}, counts per occurrence of a replication,
+        # if ragged {position: [data array, mask array]} (subsets, occurrences)
+        self._loops = {} if ragged else None
+        # {position: {referred position: [data array, mask array or None]}}
+        self._linked = {}
+
+    def _fit(self, arrays, key, index, dims, dtype):
+        """Array pair for the key, allocated or enlarged to hold the index.
+
+        :param dims: counts of the enclosing replications, the minimum size.
+        :return: [data array, mask array or None]
+        """
+        pair = arrays.get(key)
+        if pair is None:
+            shape = (self.subsets,) + dims
+            if dtype == object:
+                pair = [np.empty(shape, dtype=object), None]
+            else:
+                pair = [np.zeros(shape, dtype=dtype), np.ones(shape, dtype=bool)]
+            arrays[key] = pair
+            return pair
+        shape = pair[0].shape
+        if len(index) + 1 != len(shape):
+            raise BufrDecodeError("Descriptor #%d in replications of different depth." % key)
+        if shape[0] < self.subsets or any(i >= n for i, n in zip(index, shape[1:])):
+            # More subsets or iterations than before, pad with missing values.
+            self._grow(pair, (max(self.subsets, 2 * shape[0]),)
+                       + tuple(max(i + 1, d, n) for i, d, n in zip(index, dims, shape[1:])))
+        if dtype != pair[0].dtype and not np.can_cast(dtype, pair[0].dtype):
+            # Values altered by an operator don't fit, e.g. float in int.
+            data, mask = pair
+            new = np.result_type(data.dtype, dtype)
+            if new == object and mask is not None:
+                data = data.astype(object)
+                data[mask] = None
+                pair[:] = data, None
+            else:
+                pair[0] = data.astype(new)
+        return pair
+
+    @staticmethod
+    def _grow(pair, shape):
+        """Enlarge the arrays of the pair to shape, with missing values."""
+        data, mask = pair
+        part = tuple(slice(0, n) for n in data.shape)
+        if mask is None:
+            pair[0] = np.empty(shape, dtype=object)
+        else:
+            pair[0] = np.zeros(shape, dtype=data.dtype)
+            pair[1] = np.ones(shape, dtype=bool)
+            pair[1][part] = mask
+        pair[0][part] = data
+
+    def put(self, pos, row, index, dims, values, missing=None, dtype=None, arrays=None):
+        """Write the values at a descriptor position.
+
+        :param pos: position in the expanded descriptor list.
+        :param row: row of one subset, or slice(None) for all subsets.
+        :param index: iteration of each enclosing replication.
+        :param dims: counts of the enclosing replications.
+        :param values: value of one subset (None if missing), or array with
+            the values of all subsets.
+        :param missing: mask array for the values of all subsets.
+        :param dtype: dtype of the values, default from the plan.
+        :param arrays: dict to put the values in, default the column arrays.
+        """
+        if dtype is None:
+            dtype = self.plan.dtypes[pos]
+        data, mask = self._fit(self._arrays if arrays is None else arrays,
+                               pos, index, dims, dtype)
+        key = (row,) + index
+        if missing is not None:
+            data[key] = values
+            if mask is not None:
+                mask[key] = missing
+            else:
+                data[key] = np.where(missing, None, values)
+        elif values is not None:
+            data[key] = values
+            if mask is not None:
+                mask[key] = False
+
+    def put_list(self, pos, row, index, dims, values, arrays=None):
+        """Write values as from an operator, in array-mode a list with None
+        for missing values, with the dtype from the values.
+        """
+        if isinstance(values, list):
+            present = [v for v in values if v is not None]
+            missing = np.array([v is None for v in values], dtype=bool)
+            if any(isinstance(v, str) for v in present):
+                column = np.empty(len(values), dtype=object)
+                column[:] = values
+                self.put(pos, row, index, dims, column, None, np.dtype(object), arrays)
+                return
+            column = np.array([0 if v is None else v for v in values])
+            self.put(pos, row, index, dims, column, missing, column.dtype, arrays)
+        elif values is not None:
+            dtype = np.dtype(object) if isinstance(values, str) else np.asarray(values).dtype
+            self.put(pos, row, index, dims, values, None, dtype, arrays)
+
+    def put_factor(self, pos, row, index, dims, count):
+        """Write the count of a delayed replication, at the position of the
+        replication factor (031001, 031002, etc.).
+        """
+        self._factors.add(pos)
+        self.put(pos, row, index, dims, count, None, np.dtype(np.int64))
+
+    def put_linked(self, pos, ref_pos, row, ref_index, values, missing=None, dtype=None):
+        """Write values linked by a bitmap to the element at position ref_pos.
+
+        :param dtype: dtype of the values, None to take it from the values,
+            as with put_list().
+        """
+        ref = self._arrays.get(ref_pos)
+        dims = ref[0].shape[1:] if ref is not None else tuple(i + 1 for i in ref_index)
+        arrays = self._linked.setdefault(pos, {})
+        if dtype is None:
+            self.put_list(ref_pos, row, ref_index, dims, values, arrays)
+        else:
+            self.put(ref_pos, row, ref_index, dims, values, missing, dtype, arrays)
+
+    def put_bitmap(self, pos, row, index, dims, bitmap, loops):
+        """Write the bitmap as values of the 031031 descriptors.
+
+        :param pos: position after the operator 236000.
+        :return: position after the bitmap.
+        """
+        dl = self.plan.desc_list
+        if 100000 <= dl[pos] < 200000:
+            loops.setdefault(pos, []).append(len(bitmap))
+            start = pos + (1 if dl[pos] % 1000 else 2)
+            for i, v in enumerate(bitmap):
+                self.put(start, row, index + (i,), dims + (len(bitmap),), v)
+            return self.plan.desc_ext[pos]
+        for i, v in enumerate(bitmap):
+            self.put(pos + i, row, index, dims, v)
+        return pos + len(bitmap)
+
+    def add_loops(self, row, loops, subset=None):
+        """Add the replication counts of a subset, or of all subsets.
+
+        :param row: row of one subset, or slice(None) for all subsets.
+        :param loops: dict {position: [count, ...]}, per occurrence.
+        :param subset: number of the subset, for the error message.
+        :raise BufrDecodeError: a replication count differs from the subsets before.
+        """
+        if self.ragged:
+            for pos, counts in loops.items():
+                for i, count in enumerate(counts):
+                    self.put(pos, row, (i,), (len(counts),), count, None,
+                             np.dtype(np.int64), self._loops)
+        elif self._loops is None:
+            self._loops = loops
+        elif self._loops != loops:
+            raise BufrDecodeError("Replication counts differ between subsets (#%s)." % subset)
+
+    def _column(self, pair):
+        """Masked array from an array pair, or the object array."""
+        if pair[0].shape[0] < self.subsets:
+            self._grow(pair, (self.subsets,) + pair[0].shape[1:])
+        data, mask = pair
+        if mask is None:
+            return data[:self.subsets]
+        return np.ma.array(data[:self.subsets], mask=mask[:self.subsets])
+
+    def columns(self, counts=False):
+        """Column arrays of the collected values.
+
+        Numeric values are in masked arrays, int64 or float64, or a smaller
+        dtype depending on the dtype policy; missing values are masked.
+        Strings are in object arrays, with None for missing values.
+        Replications with different counts in the same subset, i.e. in an
+        enclosing replication, are padded with missing values.
+
+        :param counts: include the counts of delayed replications, at the
+            positions of the replication factors.
+        :return: dict {position: array}.
+        """
+        return dict((pos, self._column(pair))
+                    for pos, pair in self._arrays.items()
+                    if counts or pos not in self._factors)
+
+    def linked(self):
+        """Arrays of the values linked to other elements by a bitmap.
+
+        For the position of each quality or statistical value, a dict with
+        the positions of the elements referred to; each array has the same
+        shape as the column array of the element referred to, with missing
+        values where the element was not referred to.
+
+        :return: dict {position: {referred position: array}}.
+        """
+        res = {}
+        for pos, linked in self._linked.items():
+            res[pos] = {}
+            for ref_pos, pair in linked.items():
+                shape = self._arrays[ref_pos][0].shape
+                if pair[0].shape != shape:
+                    self._grow(pair, tuple(max(n, m) for n, m in zip(shape, pair[0].shape)))
+                res[pos][ref_pos] = self._column(pair)
+        return res
+
+    def loops(self):
+        """Counts of the delayed replications.
+
+        If ragged, the counts are arrays of shape (subsets, occurrences),
+        masked where a replication did not occur in a subset.
+
+        :return: dict {position: count}, for replications occurring more than
+            once (in an enclosing replication) a list of counts.
+        """
+        dl = self.plan.desc_list
+        if self.ragged:
+            return dict((pos, self._column(pair))
+                        for pos, pair in self._loops.items()
+                        if dl[pos] % 1000 == 0)
+        loops = {}
+        for pos, counts in (self._loops or {}).items():
+            if dl[pos] % 1000 == 0:
+                loops[pos] = counts[0] if len(counts) == 1 else counts
+        return loops
+
+    def truncate(self, rows):
+        """Drop the rows from rows on, e.g. of a BUFR failing to decode.
+
+        The arrays keep their size, the rows dropped are set to missing
+        values for the rows added later.
+        """
+        self.subsets = rows
+        pairs = list(self._arrays.values())
+        pairs.extend(pair for arrays in self._linked.values() for pair in arrays.values())
+        if self.ragged:
+            pairs.extend(self._loops.values())
+        for data, mask in pairs:
+            if mask is None:
+                data[rows:] = None
+            else:
+                mask[rows:] = True
+
+    def row_nbytes(self):
+        """Bytes per subset (row) in the arrays allocated so far, data and
+        mask; arrays of strings are counted by their references.
+        """
+        total = 0
+        for arrays in [self._arrays] + list(self._linked.values()):
+            for data, mask in arrays.values():
+                cells = int(np.prod(data.shape[1:]))
+                total += cells * (data.itemsize + (1 if mask is not None else 0))
+        return total
+
+
+class SubsetFilter(object):
+    """Predicates on the values of key descriptors, to select subsets.
+
+    Each test is a predicate on the values of some descriptors, a subset is
+    selected if all tests are true for it. Only the first occurrence of each
+    descriptor in a subset is tested, a missing value is None.
+
+    While decoding, the values of the key descriptors are read first, the
+    other values of a subset not selected are skipped.
+    """
+
+    def __init__(self):
+        self._tests = []
+        self.descriptors = frozenset()
+        """ Descriptors, whose values are required by the tests."""
+
+    def add(self, descriptors, predicate):
+        """Add a test.
+
+        :param descriptors: descriptors, as int.
+        :param predicate: function called with the values of the descriptors,
+            in this order, returning True to select the subset.
+        :return: this SubsetFilter.
+        """
+        descriptors = tuple(descriptors)
+        self._tests.append((descriptors, predicate))
+        self.descriptors = self.descriptors.union(descriptors)
+        return self
+
+    def bbox(self, lat_min, lat_max, lon_min, lon_max, lat=5001, lon=6001):
+        """Select subsets by location, within a lat/lon box.
+
+        If lon_min is greater than lon_max, the box crosses the date-line.
+
+        :param lat: descriptor for latitude.
+        :param lon: descriptor for longitude.
+        :return: this SubsetFilter.
+        """
+        def in_bbox(lat_val, lon_val):
+            if lat_val is None or lon_val is None or not lat_min <= lat_val <= lat_max:
+                return False
+            if lon_min <= lon_max:
+                return lon_min <= lon_val <= lon_max
+            return lon_val >= lon_min or lon_val <= lon_max
+        return self.add((lat, lon), in_bbox)
+
+    def time_window(self, start, end):
+        """Select subsets by date/time (004001-004006), start <= time <= end.
+
+        Missing minute and second count as 0.
+
+        :param start: datetime.
+        :param end: datetime.
+        :return: this SubsetFilter.
+        """
+        def in_window(year, month, day, hour, minute, second):
+            if None in (year, month, day, hour):
+                return False
+            try:
+                t = datetime(int(year), int(month), int(day), int(hour),
+                             int(minute or 0), int(second or 0))
+            except ValueError:
+                return False
+            return start <= t <= end
+        return self.add((4001, 4002, 4003, 4004, 4005, 4006), in_window)
+
+    def stations(self, ids, descriptors=(1001, 1002)):
+        """Select subsets by station identifier.
+
+        With the WMO block and station numbers (001001, 001002) the identifier
+        is block * 1000 + station, e.g. 10384; with one descriptor it is the
+        value, e.g. a ship's call sign.
+
+        :param ids: collection of station identifiers.
+        :param descriptors: descriptors holding the station identifier.
+        :return: this SubsetFilter.
+        """
+        ids = frozenset(ids)
+        if len(descriptors) == 2:
+            def is_station(block, station):
+                return block is not None and station is not None and block * 1000 + station in ids
+        else:
+            def is_station(value):
+                return value in ids
+        return self.add(descriptors, is_station)
+
+    def __call__(self, values):
+        """Test the values of one subset.
+
+        :param values: dict {descriptor: value}.
+        :return: True if all tests are true.
+        """
+        for descriptors, predicate in self._tests:
+            if not predicate(*[values.get(d) for d in descriptors]):
+                return False
+        return True
 
 
 class BackrefRecord(object):
@@ -132,23 +926,38 @@ class BackrefRecord(object):
             len(self._backref_stack),
             self._stack_idx)
 
-    def append(self, descr, alter):
-        """Append descriptor and alter object to the record."""
+    def append(self, descr, alter, ref=None):
+        """Append descriptor and alter object to the record.
+
+        :param ref: reference to the decoded value, the number of the data
+            entry in the subset, or None.
+        """
         if not self._recording:
             return
         if alter is None:
-            alt = AlterState()
-        else:
-            alt = deepcopy(alter)
-        self._backref_record.append((descr, alt))
+            alter = AlterState()
+        self._backref_record.append((descr, alter, ref))
 
     def apply(self, bitmap):
-        """Apply bitmap to record, creating a stack of descriptor/alter pairs."""
-        self._backref_stack = [self._backref_record[len(self._backref_record) - i]
-                               for i in range(len(bitmap), 0, -1)
-                               if bitmap[len(bitmap) - i] == 0]
+        """Apply bitmap to record, creating a stack of descriptor/alter pairs.
+
+        The bitmap refers to the last len(bitmap) pairs, 0 means present.
+        """
+        offset = len(self._backref_record) - len(bitmap)
+        if np is not None:
+            present = (np.flatnonzero(np.asarray(bitmap) == 0) + offset).tolist()
+        else:
+            present = [offset + i for i, b in enumerate(bitmap) if b == 0]
+        self._backref_stack = [self._backref_record[i] for i in present]
         self._stack_idx = 0
 
+    def present_refs(self):
+        """References of the descriptors with data present in the bitmap.
+
+        :return: tuple, with a number of a data entry or None for each.
+        """
+        return tuple(r[2] for r in self._backref_stack)
+
     def __next__(self):
         """Return next descriptor/alter pair from stack."""
         if self._stack_idx >= len(self._backref_stack):
@@ -176,3 +985,101 @@ class BackrefRecord(object):
         self._stack_idx = -1
         self._backref_stack = []
         self._recording = True
+
+
+class DecodeStats(object):
+    """Counters and wall times collected while decoding BUFR.
+
+    Counters:
+
+    - messages     : BUFR with decoded meta-data.
+    - subsets      : decoded subsets (all subsets of a BUFR in array-mode).
+    - bits         : bits read from the data section; decoding a compressed
+                     BUFR subset by subset reads the whole section per subset.
+    - values       : decoded data values (per subset).
+    - missing      : data values decoded as "missing".
+    - replications : replication/repetition descriptors evaluated.
+    - iterations   : iterations expanded for all replications.
+    - operators    : operator descriptors applied.
+    - cache_hits   : tables taken from the table cache.
+    - cache_misses : tables loaded from files.
+
+    Wall times in seconds, per phase:
+
+    - sections : decoding sections 0-5, without data and tables.
+    - tables   : loading tables.
+    - data     : decoding the data section, during iteration over next_data().
+
+    Statistics from several objects are summed up with add() or "+=".
+    """
+    COUNTERS = ("messages", "subsets", "bits", "values", "missing",
+                "replications", "iterations", "operators",
+                "cache_hits", "cache_misses")
+    PHASES = ("sections", "tables", "data")
+
+    def __init__(self):
+        self.reset()
+
+    def __str__(self):
+        s = ["%-13s: %d" % (k, getattr(self, k)) for k in DecodeStats.COUNTERS]
+        s.extend("%-13s: %.6fs" % ("time " + k, self.times[k]) for k in DecodeStats.PHASES)
+        return "\n".join(s)
+
+    def reset(self):
+        """Set all counters and times to zero."""
+        for k in DecodeStats.COUNTERS:
+            setattr(self, k, 0)
+        self.times = dict((k, 0.0) for k in DecodeStats.PHASES)
+
+    def add(self, other):
+        """Add counters and times of another DecodeStats object to this one.
+
+        :return: self
+        """
+        for k in DecodeStats.COUNTERS:
+            setattr(self, k, getattr(self, k) + getattr(other, k))
+        for k in DecodeStats.PHASES:
+            self.times[k] += other.times[k]
+        return self
+
+    __iadd__ = add
+
+    def as_dict(self):
+        """:return: dict with all counters, and times as sub-dict "times"."""
+        d = dict((k, getattr(self, k)) for k in DecodeStats.COUNTERS)
+        d["times"] = dict(self.times)
+        return d
+
+    def wrap_get_val(self, get_val):
+        """Wrap one of the get_val functions, counting values and missing values.
+
+        Only values for data descriptors are counted, not values read with a
+        fixed width (e.g. replication counts, associated fields).
+        """
+        def get_val_counting(bin_data, subs_num, tab_b_elem=None, alter=None,
+                             fix_width=None, fix_typ=None):
+            val = get_val(bin_data, subs_num, tab_b_elem, alter, fix_width, fix_typ)
+            if fix_width is None:
+                if isinstance(val, list):
+                    self.values += len(val)
+                    self.missing += val.count(None)
+                else:
+                    self.values += 1
+                    if val is None:
+                        self.missing += 1
+            return val
+        return get_val_counting
+
+    def timed(self, phase, iterable):
+        """Iterate over iterable, adding the time for each item to phase."""
+        it = iter(iterable)
+        times = self.times
+        while True:
+            t = default_timer()
+            try:
+                item = next(it)
+            except StopIteration:
+                times[phase] += default_timer() - t
+                return
+            times[phase] += default_timer() - t
+            yield item
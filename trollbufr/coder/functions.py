@@ -29,11 +29,16 @@ Created on Oct 28, 2016
 @author: amaul
 """
 import sys
+import binascii
 import datetime
 import logging
 import struct
 from .errors import BufrDecodeError, BufrEncodeError, BufrTableError
-from .bufr_types import AlterState, TabBType
+from .bufr_types import AlterState, TabBType, ColumnView
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 logger = logging.getLogger("trollbufr")
 
@@ -62,28 +67,19 @@ def octets2num(bin_data, offset, count):
 
 
 def calc_width(bin_data, tab_b_elem=None, alter=None, fix_width=None, fix_typ=None):
-    """Read a raw value integer from the data section.
+    """Determine bit-width and type for reading a raw value.
 
     The number of bits are either fixed or determined from Tab.B and previous
     alteration operators.
-    Compression is taken into account.
 
-    :return: raw value integer
+    :return: bit-width, type
     """
     loc_typ = tab_b_elem.typ if tab_b_elem is not None else fix_typ
     if fix_width is not None:
         loc_width = fix_width
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.debug("OCTETS       : FXW w+a:_+_ fw:%d qual:_ bc:%d #%d",  # ->ord(%02X)",
-                         fix_width, bin_data.bc, bin_data.p,  # ord(bin_data[bin_data.p])
-                         )
     elif tab_b_elem is not None and (31000 <= tab_b_elem.descr < 32000):
         # replication/repetition descriptor (group 31) is never altered.
         loc_width = tab_b_elem.width
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.debug("OCTETS %06d: NAL w+a:_+_ fw:_ qual:_ bc:%d #%d",  # ->ord(%02X)",
-                         tab_b_elem.descr, bin_data.bc, bin_data.p,  # ord(bin_data[bin_data.p])
-                         )
     elif tab_b_elem is not None and alter is not None:
         if loc_typ == TabBType.STRING and alter.wchr:
             loc_width = alter.wchr
@@ -94,11 +90,6 @@ def calc_width(bin_data, tab_b_elem=None, alter=None, fix_width=None, fix_typ=No
                 loc_width = tab_b_elem.width + alter.wnum
         else:
             loc_width = tab_b_elem.width
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.debug("OCTETS %06d:     w+a:%d%+d fw:_ qual:%d bc:%d  #%d",  # ->ord(%02X)",
-                         tab_b_elem.descr, tab_b_elem.width, alter.wnum, alter.assoc[-1],
-                         bin_data.bc, bin_data.p,  # ord(bin_data[bin_data.p])
-                         )
     else:
         raise BufrDecodeError("Can't determine width.")
     return loc_width, loc_typ
@@ -106,6 +97,8 @@ def calc_width(bin_data, tab_b_elem=None, alter=None, fix_width=None, fix_typ=No
 
 def get_val(bin_data, subs_num, tab_b_elem=None, alter=None, fix_width=None, fix_typ=None):
     loc_width, loc_typ = calc_width(bin_data, tab_b_elem, alter, fix_width, fix_typ)
+    if loc_typ == TabBType.STRING and not loc_width & 7:
+        return octets2str(bin_data.read_octets(loc_width // 8), fix_width is None)
     rval = bin_data.read_bits(loc_width)
     if fix_width is not None:
         if loc_typ == TabBType.STRING:
@@ -116,8 +109,40 @@ def get_val(bin_data, subs_num, tab_b_elem=None, alter=None, fix_width=None, fix
         return rval2num(tab_b_elem, alter, rval)
 
 
+def skip_val_function(get_val_func, is_compressed=False, keep=()):
+    """Wrap a get_val function, skipping the elements' values without conversion.
+
+    Values with fixed width -- replication counts, bitmaps, etc. -- are
+    read, they are required to follow the descriptors. So are the values of
+    the descriptors in keep.
+    With compression the value sets of all subsets are skipped, the function
+    get_val_func has to read in array-mode.
+
+    :return: function with the same parameters as get_val_func, returning
+        None for a skipped value.
+    """
+    def skip_val(bin_data, subs_num, tab_b_elem=None, alter=None, fix_width=None, fix_typ=None):
+        if fix_width is not None or tab_b_elem.descr in keep:
+            return get_val_func(bin_data, subs_num, tab_b_elem, alter, fix_width, fix_typ)
+        loc_width, loc_typ = calc_width(bin_data, tab_b_elem, alter)
+        if not is_compressed:
+            bin_data.read_skip(loc_width)
+        elif bin_data.read_bits(loc_width) == all_one(loc_width):
+            # All missing, no increments follow
+            bin_data.read_skip(6)
+        else:
+            cwidth = bin_data.read_bits(6)
+            if loc_typ == TabBType.STRING:
+                cwidth *= 8
+            bin_data.read_skip(cwidth * subs_num[1])
+        return None
+    return skip_val
+
+
 def get_val_comp(bin_data, subs_num, tab_b_elem=None, alter=None, fix_width=None, fix_typ=None):
     loc_width, loc_typ = calc_width(bin_data, tab_b_elem, alter, fix_width, fix_typ)
+    if loc_typ == TabBType.STRING and not loc_width & 7:
+        return octets2str(cset2str(bin_data, loc_width, subs_num), fix_width is None)
     rval = cset2octets(bin_data,
                        loc_width,
                        subs_num,
@@ -131,12 +156,34 @@ def get_val_comp(bin_data, subs_num, tab_b_elem=None, alter=None, fix_width=None
         return rval2num(tab_b_elem, alter, rval)
 
 
-def get_val_array(bin_data, subs_num, tab_b_elem=None, alter=None, fix_width=None, fix_typ=None):
+def get_val_array(bin_data, subs_num, tab_b_elem=None, alter=None, fix_width=None, fix_typ=None,
+                  rows=None, select=None):
+    """Read the value sets of all subsets, with compression, as list.
+
+    :param rows: (start, stop) range of subsets to read, default all.
+    :param select: list of the subsets (in rows) to return, the raw values
+        of the others are not converted.
+    :return: list of values.
+    """
     loc_width, loc_typ = calc_width(bin_data, tab_b_elem, alter, fix_width, fix_typ)
+    if loc_typ == TabBType.STRING and not loc_width & 7:
+        octets_ary = cset2str_array(bin_data, loc_width, subs_num[1], rows)
+        if select is not None:
+            octets_ary = [octets_ary[i] for i in select]
+        return [octets2str(octets, fix_width is None) for octets in octets_ary]
+    if (fix_width is None and alter is not None and alter.ieee and np is not None
+            and loc_typ in (TabBType.DOUBLE, TabBType.LONG)):
+        rval_ary = cset2uint_array(bin_data, loc_width, subs_num[1], rows)
+        if select is not None:
+            rval_ary = rval_ary[np.asarray(select, dtype=np.intp)]
+        return ieee2num_array(rval_ary, loc_width)
     rval_ary = cset2array(bin_data,
                           loc_width,
                           subs_num[1],
-                          loc_typ or TabBType.LONG)
+                          loc_typ or TabBType.LONG,
+                          rows)
+    if select is not None:
+        rval_ary = [rval_ary[i] for i in select]
     if fix_width is None:
         rval_ary = [rval2num(tab_b_elem, alter, rval) for rval in rval_ary]
     elif loc_typ == TabBType.STRING:
@@ -144,6 +191,89 @@ def get_val_array(bin_data, subs_num, tab_b_elem=None, alter=None, fix_width=Non
     return rval_ary
 
 
+def get_val_column(bin_data, subs_num, tab_b_elem, alter, rows=None, select=None, index=None):
+    """Read the value sets of all subsets, with compression, as array (requires numpy).
+
+    Other than get_val_array(), the increments are read as one block and the
+    raw values are converted at once, see rval2num_column().
+
+    :param rows: (start, stop) range of subsets to read, default all.
+    :param select: list of the subsets (in rows) to return, the raw values
+        of the others are not converted.
+    :param index: ValueSetIndex for the headers of numeric value sets.
+    :return: values array, missing-mask array; strings are in an object
+        array with None for missing values, and the mask is None.
+    """
+    loc_width, loc_typ = calc_width(bin_data, tab_b_elem, alter)
+    if loc_typ == TabBType.STRING or (loc_width > 63 and not alter.ieee):
+        values = get_val_array(bin_data, subs_num, tab_b_elem, alter, rows=rows, select=select)
+        if loc_typ == TabBType.STRING:
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+            return column, None
+        missing = np.array([v is None for v in values], dtype=bool)
+        return np.array([0 if v is None else v for v in values]), missing
+    rvals = cset2uint_array(bin_data, loc_width, subs_num[1], rows, index)
+    if select is not None:
+        rvals = rvals[np.asarray(select, dtype=np.intp)]
+    return rval2num_column(tab_b_elem, alter, rvals, loc_width)
+
+
+def get_val_function(is_compressed, as_array=False, trace=False, rows=None, select=None):
+    """Select the function for reading values from the data section.
+
+    The functions get_val, get_val_comp, and get_val_array do no logging.
+    With trace=True the selected function is wrapped by a function logging
+    each value read, to be used if debug logging is enabled.
+
+    :param is_compressed: BUFR uses compression.
+    :param as_array: read the values of all subsets as list, if compressed.
+    :param trace: log each value read.
+    :param rows: (start, stop) range of subsets to read as list, default all.
+    :param select: list of subsets to return as list, default all.
+    :return: function
+    """
+    if as_array and is_compressed and (rows is not None or select is not None):
+        def get_val_func(bin_data, subs_num, tab_b_elem=None, alter=None, fix_width=None,
+                         fix_typ=None):
+            return get_val_array(bin_data, subs_num, tab_b_elem, alter, fix_width, fix_typ,
+                                 rows, select)
+    elif as_array and is_compressed:
+        get_val_func = get_val_array
+    elif is_compressed:
+        get_val_func = get_val_comp
+    else:
+        get_val_func = get_val
+    if trace:
+        return trace_get_val(get_val_func, is_compressed)
+    return get_val_func
+
+
+def trace_get_val(get_val_func, is_compressed=False):
+    """Wrap a get_val function, logging width, compression, and value.
+
+    :return: function with the same parameters as get_val_func.
+    """
+    def get_val_trace(bin_data, subs_num, tab_b_elem=None, alter=None, fix_width=None, fix_typ=None):
+        loc_width, loc_typ = calc_width(bin_data, tab_b_elem, alter, fix_width, fix_typ)
+        descr = "%06d" % tab_b_elem.descr if tab_b_elem is not None else "FXW"
+        logger.debug("OCTETS %s: w:%d typ:%s fw:%s alter:(%s) #%s",
+                     descr, loc_width, loc_typ, fix_width, alter, bin_data)
+        if is_compressed:
+            # Peek at minimum value and width of increments.
+            p, bc = bin_data.get_point(), bin_data.get_bitcons()
+            min_val = bin_data.read_bits(loc_width)
+            cwidth = bin_data.read_bits(6)
+            bin_data.reset(p)
+            bin_data.set_bitcons(bc)
+            logger.debug("CSET  subnum %s  loc_width %d  min_val %d  cwidth %d",
+                         subs_num, loc_width, min_val, cwidth)
+        val = get_val_func(bin_data, subs_num, tab_b_elem, alter, fix_width, fix_typ)
+        logger.debug("EVAL-RV %s: val:(%s)", descr, val)
+        return val
+    return get_val_trace
+
+
 def cset2octets(bin_data, loc_width, subs_num, btyp):
     """Like Blob.read_bits(), but for compressed data.
 
@@ -151,58 +281,196 @@ def cset2octets(bin_data, loc_width, subs_num, btyp):
     """
     min_val = bin_data.read_bits(loc_width)
     cwidth = bin_data.read_bits(6)
-    n = None
-    v = None
     if btyp == TabBType.STRING:
         cwidth *= 8
-    try:
-        if cwidth == 0 or min_val == all_one(loc_width):
-            # All equal or all missing
-            v = min_val
+    if cwidth == 0 or min_val == all_one(loc_width):
+        # All equal or all missing
+        v = min_val
+    else:
+        # Data compressed
+        bin_data.read_skip(cwidth * subs_num[0])
+        n = bin_data.read_bits(cwidth)
+        if n == all_one(cwidth):
+            v = all_one(loc_width)
         else:
-            # Data compressed
-            bin_data.read_skip(cwidth * subs_num[0])
-            n = bin_data.read_bits(cwidth)
-            if n == all_one(cwidth):
-                v = all_one(loc_width)
-            else:
-                v = min_val + n
-            bin_data.read_skip(cwidth * (subs_num[1] - subs_num[0] - 1))
-    finally:
-        logger.debug("CSET  subnum %s  loc_width %d  min_val %d  cwidth %d  cval %s  rval %d",
-                     subs_num, loc_width, min_val, cwidth, n, v)
+            v = min_val + n
+        bin_data.read_skip(cwidth * (subs_num[1] - subs_num[0] - 1))
     return v
 
 
-def cset2array(bin_data, loc_width, subs_cnt, btyp):
+def cset2array(bin_data, loc_width, subs_cnt, btyp, rows=None):
     """Like Blob.read_bits(), but for compressed data.
 
+    :param rows: (start, stop) range of subsets to return, default all.
     :return: octets
     """
+    start, stop = rows or (0, subs_cnt)
     min_val = bin_data.read_bits(loc_width)
     cwidth = bin_data.read_bits(6)
-    single_val = None
-    val_ary = [None] * subs_cnt
     if btyp == TabBType.STRING:
         cwidth *= 8
-    try:
-        if cwidth == 0 or min_val == all_one(loc_width):
-            # All equal or all missing
-            val_ary = [min_val] * subs_cnt
+    if cwidth == 0 or min_val == all_one(loc_width):
+        # All equal or all missing
+        return [min_val] * (stop - start)
+    # Data compressed
+    bin_data.read_skip(cwidth * start)
+    val_ary = [None] * (stop - start)
+    for i in range(stop - start):
+        single_val = bin_data.read_bits(cwidth)
+        if single_val == all_one(cwidth):
+            val_ary[i] = all_one(loc_width)
         else:
-            # Data compressed
-            for i in range(subs_cnt):
-                single_val = bin_data.read_bits(cwidth)
-                if single_val == all_one(cwidth):
-                    val_ary[i] = all_one(loc_width)
-                else:
-                    val_ary[i] = min_val + single_val
-    finally:
-        logger.debug("CSET  subnum %s  loc_width %d  min_val %d  cwidth %d  cval %s  rval %s",
-                     subs_cnt, loc_width, min_val, cwidth, single_val, val_ary)
+            val_ary[i] = min_val + single_val
+    bin_data.read_skip(cwidth * (subs_cnt - stop))
     return val_ary
 
 
+def cset2uint_array(bin_data, loc_width, subs_cnt, rows=None, index=None):
+    """Like cset2array(), reading the increments as one block (requires numpy).
+
+    :param rows: (start, stop) range of subsets to return, default all.
+    :param index: ValueSetIndex, the header is recorded in it, or taken
+        from it when replaying.
+    :return: numpy array (uint64) of raw values.
+    """
+    start, stop = rows or (0, subs_cnt)
+    if index is not None and index.replaying:
+        min_val, cwidth, offset = index.next()
+        bin_data.reset(offset >> 3)
+        bin_data.set_bitcons(offset & 7)
+    else:
+        min_val = bin_data.read_bits(loc_width)
+        cwidth = bin_data.read_bits(6)
+        if index is not None:
+            index.record(min_val, cwidth, bin_data.p * 8 + bin_data.bc)
+    if cwidth == 0 or min_val == all_one(loc_width):
+        # All equal or all missing
+        return np.full(stop - start, min_val, dtype=np.uint64)
+    # Data compressed
+    bin_data.read_skip(cwidth * start)
+    increments = bin_data.read_uint_block([cwidth], stop - start)[0]
+    bin_data.read_skip(cwidth * (subs_cnt - stop))
+    rvals = increments + np.uint64(min_val)
+    rvals[increments == np.uint64(all_one(cwidth))] = np.uint64(all_one(loc_width))
+    return rvals
+
+
+def bitmap2array(bin_data, count, is_compressed, subs_cnt):
+    """Read a data present bitmap of count bits at once (requires numpy).
+
+    If compressed, each bit is a set of 1 bit minimum value and 6 bit width
+    of the increments; usually all widths are 0, then the bitmap is the same
+    for all subsets.
+
+    :return: numpy array (bool) with count bits, with one row per subset if
+        compressed.
+    """
+    if not is_compressed:
+        return bin_data.read_uint_block([1], count)[0].astype(bool)
+    p, bc = bin_data.get_point(), bin_data.get_bitcons()
+    min_val, cwidth = bin_data.read_uint_block([1, 6], count)
+    if not cwidth.any():
+        return np.tile(min_val.astype(bool), (subs_cnt, 1))
+    # Bitmap differs between subsets, read bit by bit.
+    bin_data.reset(p)
+    bin_data.set_bitcons(bc)
+    return np.array([cset2array(bin_data, 1, subs_cnt, TabBType.LONG)
+                     for _ in range(count)], dtype=bool).T
+
+
+def cset2str(bin_data, loc_width, subs_num):
+    """Like cset2octets(), for strings with a width of whole octets.
+
+    :return: octets of the string in subset subs_num[0].
+    """
+    min_val = bin_data.read_octets(loc_width // 8)
+    cwidth = bin_data.read_bits(6)
+    if cwidth == 0 or min_val == _all_one_octets(len(min_val)):
+        # All equal or all missing
+        return min_val
+    # Data compressed, increments are the strings themselves
+    bin_data.read_skip(cwidth * 8 * subs_num[0])
+    octets = bin_data.read_octets(cwidth)
+    bin_data.read_skip(cwidth * 8 * (subs_num[1] - subs_num[0] - 1))
+    return _add_min_octets(min_val, octets)
+
+
+def cset2str_array(bin_data, loc_width, subs_cnt, rows=None):
+    """Like cset2array(), for strings with a width of whole octets.
+
+    The strings of all subsets are read as one block of octets.
+
+    :param rows: (start, stop) range of subsets to return, default all.
+    :return: list of octets, one per subset.
+    """
+    start, stop = rows or (0, subs_cnt)
+    min_val = bin_data.read_octets(loc_width // 8)
+    cwidth = bin_data.read_bits(6)
+    if cwidth == 0 or min_val == _all_one_octets(len(min_val)):
+        # All equal or all missing
+        return [min_val] * (stop - start)
+    # Data compressed, increments are the strings themselves
+    bin_data.read_skip(cwidth * 8 * start)
+    block = bin_data.read_octets(cwidth * (stop - start))
+    bin_data.read_skip(cwidth * 8 * (subs_cnt - stop))
+    octets_ary = [block[i:i + cwidth] for i in range(0, len(block), cwidth)]
+    if min_val.strip(b"\x00"):
+        octets_ary = [_add_min_octets(min_val, octets) for octets in octets_ary]
+    return octets_ary
+
+
+def _all_one_octets(count):
+    return b"\xff" * count
+
+
+def _add_min_octets(min_val, octets):
+    """Add the increment octets to the minimum value of a compressed string.
+
+    The minimum value for strings should be all zero, then the increment is
+    the string itself.
+    """
+    if octets == _all_one_octets(len(octets)):
+        return _all_one_octets(len(min_val))
+    if not min_val.strip(b"\x00"):
+        return octets
+    v = int(binascii.hexlify(min_val), 16) + int(binascii.hexlify(octets), 16)
+    return binascii.unhexlify("%0*x" % (len(min_val) * 2, v))
+
+
+_CTRL_OCTETS = bytes(bytearray(range(0x20)))
+"""Control characters, which are removed from strings."""
+
+
+def octets2hex(octets):
+    """List of the octets as hex strings, as in the JSON object.
+
+    :param octets: bytes or memoryview.
+    :return: list of strings.
+    """
+    return ["%02x" % o for o in bytearray(octets)]
+
+
+def octets2str(octets, missing=True):
+    """Decode the octets of a string, like rval2str() without the detour
+    over an integer.
+
+    :param octets: octets as read from the BUFR.
+    :param missing: all octets 0xFF mean "missing value".
+    :return: string, or None for "missing value".
+    """
+    if missing and octets == _all_one_octets(len(octets)):
+        return None
+    return _octets_decode(octets.translate(None, _CTRL_OCTETS))
+
+
+if sys.version_info >= (3, 0):
+    def _octets_decode(octets):
+        return octets.decode("latin-1")
+else:
+    def _octets_decode(octets):
+        return octets
+
+
 def rval2str(rval):
     """Each byte of the integer rval is taken as a character,
     they are joined into a string.
@@ -217,8 +485,9 @@ def rval2str(rval):
     return val
 
 
-_IEEE_INF = {32: ("f", 0x7f7fffff), 64: ("d", 0x7fefffffffffffff)}
-"""The "missing-value" bit-masks for IEEE float/double."""
+_IEEE_INF = {32: ("f", 0x7f7fffff, "I"), 64: ("d", 0x7fefffffffffffff, "Q")}
+"""The "missing-value" bit-masks for IEEE float/double, with struct formats
+for the float and the unsigned integer of the same size."""
 
 
 def rval2num(tab_b_elem, alter, rval):
@@ -250,26 +519,24 @@ def rval2num(tab_b_elem, alter, rval):
         loc_refval = tab_b_elem.refval
         loc_scale = tab_b_elem.scale
     else:
-        loc_width = tab_b_elem.width + alter.wnum
+        loc_width = alter.ieee or tab_b_elem.width + alter.wnum
         loc_refval = alter.refval.get(tab_b_elem.descr, tab_b_elem.refval * alter.refmul)
         loc_scale = tab_b_elem.scale + alter.scale
     if (rval == all_one(loc_width)
             and (tab_b_elem.descr < 31000 or tab_b_elem.descr >= 31020)):
         # First, test if all bits are set, which usually means "missing value".
         # The delayed replication and repetition descr are special nut-cases.
-        logger.debug("rval %d ==_(1<<%d)%d    #%06d/%d", rval, loc_width,
-                     all_one(loc_width), tab_b_elem.descr,
-                     tab_b_elem.descr // 1000)
         val = None
     elif alter.ieee and (tab_b_elem.typ == TabBType.DOUBLE
                          or tab_b_elem.typ == TabBType.LONG):
         # IEEE 32b or 64b floating point number, INF means "missing value".
         if alter.ieee not in _IEEE_INF:
             raise BufrDecodeError("Invalid IEEE size %d" % alter.ieee)
-        if not rval ^ _IEEE_INF[alter.ieee][1]:
-            val = struct.unpack(_IEEE_INF[alter.ieee][0], rval)
-        else:
+        if rval == _IEEE_INF[alter.ieee][1]:
             val = None
+        else:
+            val = struct.unpack(">" + _IEEE_INF[alter.ieee][0],
+                                struct.pack(">" + _IEEE_INF[alter.ieee][2], rval))[0]
     elif tab_b_elem.typ == TabBType.DOUBLE or loc_scale > 0:
         # Float/double: add reference, divide by scale
         val = float(rval + loc_refval) / 10 ** loc_scale
@@ -280,12 +547,85 @@ def rval2num(tab_b_elem, alter, rval):
         val = rval2str(rval)
     else:
         val = rval
+    return val
 
-    logger.debug("EVAL-RV %06d: typ:%s width:%d ref:%d scal:%d%+d val:(%d)->(%s)",
-                 tab_b_elem.descr, tab_b_elem.typ, loc_width, loc_refval,
-                 tab_b_elem.scale, alter.scale, rval, str(val))
 
-    return val
+def rval2num_array(tab_b_elem, rvals):
+    """Like rval2num(), for an array of raw values not altered by operators.
+
+    Only for numeric, code, and flag table elements.
+
+    :param rvals: numpy array of raw values.
+    :return: list of values, None for "missing value".
+    """
+    loc_scale = tab_b_elem.scale
+    if tab_b_elem.typ == TabBType.DOUBLE or loc_scale > 0:
+        values = (rvals.astype(np.int64) + tab_b_elem.refval) / 10 ** loc_scale
+    elif tab_b_elem.typ == TabBType.LONG:
+        values = np.trunc((rvals.astype(np.int64) + tab_b_elem.refval)
+                          / 10 ** loc_scale).astype(np.int64)
+    else:
+        values = rvals
+    values = values.tolist()
+    if tab_b_elem.descr < 31000 or tab_b_elem.descr >= 31020:
+        for i in np.flatnonzero(rvals == all_one(tab_b_elem.width)).tolist():
+            values[i] = None
+    return values
+
+
+def ieee2num_array(rvals, width):
+    """Like rval2num(), for an array of raw IEEE floating point values.
+
+    Both all bits set and the INF pattern (see _IEEE_INF) mean "missing".
+
+    :param rvals: numpy array of raw values.
+    :param width: 32 or 64 bit.
+    :return: list of values, None for "missing value".
+    """
+    if width not in _IEEE_INF:
+        raise BufrDecodeError("Invalid IEEE size %d" % width)
+    rvals = rvals.astype(">u%d" % (width // 8))
+    missing = ((rvals == rvals.dtype.type(all_one(width)))
+               | (rvals == rvals.dtype.type(_IEEE_INF[width][1])))
+    values = rvals.view(">f%d" % (width // 8)).astype(float).tolist()
+    for i in np.flatnonzero(missing).tolist():
+        values[i] = None
+    return values
+
+
+def rval2num_column(tab_b_elem, alter, rvals, loc_width):
+    """Like rval2num(), for an array of raw values, altered by operators or not.
+
+    :param rvals: numpy array (uint64) of raw values.
+    :param loc_width: bit-width of the raw values.
+    :return: values array (int64 or float64), missing-mask array.
+    """
+    if tab_b_elem.descr < 31000 or tab_b_elem.descr >= 31020:
+        missing = rvals == np.uint64(all_one(loc_width))
+    else:
+        missing = np.zeros(len(rvals), dtype=bool)
+    if tab_b_elem.typ == TabBType.CODE or tab_b_elem.typ == TabBType.FLAG:
+        loc_refval = tab_b_elem.refval
+        loc_scale = tab_b_elem.scale
+    else:
+        loc_refval = alter.refval.get(tab_b_elem.descr, tab_b_elem.refval * alter.refmul)
+        loc_scale = tab_b_elem.scale + alter.scale
+    if alter.ieee and (tab_b_elem.typ == TabBType.DOUBLE or tab_b_elem.typ == TabBType.LONG):
+        if alter.ieee not in _IEEE_INF:
+            raise BufrDecodeError("Invalid IEEE size %d" % alter.ieee)
+        rvals = rvals.astype(">u%d" % (alter.ieee // 8))
+        missing = missing | (rvals == rvals.dtype.type(_IEEE_INF[alter.ieee][1]))
+        values = rvals.view(">f%d" % (alter.ieee // 8)).astype(np.float64)
+    elif tab_b_elem.typ == TabBType.DOUBLE or loc_scale > 0:
+        values = (rvals.astype(np.int64) + loc_refval) / 10 ** loc_scale
+    elif tab_b_elem.typ == TabBType.LONG and loc_scale:
+        values = np.trunc((rvals.astype(np.int64) + loc_refval)
+                          / 10 ** loc_scale).astype(np.int64)
+    elif tab_b_elem.typ == TabBType.LONG:
+        values = rvals.astype(np.int64) + loc_refval
+    else:
+        values = rvals.astype(np.int64)
+    return values, missing
 
 
 def num2rval(tab_b_elem, alter, value):
@@ -312,7 +652,7 @@ def num2rval(tab_b_elem, alter, value):
         loc_scale = tab_b_elem.scale
         value = value.encode("latin1") if value is not None else value
     else:
-        loc_width = tab_b_elem.width + alter.wnum
+        loc_width = alter.ieee or tab_b_elem.width + alter.wnum
         loc_refval = alter.refval.get(tab_b_elem.descr, tab_b_elem.refval * alter.refmul)
         loc_scale = tab_b_elem.scale + alter.scale
     if value is None and (tab_b_elem.descr < 31000 or tab_b_elem.descr >= 31020):
@@ -329,7 +669,7 @@ def num2rval(tab_b_elem, alter, value):
         fmt = _IEEE_INF[alter.ieee][0]
         if value is None:
             value = _IEEE_INF[alter.ieee][1]
-        rval = struct.pack(fmt, value)
+        rval = struct.unpack(">" + _IEEE_INF[alter.ieee][2], struct.pack(">" + fmt, value))[0]
     elif tab_b_elem.typ == TabBType.LONG or tab_b_elem.typ == TabBType.DOUBLE or loc_scale > 0:
         # Float/double/integer: add reference, divide by scale
         rval = int(round((value * 10 ** loc_scale) - loc_refval))
@@ -478,6 +818,147 @@ def add_val_comp(blob, value_list, value_list_idx, tab_b_elem=None, alter=None,
             blob.write_uint(value, min_width)
 
 
+def add_val_column(blob, value_list, value_list_idx, tab_b_elem=None, alter=None, fix_width=None, fix_typ=None):
+    """Append the values of one column array to a compressed BUFR bitstream.
+
+    This is the counterpart to add_val_comp() for column encoding, the values
+    of all subsets are taken from one array and processed at once.
+
+    :param blob: bitstream object.
+    :param value_list: ColumnView with column arrays, or single value.
+    :param value_list_idx: descriptor position in value_list, or number of
+                           subsets if value_list is single value.
+    :param tab_b_elem: descriptor
+    :param alter: alteration object
+    :param fix_width: fix bit-width, if descriptor is not applicable.
+    :param fix_typ: fix type, if descriptor is not applicable.
+    """
+    if tab_b_elem is None and fix_width is None:
+        raise BufrEncodeError("Can't determine width.")
+    if isinstance(value_list, ColumnView):
+        values = value_list[value_list_idx]
+        subs_cnt = value_list.subsets
+    else:
+        values = value_list
+        subs_cnt = value_list_idx
+    if tab_b_elem is not None and (31000 <= tab_b_elem.descr < 32000):
+        # Replication/repetition descriptor (group 31) is never altered.
+        alter = None
+    if (tab_b_elem is not None and tab_b_elem.typ == TabBType.STRING) or fix_typ == TabBType.STRING:
+        # Special handling for strings.
+        loc_width, min_value, min_width, recal_val = str2cval_column(tab_b_elem, alter, fix_width,
+                                                                     values, subs_cnt)
+        blob.write_bytes(min_value, loc_width)
+        blob.write_uint(min_width // 8, 6)
+        if min_width:
+            blob.write_bytes(recal_val)
+    else:
+        loc_width, min_value, min_width, recal_val = num2cval_column(tab_b_elem, alter, fix_width,
+                                                                     values, subs_cnt)
+        blob.write_uint(min_value, loc_width)
+        blob.write_uint(min_width, 6)
+        if min_width:
+            blob.write_uint_array(recal_val, min_width)
+
+
+def column2array(values, subs_cnt):
+    """Make an array with one value per subset, and a mask for missing values.
+
+    Missing values are either masked (numpy.ma), NaN, or None.
+
+    :return: values array, missing-mask array
+    """
+    if np is None:
+        raise BufrEncodeError("Column encoding requires numpy.")
+    if values is None:
+        return np.zeros(subs_cnt), np.ones(subs_cnt, dtype=bool)
+    if np.ndim(values) == 0:
+        values = [values] * subs_cnt
+    missing = np.ma.getmaskarray(values)
+    values = np.ma.getdata(values)
+    if values.dtype == object:
+        missing = missing | np.array([v is None for v in values], dtype=bool)
+        if not any(isinstance(v, (str, bytes, type(u""))) for v in values):
+            # Numbers from JSON lists, make a numeric array.
+            values = np.array(np.where(missing, 0, values).tolist())
+    elif values.dtype.kind == "f":
+        missing = missing | np.isnan(values)
+    if len(values) != subs_cnt:
+        raise BufrEncodeError("Column has %d values for %d subsets." % (len(values), subs_cnt))
+    return values, missing
+
+
+def num2cval_column(tab_b_elem, alter, fix_width, values, subs_cnt):
+    """Process and compress a column of values, like num2cval().
+
+    :return:  loc_width, min_value, min_width, recal_val (array)
+    """
+    values, missing = column2array(values, subs_cnt)
+    if tab_b_elem is None or alter is None:
+        loc_width = fix_width or tab_b_elem.width
+        rval = np.where(missing, 0, values).astype(np.int64)
+    elif tab_b_elem.typ == TabBType.CODE or tab_b_elem.typ == TabBType.FLAG:
+        loc_width = tab_b_elem.width
+        rval = np.where(missing, 0, values).astype(np.int64)
+    elif alter.ieee and (tab_b_elem.typ == TabBType.DOUBLE or tab_b_elem.typ == TabBType.LONG):
+        # IEEE 32b or 64b floating point number, INF means "missing value".
+        if alter.ieee not in _IEEE_INF:
+            raise BufrEncodeError("Invalid IEEE size %d" % alter.ieee)
+        loc_width = alter.ieee
+        rval = np.where(missing, 0, values).astype(">f%d" % (loc_width // 8))
+        rval = rval.view(">u%d" % (loc_width // 8)).astype(np.uint64)
+        rval[missing] = _IEEE_INF[alter.ieee][1]
+        missing = np.zeros(subs_cnt, dtype=bool)
+    else:
+        loc_width = tab_b_elem.width + alter.wnum
+        loc_refval = alter.refval.get(tab_b_elem.descr, tab_b_elem.refval * alter.refmul)
+        loc_scale = tab_b_elem.scale + alter.scale
+        rval = np.rint(np.where(missing, 0, values) * 10.0 ** loc_scale - loc_refval).astype(np.int64)
+    missing = missing | (rval == all_one(loc_width))
+    if missing.all():
+        # All values are "missing"
+        return loc_width, all_one(loc_width), 0, None
+    rval = rval.astype(np.uint64)
+    min_value = int(rval[~missing].min())
+    if not missing.any() and min_value == int(rval.max()):
+        # All values are equal
+        return loc_width, min_value, 0, None
+    recal_val = rval - np.uint64(min_value)
+    recal_max_val = int(recal_val[~missing].max())
+    min_width = recal_max_val.bit_length()
+    if recal_max_val == all_one(min_width):
+        min_width += 1
+    recal_val[missing] = all_one(min_width)
+    logger.debug("lw:%s  mval:%s  mwi:%s  max:%s", loc_width,
+                 min_value, min_width, recal_max_val)
+    return loc_width, min_value, min_width, recal_val
+
+
+def str2cval_column(tab_b_elem, alter, fix_width, values, subs_cnt):
+    """Process and compress a column of strings, like num2cval().
+
+    :return:  loc_width, min_value, min_width, recal_val (octets)
+    """
+    values, missing = column2array(values, subs_cnt)
+    if fix_width is not None:
+        loc_width = fix_width
+    else:
+        loc_width = (alter and alter.wchr) or tab_b_elem.width
+    octet_width = loc_width // 8
+    octets = []
+    for v, m in zip(values, missing):
+        if m:
+            octets.append(b"\xff" * octet_width)
+            continue
+        if not isinstance(v, bytes):
+            v = str(v).encode("latin1")
+        octets.append(v[:octet_width].ljust(octet_width, b"\x00"))
+    if len(set(octets)) == 1:
+        # All values are "missing", or all are equal
+        return loc_width, octets[0], 0, None
+    return loc_width, b"", loc_width, b"".join(octets)
+
+
 def mk_value_list(value_list, value_list_idx):
     """Make a list of values from all subsets."""
     if isinstance(value_list, (list, tuple)):
@@ -584,6 +1065,51 @@ def descr_is_seq(desc):
 #     return 400000 <= desc < 500000
 
 
+def get_descr_extents(tables, desc_list):
+    """For each position in the expanded descriptor list, find the end of the
+    structure starting there.
+
+    A sequence descriptor spans its expansion, a replication descriptor the
+    (delayed replication factor and the) replicated descriptors, all other
+    descriptors span only themselves.
+
+    :param tables: Table-set.
+    :param desc_list: expanded descriptor list, as from get_descr_list().
+    :return: list of end positions (exclusive), same length as desc_list.
+    """
+    desc_ext = [i + 1 for i in range(len(desc_list))]
+
+    def extent(di):
+        """Set end of structure at di, return end and number of items used."""
+        if descr_is_seq(desc_list[di]):
+            de = di + 1
+            n = sum(1 for d in tables.tab_d[desc_list[di]] if not descr_is_nil(d))
+            while n > 0:
+                de, k = extent(de)
+                n -= k
+            used = 1
+        elif descr_is_loop(desc_list[di]):
+            de = di + 1 if desc_list[di] % 1000 else di + 2
+            n = desc_list[di] // 1000 - 100
+            while n > 0:
+                de, k = extent(de)
+                n -= k
+            used = 1 + (0 if desc_list[di] % 1000 else 1) + desc_list[di] // 1000 - 100
+        else:
+            de = di + 1
+            used = 1
+        desc_ext[di] = de
+        return de, used
+
+    di = 0
+    try:
+        while di < len(desc_list):
+            di, _ = extent(di)
+    except (KeyError, IndexError) as e:
+        raise BufrTableError("Descriptor list can't be expanded: {}".format(e))
+    return desc_ext
+
+
 def get_descr_list(tables, desc3):
     """List all expanded descriptors.
 
@@ -49,6 +49,9 @@ class TableCache(object):
         self._base_path = base_path
         self._tabf = tabf
         self._cache = []
+        # Number of tables taken from cache, and loaded from files.
+        self.hits = 0
+        self.misses = 0
 
     def __str__(self):
         kl = (k for k, _ in self._cache)
@@ -59,8 +62,10 @@ class TableCache(object):
         for ckey, tables in self._cache:
             if ckey == key:
                 logger.info("Tables from cache: %s", "-".join(str(x) for x in key))
+                self.hits += 1
                 break
         else:
+            self.misses += 1
             tables = load_all(master, center, subcenter, master_vers, local_vers, self._base_path, self._tabf)
             self._cache.append((key, tables))
             if len(self._cache) > TableCache._CACHE_MAX_SIZE:
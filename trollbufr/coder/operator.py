@@ -30,7 +30,7 @@ Created on Mar 31, 2017
 """
 from . import functions as fun
 from .errors import BufrDecodeError, BufrEncodeError
-from .bufr_types import DescrDataEntry, TabBType
+from .bufr_types import DescrDataEntry, DescrMark, MarkType, TabBType
 import logging
 
 logger = logging.getLogger("trollbufr")
@@ -41,36 +41,13 @@ def eval_oper(subset, descr):
 
     :return: di, None|DescrDataEntry(desc,mark,value,qual)
     """
-    # Dictionary referencing operator functions from descriptors xx part.
-    res = {
-        1: fun_01,  # Change data width
-        2: fun_02,  # Change scale
-        3: fun_03_r,  # Set of new reference values
-        4: fun_04,  # Add associated field, shall be followed by 031021
-        5: fun_05_r,  # Signify with characters, plain language text as returned value
-        6: fun_06_r,  # Length of local descriptor
-        7: fun_07,  # Change scale, reference, width
-        8: fun_08,  # Change data width for characters
-        9: fun_09,  # IEEE floating point representation
-        21: fun_21,  # Data not present
-        22: fun_22_r,  # Quality Assessment Information
-        23: fun_fail,  # Substituted values operator / Substituted values marker
-        24: fun_24_r,  # First-order statistical values follow / marker operator
-        25: fun_25_r,  # Difference statistical values follow / marker operator
-        32: fun_fail,  # Replaced/retained vaules follow / marker operator
-        35: fun_35,  # Cancel backward data reference
-        36: fun_36_r,  # Define data present bit-map
-        37: fun_37_r,  # Use data present bit-map / Cancel use data present bit-map
-        41: fun_fail,  # Define event / Cancel event
-        42: fun_fail,  # Define conditioning event / Cancel conditioning event
-        43: fun_fail,  # Categorial forecast values follow / Cancel categorial forecast
-    }
     # Delegating to operator function from dict.
-    logger.debug("OP %d", descr)
-    am = descr // 1000 - 200
-    if am not in res:
+    if subset._trace:
+        logger.debug("OP %d", descr)
+    oper = _OPER_READ.get(descr // 1000 - 200)
+    if oper is None:
         raise BufrDecodeError("Operator %06d unknown." % descr)
-    return res[am](subset, descr)
+    return oper(subset, descr)
 
 
 def prep_oper(subset, descr):
@@ -78,36 +55,12 @@ def prep_oper(subset, descr):
 
     :return: di, None|DescrDataEntry, vi
     """
-    # Dictionary referencing operator functions from descriptors xx part.
-    res = {
-        1: fun_01,  # Change data width
-        2: fun_02,  # Change scale
-        3: fun_03_w,  # Set of new reference values
-        4: fun_04,  # Add associated field, shall be followed by 031021
-        5: fun_05_w,  # Signify with characters, plain language text as returned value
-        6: fun_fail,  # Length of local descriptor
-        7: fun_07,  # Change scale, reference, width
-        8: fun_08,  # Change data width for characters
-        9: fun_09,  # IEEE floating point representation
-        21: fun_21,  # Data not present
-        22: fun_noop,  # Quality Assessment Information
-        23: fun_fail,  # Substituted values operator / Substituted values marker
-        24: fun_24_w,  # First-order statistical values follow / marker operator
-        25: fun_25_w,  # Difference statistical values follow / marker operator
-        32: fun_fail,  # Replaced/retained vaules follow / marker operator
-        35: fun_35,  # Cancel backward data reference
-        36: fun_36_w,  # Define data present bit-map
-        37: fun_37_w,  # Use data present bit-map / Cancel use data present bit-map
-        41: fun_fail,  # Define event / Cancel event
-        42: fun_fail,  # Define conditioning event / Cancel conditioning event
-        43: fun_fail,  # Categorial forecast values follow / Cancel categorial forecast
-    }
     # Delegating to operator function from dict.
     logger.debug("OP %d", descr)
-    am = descr // 1000 - 200
-    if am not in res:
+    oper = _OPER_WRITE.get(descr // 1000 - 200)
+    if oper is None:
         raise BufrEncodeError("Operator %06d unknown." % descr)
-    return res[am](subset, descr)
+    return oper(subset, descr)
 
 
 '''
@@ -131,14 +84,14 @@ def funXY(subset, dl, di, de):
 def fun_01(subset, descr):
     """Change data width"""
     an = descr % 1000
-    subset._alter.wnum = an - 128 if an else 0
+    subset._alter = subset._alter.replace(wnum=an - 128 if an else 0)
     return None
 
 
 def fun_02(subset, descr):
     """Change scale"""
     an = descr % 1000
-    subset._alter.scale = an - 128 if an else 0
+    subset._alter = subset._alter.replace(scale=an - 128 if an else 0)
     return None
 
 
@@ -146,10 +99,11 @@ def fun_03_r(subset, descr):
     """Set of new reference values"""
     an = descr % 1000
     if an == 0:
-        subset._alter.refval = {}
+        subset._alter = subset._alter.replace(refval={})
     else:
         subset._read_refval()
-        logger.debug("OP refval -> %s" % subset._alter.refval)
+        if subset._trace:
+            logger.debug("OP refval -> %s", subset._alter.refval)
     return None
 
 
@@ -157,7 +111,7 @@ def fun_03_w(subset, descr):
     """Write and set of new reference values"""
     an = descr % 1000
     if an == 0:
-        subset._alter.refval = {}
+        subset._alter = subset._alter.replace(refval={})
     else:
         subset._write_refval()
         logger.debug("OP refval -> %s" % subset._alter.refval)
@@ -168,12 +122,12 @@ def fun_04(subset, descr):
     """Add associated field, shall be followed by 031021"""
     an = descr % 1000
     # Manages stack for associated field, the value added last shall be used.
+    assoc = subset._alter.assoc
     if an == 0:
-        subset._alter.assoc.pop()
-        if not len(subset._alter.assoc):
-            subset._alter.assoc = [0]
+        assoc = assoc[:-1] or (0,)
     else:
-        subset._alter.assoc.append(subset._alter.assoc[-1] + an)
+        assoc = assoc + (assoc[-1] + an,)
+    subset._alter = subset._alter.replace(assoc=assoc)
     return None
 
 
@@ -184,7 +138,8 @@ def fun_05_r(subset, descr):
                        subset.subs_num,
                        fix_width=an * 8,
                        fix_typ=TabBType.STRING)
-    logger.debug("OP text -> '%s'", v)
+    if subset._trace:
+        logger.debug("OP text -> '%s'", v)
     # Special rval for plain character
     l_rval = DescrDataEntry(descr, None, v, None)
     return l_rval
@@ -209,10 +164,11 @@ def fun_06_r(subset, descr):
                        subset.subs_num,
                        fix_width=an)
     subset._di += 1
-    logger.debug("OP skip local desc '%s', %d bit = %d",
-                 subset._dl[subset._di], an, v)
+    if subset._trace:
+        logger.debug("OP skip local desc '%s', %d bit = %d",
+                     subset._dl[subset._di], an, v)
     l_rval = DescrDataEntry(descr,
-                            "LOC %06d" % (subset._dl[subset._di]),
+                            DescrMark(MarkType.LOC, subset._dl[subset._di], None),
                             v,
                             None)
     return l_rval
@@ -222,27 +178,25 @@ def fun_07(subset, descr):
     """Change scale, reference, width"""
     an = descr % 1000
     if an == 0:
-        subset._alter.scale = 0
-        subset._alter.refmul = 1
-        subset._alter.wnum = 0
+        subset._alter = subset._alter.replace(scale=0, refmul=1, wnum=0)
     else:
-        subset._alter.scale = an
-        subset._alter.refmul = 10 ^ an
-        subset._alter.wnum = ((10 * an) + 2) // 3
+        subset._alter = subset._alter.replace(scale=an,
+                                              refmul=10 ^ an,
+                                              wnum=((10 * an) + 2) // 3)
     return None
 
 
 def fun_08(subset, descr):
     """Change data width for characters"""
     an = descr % 1000
-    subset._alter.wchr = an * 8 if an else 0
+    subset._alter = subset._alter.replace(wchr=an * 8 if an else 0)
     return None
 
 
 def fun_09(subset, descr):
     """IEEE floating point representation"""
     an = descr % 1000
-    subset._alter.ieee = an
+    subset._alter = subset._alter.replace(ieee=an)
     return None
 
 
@@ -257,7 +211,7 @@ def fun_22_r(subset, descr):
     """Quality Assessment Information"""
     en = subset._tables.tab_c.get(descr, ("Operator",))
     # An additional rval for operators where no further action is required
-    l_rval = DescrDataEntry(descr, "OPR", en[0], None)
+    l_rval = DescrDataEntry(descr, DescrMark(MarkType.OPR, None, None), en[0], None)
     # Pause back-reference recording
     subset._backref_record.pause(True)
     return l_rval
@@ -293,7 +247,7 @@ def fun_statistic_read(subset, descr, an):
         """Statistical values follow."""
         en = subset._tables.tab_c.get(descr, ("Operator",))
         # Local return value: long name of this operator.
-        l_rval = DescrDataEntry(descr, "OPR", en[0], None)
+        l_rval = DescrDataEntry(descr, DescrMark(MarkType.OPR, None, None), en[0], None)
     elif an == 255:
         """Statistical values marker operator."""
         bar = next(subset._backref_record)
@@ -352,19 +306,12 @@ def fun_36_r(subset, descr):
             subset._di -= 1
     if am != 1 or subset._dl[subset._di] != 31031:
         raise BufrDecodeError("Fault in replication defining bitmap!")
-    if subset._as_array:
-        subset._bitmap = [subset.get_val(subset._blob,
-                                         subset.subs_num,
-                                         fix_width=1)[0]
-                          for _ in range(an)]
-    else:
-        subset._bitmap = [subset.get_val(subset._blob,
-                                         subset.subs_num,
-                                         fix_width=1)
-                          for _ in range(an)]
-    logger.debug("APPLY BITMAP (%d) %s", len(subset._bitmap), subset._bitmap)
+    subset._bitmap = subset._read_bitmap(an)
+    if subset._trace:
+        logger.debug("APPLY BITMAP (%d) %s", len(subset._bitmap), subset._bitmap)
     subset._backref_record.apply(subset._bitmap)
-    l_rval = DescrDataEntry(descr, "BMP DEF", subset._bitmap, None)
+    l_rval = DescrDataEntry(descr, DescrMark(MarkType.BMP_DEF, None, None), subset._bitmap,
+                            subset._backref_record.present_refs())
     return l_rval
 
 
@@ -372,7 +319,9 @@ def fun_36_w(subset, _):
     """Define data present bit-map."""
     # The current index _vi shall point to a "bitmap" list, which shall be a
     # list of single-item lists, i.e. [[1],[1],[0],[1]]
-    if subset.is_compressed:
+    if subset._as_columns:
+        subset._bitmap = subset._column_bitmap()
+    elif subset.is_compressed:
         subset._bitmap = [x[0] for x in fun.mk_value_list(subset._vl, subset._vi)[0]]
     else:
         subset._bitmap = [x[0] for x in subset._vl[subset._vi]]
@@ -382,9 +331,11 @@ def fun_36_w(subset, _):
 
 def fun_37_r(subset, descr):
     """Use (237000) or cancel use (237255) defined data present bit-map."""
+    l_rval = None
     if descr == 237000:
-        l_rval = DescrDataEntry(descr, "BMP USE", subset._bitmap, None)
         subset._backref_record.reset()
+        l_rval = DescrDataEntry(descr, DescrMark(MarkType.BMP_USE, None, None), subset._bitmap,
+                                subset._backref_record.present_refs())
     elif descr == 237255:
         subset._bitmap = []
         subset._backref_record.renew()
@@ -397,7 +348,8 @@ def fun_37_w(subset, descr):
     Skip a bitmap list if one is present in the json data set.
     """
     if descr == 237000:
-        if ((subset.is_compressed
+        if not subset._as_columns and (
+                (subset.is_compressed
                  and isinstance(subset._vl[0][subset._vi], (list, tuple)))
                     or
                     (not subset.is_compressed
@@ -428,3 +380,54 @@ def fun_fail(_, descr):
     :param args: list, at least [subset, dl, di, de]:
     """
     raise NotImplementedError("Operator %06d not implemented." % descr)
+
+
+# Operator functions for decoding, referenced by the descriptors xx part.
+_OPER_READ = {
+    1: fun_01,  # Change data width
+    2: fun_02,  # Change scale
+    3: fun_03_r,  # Set of new reference values
+    4: fun_04,  # Add associated field, shall be followed by 031021
+    5: fun_05_r,  # Signify with characters, plain language text as returned value
+    6: fun_06_r,  # Length of local descriptor
+    7: fun_07,  # Change scale, reference, width
+    8: fun_08,  # Change data width for characters
+    9: fun_09,  # IEEE floating point representation
+    21: fun_21,  # Data not present
+    22: fun_22_r,  # Quality Assessment Information
+    23: fun_fail,  # Substituted values operator / Substituted values marker
+    24: fun_24_r,  # First-order statistical values follow / marker operator
+    25: fun_25_r,  # Difference statistical values follow / marker operator
+    32: fun_fail,  # Replaced/retained vaules follow / marker operator
+    35: fun_35,  # Cancel backward data reference
+    36: fun_36_r,  # Define data present bit-map
+    37: fun_37_r,  # Use data present bit-map / Cancel use data present bit-map
+    41: fun_fail,  # Define event / Cancel event
+    42: fun_fail,  # Define conditioning event / Cancel conditioning event
+    43: fun_fail,  # Categorial forecast values follow / Cancel categorial forecast
+}
+
+# Operator functions for encoding, referenced by the descriptors xx part.
+_OPER_WRITE = {
+    1: fun_01,  # Change data width
+    2: fun_02,  # Change scale
+    3: fun_03_w,  # Set of new reference values
+    4: fun_04,  # Add associated field, shall be followed by 031021
+    5: fun_05_w,  # Signify with characters, plain language text as returned value
+    6: fun_fail,  # Length of local descriptor
+    7: fun_07,  # Change scale, reference, width
+    8: fun_08,  # Change data width for characters
+    9: fun_09,  # IEEE floating point representation
+    21: fun_21,  # Data not present
+    22: fun_noop,  # Quality Assessment Information
+    23: fun_fail,  # Substituted values operator / Substituted values marker
+    24: fun_24_w,  # First-order statistical values follow / marker operator
+    25: fun_25_w,  # Difference statistical values follow / marker operator
+    32: fun_fail,  # Replaced/retained vaules follow / marker operator
+    35: fun_35,  # Cancel backward data reference
+    36: fun_36_w,  # Define data present bit-map
+    37: fun_37_w,  # Use data present bit-map / Cancel use data present bit-map
+    41: fun_fail,  # Define event / Cancel event
+    42: fun_fail,  # Define conditioning event / Cancel conditioning event
+    43: fun_fail,  # Categorial forecast values follow / Cancel categorial forecast
+}
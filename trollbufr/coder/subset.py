@@ -33,13 +33,23 @@ Created on Oct 28, 2016
 from . import functions as fun
 from . import operator as op
 from .errors import BufrDecodeError, BufrEncodeError
-from .bufr_types import DescrDataEntry, AlterState, BackrefRecord
+from .bufr_types import (DescrDataEntry, AlterState, BackrefRecord, ColumnView,
+                         MarkType, DescrMark, CompactSubset, TabBType)
+from itertools import chain
+from timeit import default_timer
 import logging
 
 logger = logging.getLogger("trollbufr")
 
+# Markers without descriptor or count: SEQ END, RPL END, RPL NIL, REP END, REP NIL
+_END_MARKS = (MarkType.SEQ_END, MarkType.RPL_END, MarkType.RPL_NIL, MarkType.REP_END, MarkType.REP_NIL)
+MARKS_END = tuple(DescrMark(m, None, None) for m in _END_MARKS)
+MARKS_END_STR = tuple(MarkType.format(m) for m in _END_MARKS)
+
 
 class SubsetReader(object):
+    # Min. number of values in a replication for reading it as one block
+    BLOCK_MIN_VALUES = 32
     # Numbering of this subset (this, total)
     subs_num = (-1, -1)
     # Compression
@@ -48,7 +58,9 @@ class SubsetReader(object):
     inprogress = False
 
     def __init__(self, tables, bufr, descr_list, is_compressed, subset_num,
-                 data_end, edition=4, has_backref=False, as_array=False):
+                 data_end, edition=4, has_backref=False, as_array=False,
+                 stats=None, mark_objects=False, skip_values=False, rows=None, keep=(),
+                 select=None, index=None):
         # Apply internal compression
         self.is_compressed = is_compressed
         # BUFR edition
@@ -84,13 +96,37 @@ class SubsetReader(object):
         self._vl = []
         self._vi = 0
         self._as_array = as_array and self.is_compressed
+        # Decoding with debug logging, otherwise the hot path does no logging.
+        self._trace = logger.isEnabledFor(logging.DEBUG)
         # Method for reading a value from the bistream, depends on compression.
-        if self._as_array and self.is_compressed:
-            self.get_val = fun.get_val_array
-        elif self.is_compressed:
-            self.get_val = fun.get_val_comp
-        else:
-            self.get_val = fun.get_val
+        # In array-mode only the subsets in range rows=(start, stop) are read,
+        # and only the values of the subsets in select are returned.
+        self.get_val = fun.get_val_function(self.is_compressed, self._as_array, self._trace,
+                                            rows, select)
+        self._rows = rows
+        self._select = select
+        # Headers of the value sets, ValueSetIndex for read_columns().
+        self._index = index
+        # Decoder statistics, if collected.
+        self._stats = stats
+        # Return markers as DescrMark objects instead of strings.
+        self._mark_objects = mark_objects
+        # Replications of fixed-width elements can be read as one block
+        # (requires numpy, not for compression, back-reference, or tracing).
+        self._block_reads = (fun.np is not None and not self.is_compressed
+                             and not has_backref and not self._trace)
+        # Items already decoded by read_keys() and the generator continuing
+        # after them, for next_data().
+        self._pending = None
+        # Skip the elements' values, only following the descriptors and
+        # reading the values of the descriptors in keep (with compression in
+        # array-mode only).
+        self._skip_values = skip_values and (not self.is_compressed or self._as_array)
+        self._keep = keep
+        if self._skip_values:
+            self.get_val = fun.skip_val_function(self.get_val, self.is_compressed, keep)
+        elif stats is not None:
+            self.get_val = stats.wrap_get_val(self.get_val)
 
     def __str__(self):
         return "Subset #%d/%d, decoding: %s" % (self.subs_num[0],
@@ -112,6 +148,9 @@ class SubsetReader(object):
 
         mark consists of three uppercase letters, a space character, and a
         descriptor or iteration number or "END".
+        If the reader was created with mark_objects=True, mark is a DescrMark
+        object instead, with marker type, descriptor, and count as integers;
+        str(mark) returns the string form.
         When a value for mark is returned, the others items are usually None,
         mark has the meaning:
         - SEQ desc : Following descriptors by expansion of sequence descriptor desc.
@@ -125,38 +164,295 @@ class SubsetReader(object):
         - OPR desc : Operator, which read and returned data values.
         - BMP      : Use the data present bit-map to refer to the data descriptors
                      which immediately precede the operator to which it relates.
-                     The bitmap is returned in the named tuple item 'value'.
+                     The bitmap is returned in the named tuple item 'value',
+                     the numbers of the data entries referred to by the
+                     bitmap (counting from 0 in this subset) in 'quality'.
 
         :yield: collections.namedtuple(desc, mark, value, quality)
                 OR collections.namedtuple(desc, mark, [value, ...], [quality, ...])
         """
+        if self._pending is not None:
+            data, self._pending = self._pending, None
+            return data
+        data = self._next_data()
+        if self._trace:
+            data = self._trace_data(data)
+        if self._stats is not None:
+            data = self._stats.timed("data", data)
+        return data
+
+    def read_keys(self, keys):
+        """Decode the subset until the first value of each descriptor in keys
+        is read, or to the end of the subset.
+
+        The items decoded are kept, next_data() returns them first and
+        continues decoding after them.
+
+        :param keys: set of descriptors.
+        :return: dict {descriptor: value}.
+        """
+        data = self.next_data()
+        head = []
+        values = {}
+        for entry in data:
+            head.append(entry)
+            if entry.mark is None and entry.descr in keys and entry.descr not in values:
+                values[entry.descr] = entry.value
+                if len(values) == len(keys):
+                    break
+        self._pending = chain(head, data)
+        return values
+
+    def skip_rest(self):
+        """Move the bitstream to the end of the subset after read_keys(),
+        skipping the values not decoded yet.
+        """
+        if self._pending is None:
+            raise BufrDecodeError("Skipping the rest of a subset requires read_keys().")
+        self._skip_values = True
+        self.get_val = fun.skip_val_function(self.get_val, self.is_compressed)
+        data, self._pending = self._pending, None
+        for _ in data:
+            pass
+
+    def _trace_data(self, data):
+        """Log each item from the generator data, with the descriptor stack."""
+        logger.debug("SUBSET START")
+        for entry in data:
+            if entry.mark is not None:
+                logger.debug("MARK %s  *%d %d..%d", entry.mark,
+                             len(self._dl), self._di, self._de)
+            else:
+                logger.debug("DATA %06d %s", entry.descr, entry.value)
+            yield entry
+        logger.debug("SUBSET END (%s)", self._blob)
+
+    def decode_subset_compact(self, result=None):
+        """Decode the subset's data into parallel arrays.
+
+        The same items as from next_data() are appended to a CompactSubset,
+        without creating a tuple object for each item.
+
+        :param result: CompactSubset to append to, a new one if None.
+        :return: CompactSubset
+        """
+        if result is None:
+            result = CompactSubset()
+        if self._pending is not None:
+            # Continue after read_keys(), with the items decoded already.
+            for entry in self.next_data():
+                result.append_entry(entry)
+            return result
+        data = self._next_data(result)
+        if self._stats is not None:
+            data = self._stats.timed("data", data)
+        # With a result object given, the generator yields nothing.
+        for _ in data:
+            pass
+        return result
+
+    def read_columns(self, collector, row=None):
+        """Decode the values into column arrays, by descriptor position.
+
+        Other than next_data(), the expanded descriptor list of the
+        collector's plan is walked, the same as SubsetWriter.process_columns()
+        does for encoding, and each value is written to the column array at
+        its position and iteration index.
+        With compression the reader has to be in array-mode, each value set
+        is read for all subsets (in rows, select) at once into an array.
+
+        :param collector: ColumnCollector.
+        :param row: row of this subset in the collector, with compression a
+            slice of the rows for all subsets, default all rows.
+        :raise BufrDecodeError: error that stops decoding.
+        """
+        if self.is_compressed and not self._as_array:
+            raise BufrDecodeError("Column decoding of compressed data requires array-mode.")
+        if self._stats is not None:
+            t = default_timer()
+        self.inprogress = True
+        plan = collector.plan
+        dl = self._dl = plan.desc_list
+        desc_ext = plan.desc_ext
+        elems = plan.elems
+        if row is None:
+            row = slice(None)
+        self._alter = AlterState()
+        # Replication counts per occurrence, {position: [count, ...]}
+        loops = {}
+        # Operator of the current bitmap, (position, index) referred to by
+        # the bitmap, and count of linked values per descriptor
+        oper = present = None
+        linked = {}
+        # Stack for descriptor ranges, items: (start, end, iteration index,
+        # counts of the enclosing replications)
+        stack = [(0, len(dl), (), ())]
+        while len(stack):
+            self._di, self._de, index, dims = stack.pop()
+            while self._di < self._de and self._blob.p < self._data_e:
+                di = self._di
+                descr = dl[di]
+
+                if self._skip_data:
+                    """Data not present: data is limited to class 01-09,31."""
+                    self._skip_data -= 1
+                    if 1000 <= descr < 10000 and descr // 1000 != 31:
+                        self._di += 1
+                        continue
+
+                if fun.descr_is_data(descr):
+                    """Element descriptor, value(s) into the column array."""
+                    elem_b = elems[di]
+                    if elem_b is None:
+                        raise BufrDecodeError("Unknown descriptor '%06d'" % descr)
+                    if self._alter.assoc[-1] and (descr < 31000 or descr > 32000):
+                        # Associated fields are not included in the columns.
+                        self.get_val(self._blob, self.subs_num, fix_width=self._alter.assoc[-1])
+                    dtype = plan.value_dtype(di, self._alter)
+                    if self.is_compressed:
+                        values, missing = fun.get_val_column(self._blob, self.subs_num, elem_b,
+                                                             self._alter, self._rows, self._select,
+                                                             self._index)
+                        if self._stats is not None:
+                            self._stats.values += len(values)
+                            self._stats.missing += int(missing.sum()) if missing is not None \
+                                else sum(1 for v in values if v is None)
+                    else:
+                        values = self.get_val(self._blob, self.subs_num, elem_b, self._alter)
+                        missing = None
+                    collector.put(di, row, index, dims, values, missing, dtype)
+                    if self._do_backref_record:
+                        self._backref_record.append(elem_b, self._alter, (di, index))
+                    if present is not None and oper == 222000 and descr // 1000 == 33:
+                        k = linked.get(descr, 0)
+                        linked[descr] = k + 1
+                        if k < len(present) and present[k] is not None:
+                            ref_pos, ref_index = present[k]
+                            collector.put_linked(di, ref_pos, row, ref_index,
+                                                 values, missing, dtype)
+                    self._di += 1
+
+                elif fun.descr_is_loop(descr):
+                    """Replication descriptor, the iterations go on the stack."""
+                    _, count, is_repetition = self.eval_loop_descr()
+                    if self._stats is not None:
+                        self._stats.replications += 1
+                        self._stats.iterations += count
+                    if not descr % 1000:
+                        collector.put_factor(di + 1, row, index, dims, count)
+                    loops.setdefault(di, []).append(count)
+                    start, end = self._di, desc_ext[di]
+                    stack.append((end, self._de, index, dims))
+                    if is_repetition:
+                        # The repeated values are decoded once.
+                        if count:
+                            stack.append((start, end, index + (0,), dims + (1,)))
+                    else:
+                        for i in range(count - 1, -1, -1):
+                            stack.append((start, end, index + (i,), dims + (count,)))
+                    self._di = self._de
+
+                elif fun.descr_is_oper(descr):
+                    """Operator descriptor, values from operators as well."""
+                    entry = op.eval_oper(self, descr)
+                    if self._stats is not None:
+                        self._stats.operators += 1
+                    if entry is None:
+                        pass
+                    elif entry.mark is None:
+                        collector.put_list(di, row, index, dims, entry.value)
+                        if present is not None and descr in (224255, 225255):
+                            k = linked.get(descr, 0)
+                            linked[descr] = k + 1
+                            if k < len(present) and present[k] is not None:
+                                ref_pos, ref_index = present[k]
+                                collector.put_linked(di, ref_pos, row, ref_index, entry.value)
+                    elif entry.mark.mark == MarkType.BMP_DEF:
+                        collector.put_bitmap(di + 1, row, index, dims, entry.value, loops)
+                        present = entry.quality
+                        linked = {}
+                    elif entry.mark.mark == MarkType.BMP_USE:
+                        present = entry.quality
+                        linked = {}
+                    elif entry.mark.mark == MarkType.OPR:
+                        oper = descr
+                    self._di += 1
+
+                elif fun.descr_is_seq(descr):
+                    """Sequence descriptor, its expansion follows in the list."""
+                    self._di += 1
+
+                else:
+                    """Invalid descriptor, out of defined range."""
+                    raise BufrDecodeError("Descriptor '%06d' invalid!" % descr)
+
+        collector.add_loops(row, loops, self.subs_num[0])
+        self.inprogress = False
+        if self._stats is not None:
+            self._stats.times["data"] += default_timer() - t
+
+    def skip_subset(self):
+        """Move the bitstream to the end of this subset, without decoding values.
+
+        Only the replication counts, bitmaps, and other values required to
+        follow the descriptors are read, the elements' values are skipped.
+        Requires a reader created with skip_values=True.
+        """
+        if not self._skip_values:
+            raise BufrDecodeError("Skipping values requires skip_values=True.")
+        for _ in self._next_data():
+            pass
+
+    def _next_data(self, compact=None):
+        """Generator for Sect. 4 data, see next_data().
+
+        If compact is a CompactSubset, all items are appended to it instead.
+        """
         if self._blob.p < 0 or self._data_e < 0 or self._blob.p >= self._data_e:
             raise BufrDecodeError("Data section start/end not initialised!")
-        logger.debug("SUBSET START")
         self.inprogress = True
+        # Markers are created as DescrMark objects, or directly as strings.
+        if self._mark_objects or compact is not None:
+            make_mark = DescrMark
+            mark_seq_end, mark_rpl_end, mark_rpl_nil, mark_rep_end, mark_rep_nil = MARKS_END
+        else:
+            make_mark = MarkType.format
+            mark_seq_end, mark_rpl_end, mark_rpl_nil, mark_rep_end, mark_rep_nil = MARKS_END_STR
         # Stack for sequence expansion and loops.
-        # Items follow: ([desc,], start, end, mark)
+        # Items follow: ([desc,], start, end, mark, iteration, iterations)
+        # A replication is one item, with iterations > 0 and the current
+        # iteration, instead of one item per iteration.
         stack = []
         # Alterator values, this resets them at the beginning of the iterator.
-        self._alter.reset()
+        self._alter = AlterState()
         # For start put list on stack
-        logger.debug("PUSH start -> *%d %d..%d", len(self._desc), 0, len(self._desc))
-        stack.append((self._desc, 0, len(self._desc), "SUB"))
+        stack.append((self._desc, 0, len(self._desc),
+                      make_mark(MarkType.SUB, None, self.subs_num[0]), 0, 0))
+        # Values of a replication read as one block
+        block = None
+        # Number of data entries, for back-referencing them by bitmaps
+        self._n_data = 0
         while len(stack):
             """Loop while descriptor lists on stack"""
             # dl : current descriptor list
             # di : index for current descriptor list
             # de : stop when reaching this index
-            self._dl, self._di, self._de, mark = stack.pop()
-            logger.debug("POP *%d %d..%d (%s)", len(self._dl), self._di, self._de, mark)
-            yield DescrDataEntry(None, mark, None, None)
-            mark = None
+            self._dl, self._di, self._de, mark, loop_i, loop_n = stack.pop()
+            if loop_n:
+                # Replication: the next iteration goes on stack before
+                # the expansions of this iteration.
+                if loop_i < loop_n:
+                    stack.append((self._dl, self._di, self._de, None, loop_i + 1, loop_n))
+                mark = make_mark(MarkType.RPL_ITER, None, loop_i)
+            if compact is None:
+                yield DescrDataEntry(None, mark, None, None)
+            else:
+                compact.append(mark.descr, mark.mark, mark.count, None, None)
             while self._di < self._de and self._blob.p < self._data_e:
                 """Loop over descriptors in current list"""
 
                 if self._skip_data:
                     """Data not present: data is limited to class 01-09,31"""
-                    logger.debug("skip %d", self._skip_data)
                     self._skip_data -= 1
                     if 1000 <= self._dl[self._di] < 10000 and self._dl[self._di] // 1000 != 31:
                         self._di += 1
@@ -188,55 +484,87 @@ class SubsetReader(object):
                                          elem_b,
                                          self._alter)
                     if self._do_backref_record:
-                        self._backref_record.append(elem_b, self._alter)
+                        self._backref_record.append(elem_b, self._alter, self._n_data)
+                        self._n_data += 1
                     # This is the main yield
-                    yield DescrDataEntry(elem_b.descr, mark, value, qual)
+                    if compact is None:
+                        yield DescrDataEntry(elem_b.descr, None, value, qual)
+                    else:
+                        compact.append(elem_b.descr, MarkType.DATA, None, value, qual)
 
                 elif fun.descr_is_loop(self._dl[self._di]):
                     """Replication descriptor, loop/iterator, replication or repetition"""
                     loop_cause = self._dl[self._di]
                     # Decode loop-descr:
                     loop_amount, loop_count, is_repetition = self.eval_loop_descr()
+                    if self._stats is not None:
+                        self._stats.replications += 1
+                        self._stats.iterations += loop_count
                     # Current list on stack (di points after looped descr)
-                    logger.debug("PUSH jump -> *%d %d..%d", len(self._dl), self._di + loop_amount, self._de)
                     if is_repetition:
                         if loop_count:
-                            stack.append((self._dl, self._di + loop_amount, self._de, "REP END"))
-                            stack.append((self._dl, self._di, self._di + loop_amount, "REP %d" % loop_count))
+                            stack.append((self._dl, self._di + loop_amount, self._de,
+                                          mark_rep_end, 0, 0))
+                            stack.append((self._dl, self._di, self._di + loop_amount,
+                                          make_mark(MarkType.REP_ITER, None, loop_count), 0, 0))
                         else:
-                            stack.append((self._dl, self._di + loop_amount, self._de, "REP NIL"))
+                            stack.append((self._dl, self._di + loop_amount, self._de,
+                                          mark_rep_nil, 0, 0))
+                        mark = make_mark(MarkType.REP, loop_cause, loop_count)
                     else:
-                        ln = loop_count
-                        stack.append((self._dl, self._di + loop_amount, self._de, "RPL %s" % ("END" if ln else "NIL")))
-                        while ln:
-                            # N*list on stack
-                            logger.debug("PUSH loop -> *%d %d..%d", len(self._dl), self._di, self._di + loop_amount)
-                            stack.append((self._dl, self._di, self._di + loop_amount, "RPL %d" % ln))
-                            ln -= 1
-                    yield DescrDataEntry(None,
-                                         "%s %06d *%d" % (
-                                             "REP" if is_repetition else "RPL",
-                                             loop_cause,
-                                             loop_count),
-                                         None,
-                                         None)
+                        stack.append((self._dl, self._di + loop_amount, self._de,
+                                      mark_rpl_end if loop_count else mark_rpl_nil, 0, 0))
+                        if loop_count and self._block_reads:
+                            block = self._read_block(loop_amount, loop_count)
+                        if loop_count and block is None:
+                            # One item for all iterations, starting with the first
+                            stack.append((self._dl, self._di, self._di + loop_amount,
+                                          None, 1, loop_count))
+                        mark = make_mark(MarkType.RPL, loop_cause, loop_count)
+                    if compact is None:
+                        yield DescrDataEntry(None, mark, None, None)
+                    else:
+                        compact.append(loop_cause, mark.mark, loop_count, None, None)
+                    if block is not None:
+                        # All iterations were read as one block.
+                        descrs, columns = block
+                        block = None
+                        for i in range(loop_count):
+                            if compact is None:
+                                yield DescrDataEntry(None, make_mark(MarkType.RPL_ITER, None, i + 1),
+                                                     None, None)
+                                for descr, column in zip(descrs, columns):
+                                    yield DescrDataEntry(descr, None, column[i], None)
+                            else:
+                                compact.append(None, MarkType.RPL_ITER, i + 1, None, None)
+                                for descr, column in zip(descrs, columns):
+                                    compact.append(descr, MarkType.DATA, None, column[i], None)
                     # Causes inner while to end
                     self._di = self._de
 
                 elif fun.descr_is_oper(self._dl[self._di]):
                     """Operator descritor, alter/modify properties"""
                     value = op.eval_oper(self, self._dl[self._di])
-                    if value is not None:
+                    if self._stats is not None:
+                        self._stats.operators += 1
+                    if value is not None and value.mark is None and self._do_backref_record:
+                        # A value from an operator is a data entry as well
+                        self._n_data += 1
+                    if value is None:
+                        pass
+                    elif compact is None:
                         # If the operator returned a value, yield it
+                        if value.mark is not None and not self._mark_objects:
+                            value = value._replace(mark=str(value.mark))
                         yield value
+                    else:
+                        compact.append_entry(value)
                     self._di += 1
 
                 elif fun.descr_is_seq(self._dl[self._di]):
                     """Sequence descriptor, replaces current descriptor with expansion"""
-                    logger.debug("SEQ %06d", self._dl[self._di])
                     # Current on stack
-                    logger.debug("PUSH jump -> *%d %d..%d", len(self._dl), self._di + 1, self._de)
-                    stack.append((self._dl, self._di + 1, self._de, "SEQ END"))
+                    stack.append((self._dl, self._di + 1, self._de, mark_seq_end, 0, 0))
                     prevdesc = self._dl[self._di]
                     # Sequence from tabD
                     try:
@@ -244,8 +572,8 @@ class SubsetReader(object):
                     except KeyError as e:
                         raise BufrDecodeError("Unknown descriptor {}".format(e))
                     # Expansion on stack
-                    logger.debug("PUSH seq -> *%d %d..%d", len(self._dl), 0, len(self._dl))
-                    stack.append((self._dl, 0, len(self._dl), "SEQ %06d" % prevdesc))
+                    stack.append((self._dl, 0, len(self._dl),
+                                  make_mark(MarkType.SEQ, prevdesc, None), 0, 0))
                     # Causes inner while to end
                     self._di = self._de
 
@@ -254,10 +582,82 @@ class SubsetReader(object):
                     raise BufrDecodeError("Descriptor '%06d' invalid!" % self._dl[self._di])
 
         self.inprogress = False
-        logger.debug("SUBSET END (%s)" % self._blob)
         #raise StopIteration # XXX:
         return
 
+    def _read_block(self, loop_amount, loop_count):
+        """Read all iterations of a replication as one block.
+
+        This is possible if the replicated descriptors are all numeric
+        elements with fixed width, not altered by operators other than IEEE
+        floating point representation (209YYY).
+
+        :return: (list of descriptors, list of value lists per descriptor),
+                 or None if the block has to be decoded value by value.
+        """
+        ieee = self._alter.ieee
+        if (loop_amount * loop_count < SubsetReader.BLOCK_MIN_VALUES
+                or self._skip_data or self._alter is not AlterState(ieee=ieee)):
+            return None
+        elems = []
+        widths = []
+        for descr in self._dl[self._di:self._di + loop_amount]:
+            elem_b = self._tables.tab_b.get(descr) if fun.descr_is_data(descr) else None
+            if elem_b is None or elem_b.typ == TabBType.STRING:
+                return None
+            if ieee and elem_b.typ in (TabBType.DOUBLE, TabBType.LONG):
+                widths.append(ieee)
+            else:
+                widths.append(elem_b.width)
+            elems.append(elem_b)
+        bit_pos = self._blob.get_point() * 8 + self._blob.get_bitcons()
+        if bit_pos + sum(widths) * loop_count > self._data_e * 8:
+            return None
+        if self._skip_values and not any(elem_b.descr in self._keep for elem_b in elems):
+            self._blob.read_skip(sum(widths) * loop_count)
+            return [elem_b.descr for elem_b in elems], [[None] * loop_count] * loop_amount
+        if ieee and all(width == ieee for width in widths):
+            # Rows of IEEE values only, read as big-endian words.
+            rvals = fun.np.frombuffer(self._blob.read_octets(sum(widths) * loop_count // 8),
+                                      dtype=">u%d" % (ieee // 8)).reshape(loop_count, loop_amount)
+            rvals = [rvals[:, i] for i in range(loop_amount)]
+        elif max(widths) < 64:
+            rvals = self._blob.read_uint_block(widths, loop_count)
+        else:
+            return None
+        columns = [fun.ieee2num_array(rval, width)
+                   if ieee and elem_b.typ in (TabBType.DOUBLE, TabBType.LONG)
+                   else fun.rval2num_array(elem_b, rval)
+                   for elem_b, width, rval in zip(elems, widths, rvals)]
+        if self._stats is not None:
+            self._stats.values += loop_amount * loop_count
+            self._stats.missing += sum(column.count(None) for column in columns)
+        return [elem_b.descr for elem_b in elems], columns
+
+    def _read_bitmap(self, count):
+        """Read a data present bitmap of count bits.
+
+        With numpy the bitmap is read at once into a boolean array, one row
+        per subset if compressed. Otherwise, or if tracing, it is read bit by
+        bit.
+
+        :return: list of 0|1, for this subset or the first in array-mode.
+        """
+        bit_pos = self._blob.get_point() * 8 + self._blob.get_bitcons()
+        if (fun.np is None or self._trace
+                or bit_pos + count * (7 if self.is_compressed else 1) > self._data_e * 8):
+            if self._as_array:
+                return [self.get_val(self._blob, self.subs_num, fix_width=1)[0]
+                        for _ in range(count)]
+            return [self.get_val(self._blob, self.subs_num, fix_width=1)
+                    for _ in range(count)]
+        bitmap = fun.bitmap2array(self._blob, count, self.is_compressed, self.subs_num[1])
+        if self.is_compressed:
+            bitmap = bitmap[max(self.subs_num[0], 0)]
+        if self._stats is not None:
+            self._stats.values += count
+        return bitmap.astype(int).tolist()
+
     def eval_loop_descr(self, record=True):
         """Evaluate descriptor for replication/repetition.
 
@@ -292,14 +692,9 @@ class SubsetReader(object):
             is_rep = 31010 <= elem_b.descr <= 31012
             if record and self._do_backref_record:
                 self._backref_record.append(elem_b, None)
-            logger.debug("%s %d %d -> %d from %06d",
-                         "REPT" if is_rep else "LOOP",
-                         loop_amnt, 0, loop_num, elem_b.descr)
             self._di += 1
             if loop_num == 255:
                 loop_num = 0
-        else:
-            logger.debug("LOOP %d %d" % (loop_amnt, loop_num))
         return loop_amnt, loop_num, is_rep
 
     def _read_refval(self):
@@ -328,7 +723,7 @@ class SubsetReader(object):
             if self._dl[self._di] > 200000 and self._dl[self._di] % 1000 == 255:
                 # YYY==255 is signal-of-end
                 break
-        self._alter.refval = rl
+        self._alter = self._alter.replace(refval=rl)
 
 
 class SubsetWriter():
@@ -366,6 +761,8 @@ class SubsetWriter():
         self._di = self._de = 0
         self._vl = []
         self._vi = 0
+        # Values are taken from column arrays, instead of lists per subset
+        self._as_columns = False
         # Method for writing a value to the bistream, depends on compression
         self.add_val = fun.add_val_comp if self.is_compressed else fun.add_val
 
@@ -487,7 +884,7 @@ class SubsetWriter():
                                  len(self._dl), self._di + lm, self._de, self._vi + 1)
                     if is_repetition:
                         stack.append((self._dl, self._di + lm, self._de, self._vl, self._vi + 1))
-                        if ln:
+                        if loop_count:
                             stack.append((self._dl, self._di, self._di + lm, loop_lists[0], 0))
                     else:
                         stack.append((self._dl, self._di + lm, self._de, self._vl, self._vi + 1))
@@ -530,6 +927,176 @@ class SubsetWriter():
             self._blob.write_align(even=False)
             logger.debug("PADDING -> %d/%d", len(self._blob) // 8, len(self._blob) % 8)
 
+    def process_columns(self, columns, loops=None, descr_plan=None):
+        """Write all subsets from column arrays, for compressed BUFR only.
+
+        Other than process(), which takes a list of values per subset, the
+        values are taken from arrays holding the values of all subsets.
+        The descriptor position is the index in the expanded descriptor list
+        (see get_descr_list()), for replicated descriptors the column arrays
+        have one more dimension per replication, i.e. (subsets, iterations).
+
+        The replication count for a delayed replication is either set in loops,
+        as an int or a list with one count per occurrence of the replication,
+        or is taken from the shape of a column array in the replication.
+
+        Missing values are either masked (numpy.ma), NaN, or None; a missing
+        column is encoded as "missing value" for all subsets.
+
+        :param columns: dict {position: array}.
+        :param loops: dict {position: count} for replication descriptors.
+        :param descr_plan: tuple (expanded descriptor list, extents), if
+            already evaluated with get_descr_list() and get_descr_extents().
+        """
+        if not self.is_compressed:
+            raise BufrEncodeError("Column encoding requires compression.")
+        if fun.np is None:
+            raise BufrEncodeError("Column encoding requires numpy.")
+        self._as_columns = True
+        self.add_val = fun.add_val_column
+        self._loops = loops or {}
+        self._loops_seen = {}
+        if descr_plan is None:
+            self._dl, _ = fun.get_descr_list(self._tables, self._desc)
+            self._desc_ext = fun.get_descr_extents(self._tables, self._dl)
+        else:
+            self._dl, self._desc_ext = descr_plan
+        self._alter = AlterState()
+        self._vl = ColumnView(columns, self.subs_num)
+        # Stack for loops, items follow: (start, end, iteration index)
+        stack = [(0, len(self._dl), ())]
+        while len(stack):
+            """Loop while descriptor ranges on stack."""
+            self._di, self._de, self._vl.index = stack.pop()
+            logger.debug("POP %d..%d %s", self._di, self._de, self._vl.index)
+            while self._di < self._de:
+                """Loop over descriptors in current range."""
+                # Position of descriptor is index for column arrays.
+                self._vi = self._di
+
+                if self._skip_data:
+                    """Data not present: data is limited to class 01-09,31."""
+                    self._skip_data -= 1
+                    if 1000 <= self._dl[self._di] < 10000 and self._dl[self._di] // 1000 != 31:
+                        self._di += 1
+                        continue
+
+                if fun.descr_is_data(self._dl[self._di]):
+                    """Element descriptor, encoding column to bits."""
+                    logger.debug("ENCODE %06d #%d", self._dl[self._di], self._di)
+                    if self._alter.assoc[-1] and (self._dl[self._di] < 31000 or self._dl[self._di] > 32000):
+                        raise BufrEncodeError("Associated fields not supported with column encoding.")
+                    try:
+                        elem_b = self._tables.tab_b[self._dl[self._di]]
+                    except KeyError as e:
+                        raise BufrEncodeError("Unknown descriptor {}".format(e))
+                    self.add_val(self._blob, self._vl, self._di, tab_b_elem=elem_b, alter=self._alter)
+                    if self._do_backref_record:
+                        self._backref_record.append(elem_b, self._alter)
+                    self._di += 1
+
+                elif fun.descr_is_loop(self._dl[self._di]):
+                    """Replication/repetition."""
+                    loop_end = self._desc_ext[self._di]
+                    loop_count, loop_start = self._column_loop_count(self._di)
+                    is_repetition = False
+                    if loop_start > self._di + 1:
+                        # Delayed replication, write the replication factor.
+                        try:
+                            elem_b = self._tables.tab_b[self._dl[self._di + 1]]
+                        except KeyError as e:
+                            raise BufrEncodeError("Unknown descriptor {}".format(e))
+                        self.add_val(self._blob, loop_count, self.subs_num, tab_b_elem=elem_b)
+                        # Descriptors 31011+31012 mean repetition, not replication
+                        is_repetition = 31010 <= elem_b.descr <= 31012
+                        if self._do_backref_record:
+                            self._backref_record.append(elem_b, None)
+                    logger.debug("%s %06d * %d", "REPT" if is_repetition else "LOOP",
+                                 self._dl[self._di], loop_count)
+                    # Current range on stack (after replicated descriptors)
+                    stack.append((loop_end, self._de, self._vl.index))
+                    if is_repetition:
+                        if loop_count:
+                            stack.append((loop_start, loop_end, self._vl.index + (0,)))
+                    else:
+                        for i in range(loop_count - 1, -1, -1):
+                            stack.append((loop_start, loop_end, self._vl.index + (i,)))
+                    self._di = self._de
+
+                elif fun.descr_is_oper(self._dl[self._di]):
+                    """Operator descritor, alter/modify properties."""
+                    op.prep_oper(self, self._dl[self._di])
+                    self._di += 1
+
+                elif fun.descr_is_seq(self._dl[self._di]) or fun.descr_is_nil(self._dl[self._di]):
+                    """Sequence descriptor, its expansion follows in the list."""
+                    self._di += 1
+
+                else:
+                    """Invalid descriptor, out of defined range."""
+                    raise BufrEncodeError("Descriptor '%06d' invalid!" % self._dl[self._di])
+
+        # Add padding bytes if required
+        if self.edition <= 3:
+            self._blob.write_align(even=False)
+            logger.debug("PADDING -> %d/%d", len(self._blob) // 8, len(self._blob) % 8)
+
+    def _column_loop_count(self, di, peek=False):
+        """Column encoding: determine the replication count.
+
+        :param di: position of the replication descriptor.
+        :param peek: don't count this as occurrence of the replication.
+        :return: replication count, position of first replicated descriptor.
+        """
+        loop_start = di + 1 if self._dl[di] % 1000 else di + 2
+        if self._dl[di] % 1000:
+            return self._dl[di] % 1000, loop_start
+        count = self._loops.get(di)
+        if isinstance(count, (list, tuple)):
+            seen = self._loops_seen.get(di, 0)
+            if not peek:
+                self._loops_seen[di] = seen + 1
+            count = count[seen]
+        if count is None and self._vl[di + 1] is not None:
+            # Take the count from the column of the replication factor.
+            factor = fun.np.ma.compressed(fun.np.ma.masked_invalid(
+                fun.np.ma.asarray(self._vl[di + 1], dtype=float)))
+            if len(factor):
+                count = factor[0]
+        if count is None:
+            # Take the count from the shape of a replicated column array.
+            dim = len(self._vl.index) + 1
+            for i in range(loop_start, self._desc_ext[di]):
+                shape = fun.np.shape(self._vl.columns.get(i))
+                if len(shape) > dim:
+                    count = shape[dim]
+                    break
+            else:
+                raise BufrEncodeError("No replication count for descriptor %06d at #%d."
+                                      % (self._dl[di], di))
+        return int(count), loop_start
+
+    def _column_bitmap(self):
+        """Column encoding: get the bitmap from the 031031 columns, which
+        follow the descriptor defining the bitmap.
+
+        The values of the first subset are taken as bitmap.
+        """
+        di = self._di + 1
+        if fun.descr_is_loop(self._dl[di]):
+            loop_count, loop_start = self._column_loop_count(di, peek=True)
+            column = self._vl.columns.get(loop_start)
+            if column is None:
+                raise BufrEncodeError("No bitmap at #%d." % loop_start)
+            column = fun.np.asarray(column)
+            bitmap = [int(column[(0,) + self._vl.index + (i,)]) for i in range(loop_count)]
+        else:
+            bitmap = []
+            while self._dl[di] == 31031:
+                bitmap.append(int(fun.np.asarray(self._vl[di])[0]))
+                di += 1
+        return bitmap
+
     def _write_refval(self):
         """Set new reference values.
 
@@ -540,6 +1107,8 @@ class SubsetWriter():
 
         :return: number of new reference values
         """
+        if self._as_columns:
+            raise BufrEncodeError("New reference values not supported with column encoding.")
         if self.is_compressed:
             lst = [x[self._vi] for x in self._vl]
         else:
@@ -556,4 +1125,4 @@ class SubsetWriter():
             rl[self._dl[self._di]] = lst[self._vi]
             self.add_val(self._blob, val, 0, fix_width=an)
             self._di += 1
-        self._alter.refval = rl
+        self._alter = self._alter.replace(refval=rl)
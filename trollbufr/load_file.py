@@ -26,6 +26,7 @@ Created on Oct 27, 2016
 
 @author: amaul
 '''
+import json
 import re
 from trollbufr.coder import functions as f
 from trollbufr.coder.bdata import Blob
@@ -101,6 +102,66 @@ def next_bufr(path=None, bin_data=None):
     return
 
 
+def next_json(path, chunk_size=1 << 20):
+    """
+    Generator:
+    Load JSON file with a list of BUFR-JSON objects chunk-wise, parse one
+    list element after the other.
+
+    Each element is parsed from the offset after the previous one; the
+    parsed part of the buffer is dropped when the next chunk is read. An
+    element not complete in the buffer is parsed again after reading at
+    least as much as the buffer holds, so the file is parsed in linear time.
+
+    RETURN: JSON object of one list element
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r") as fh:
+        logger.info("FILE %s" % path)
+        buf = ""
+        pos = 0
+        eof = False
+        in_list = False
+        while True:
+            pos = _json_skip(buf, pos)
+            obj = end = None
+            if pos < len(buf):
+                if not in_list:
+                    if buf[pos] != "[":
+                        raise ValueError("JSON file %s is not a list!" % path)
+                    in_list = True
+                    pos += 1
+                    continue
+                if buf[pos] == "]":
+                    return
+                if buf[pos] == ",":
+                    pos += 1
+                    continue
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    end = None
+            if end is None or (end == len(buf) and not eof):
+                # Incomplete element (or a number possibly cut), read more data
+                if eof:
+                    raise ValueError("JSON file %s is incomplete!" % path)
+                # Grow buffer at least by its size, for large elements
+                chunk = fh.read(max(chunk_size, len(buf) - pos))
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            pos = end
+            yield obj
+
+
+def _json_skip(buf, pos):
+    """Skip white-space in buf, return new position."""
+    while pos < len(buf) and buf[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
 if __name__ == "__main__":
     import sys
     print(sys.argv)
@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 trollbufr developers
+#
+# Author(s):
+#
+#   trollbufr developers
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+trollbufr.synthetic
+===================
+Generator for synthetic BUFR, for performance and regression testing.
+
+The BUFR are created as JSON objects with random values and encoded with
+:meth:`trollbufr.bufr.Bufr.encode`. The same seed creates the same BUFR.
+
+Configurable are the number of subsets, compression, depth of nested delayed
+replications, string values, operators (201, 202, 207, 222, 236, 237), and
+the number of BUFR per file.
+
+Command-line::
+
+    python -m trollbufr.synthetic -t tables -T bufrdc -n 10 -s 10000 -c \\
+        -d 2 -O 201,202,207,222,237 -o synthetic.bufr
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import sys
+import os
+import random
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from trollbufr.bufr import Bufr
+from trollbufr.coder import load_tables
+from trollbufr.coder.bufr_types import TabBType
+
+import logging
+logger = logging.getLogger("trollbufr")
+
+"""Supported operators, by their "XX" part."""
+OPERATORS = (201, 202, 207, 222, 236, 237)
+
+"""Value ranges for the element descriptors."""
+VALUE_RANGES = {4001: (2000, 2030),
+                4002: (1, 12),
+                4003: (1, 28),
+                4004: (0, 23),
+                4005: (0, 59),
+                5001: (-90.0, 90.0),
+                6001: (-180.0, 180.0),
+                7004: (1000.0, 105000.0),
+                10004: (50000.0, 105000.0),
+                11001: (0, 359),
+                11002: (0.0, 60.0),
+                12101: (190.0, 320.0),
+                33007: (0, 100),
+                }
+
+"""Characters for string values, no space since trailing ones are not decoded."""
+STRING_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+
+class SyntheticBufr(object):
+    """Creates synthetic BUFR from a generated descriptor template."""
+
+    def __init__(self, tab_fmt, tab_path,
+                 subsets=100,
+                 compress=True,
+                 depth=1,
+                 replications=5,
+                 strings=True,
+                 operators=(),
+                 missing=0.05,
+                 edition=4,
+                 seed=0):
+        """Set up descriptor template and tables.
+
+        :param tab_fmt: format of tables.
+        :param tab_path: path to tables.
+        :param subsets: number of subsets per BUFR.
+        :param compress: create BUFR with compression.
+        :param depth: depth of nested delayed replications, 0: none.
+        :param replications: max. number of iterations per replication.
+        :param strings: add string values.
+        :param operators: list of operators, from OPERATORS.
+        :param missing: fraction of values set as "missing".
+        :param edition: BUFR edition, 3 or 4.
+        :param seed: seed for the random values.
+        """
+        operators = set(int(o) for o in operators)
+        if not operators <= set(OPERATORS):
+            raise ValueError("Operators not supported: %s" %
+                             ",".join(str(o) for o in sorted(operators - set(OPERATORS))))
+        # Quality information (222) requires a bitmap (236), re-use (237) a defined one.
+        if operators & set((222, 236, 237)):
+            operators |= set((222, 236))
+        self.subsets = subsets
+        self.compress = compress
+        self.depth = depth
+        self.replications = replications
+        self.strings = strings
+        self.operators = operators
+        self.missing = missing
+        self.edition = edition
+        self.seed = seed
+        self._sect1 = {3: [0, 0, 78, 0, False, 0, 0, 13, 0],
+                       4: [0, 78, 0, 0, False, 0, 0, 0, 13, 0],
+                       }[edition]
+        self._table_cache = load_tables.TableCache(tab_path, tab_fmt)
+        self._tables = self._table_cache.load(0, 78, 0, 13, 0)
+        self._tab_fmt = tab_fmt
+        self._tab_path = tab_path
+        rnd = random.Random(seed)
+        self._descr, self._plan = self._make_template(rnd)
+
+    def __str__(self):
+        return "SyntheticBufr ed.%d subsets:%d compression:%s depth:%d operators:%s" % (
+            self.edition, self.subsets, self.compress, self.depth,
+            ",".join(str(o) for o in sorted(self.operators)))
+
+    def get_descr(self):
+        """Descriptors for section 3."""
+        return list(self._descr)
+
+    def _make_template(self, rnd):
+        """Create the descriptor list for section 3 and a plan for the values.
+
+        The plan is a list of (kind, descr, alteration), with kind:
+        "v" value, "s" string, "b" bitmap, "q" quality list, "l" loop, where
+        the loop has a sub-plan instead of alteration.
+        """
+        descr = []
+        plan = []
+
+        def elem(d, scale_diff=0):
+            descr.append("%06d" % d)
+            plan.append(("v", d, scale_diff))
+
+        if self.strings:
+            descr.append("001015")
+            plan.append(("s", 1015, 20))
+        for d in (4001, 4002, 4003, 4004, 4005, 5001, 6001):
+            elem(d)
+        if 201 in self.operators:
+            # Width + 2 bit
+            descr.append("201130")
+            elem(10004)
+            descr.append("201000")
+        else:
+            elem(10004)
+        if 202 in self.operators:
+            # Scale - 1
+            descr.append("202127")
+            elem(11002, -1)
+            descr.append("202000")
+        else:
+            elem(11002)
+        if 207 in self.operators:
+            # Scale + 1, with reference value and width increased accordingly
+            descr.append("207001")
+            elem(12101, 1)
+            descr.append("207000")
+        else:
+            elem(12101)
+        elem(11001)
+        if 222 in self.operators:
+            # Bitmap for the last elements, 0: quality information present.
+            bitmap_len = len([p for p in plan if p[0] in "vs"])
+            bitmap = [rnd.randint(0, 1) for _ in range(bitmap_len)]
+            descr.extend(["222000", "236000", "101000", "031002", "031031"])
+            plan.append(("b", 31031, bitmap))
+            elem(1031)
+            elem(1032)
+            descr.extend(["101000", "031002", "033007"])
+            plan.append(("q", 33007, bitmap.count(0)))
+            if 237 in self.operators:
+                # Re-use bitmap, quality information without replication.
+                descr.extend(["222000", "237000"])
+                for _ in range(bitmap.count(0)):
+                    elem(33007)
+                descr.append("237255")
+        if self.depth > 0:
+            loop_descr, loop_plan = self._make_loop(1)
+            descr.extend(loop_descr)
+            plan.append(("l", None, loop_plan))
+        return descr, plan
+
+    def _make_loop(self, level):
+        """Create nested delayed replication, return descriptors and plan."""
+        body = ["007004", "012101", "011001"]
+        plan = [("v", 7004, 0), ("v", 12101, 0), ("v", 11001, 0)]
+        if self.strings and level == self.depth:
+            body.append("001015")
+            plan.append(("s", 1015, 20))
+        if level < self.depth:
+            sub_descr, sub_plan = self._make_loop(level + 1)
+            body.extend(sub_descr)
+            plan.append(("l", None, sub_plan))
+        return ["1%02d000" % len(body), "031001"] + body, plan
+
+    def make_json(self, index=0):
+        """Create JSON object for BUFR number index.
+
+        :return: JSON object
+        """
+        rnd = random.Random(self.seed * 1000003 + index)
+        dt = [2020, 1 + index % 12, 1 + index % 28, index % 24, index % 60, 0]
+        if self.compress:
+            # All subsets have the same replication counts.
+            shape = self._make_shape(rnd, self._plan)
+            data = [self._make_values(rnd, self._plan, shape)
+                    for _ in range(self.subsets)]
+        else:
+            data = [self._make_values(rnd, self._plan, self._make_shape(rnd, self._plan))
+                    for _ in range(self.subsets)]
+        return [["BUFR", self.edition],
+                self._sect1 + dt,
+                [],
+                [self.subsets, True, self.compress, self.get_descr()],
+                data,
+                ["7777"]]
+
+    def _make_shape(self, rnd, plan):
+        """Replication counts for all (nested) loops in plan."""
+        shape = []
+        for kind, _, sub_plan in plan:
+            if kind == "l":
+                n = rnd.randint(0, self.replications)
+                shape.append([self._make_shape(rnd, sub_plan) for _ in range(n)])
+        return shape
+
+    def _make_values(self, rnd, plan, shape):
+        """Values for one subset following plan, replications as in shape."""
+        values = []
+        loops = iter(shape)
+        for kind, d, arg in plan:
+            if kind == "v":
+                values.append(self._make_value(rnd, d, arg))
+            elif kind == "s":
+                if rnd.random() < self.missing:
+                    values.append(None)
+                else:
+                    values.append("".join(rnd.choice(STRING_CHARS)
+                                          for _ in range(rnd.randint(1, arg))))
+            elif kind == "b":
+                values.append([[b] for b in arg])
+            elif kind == "q":
+                values.append([[self._make_value(rnd, d)] for _ in range(arg)])
+            elif kind == "l":
+                values.append([self._make_values(rnd, arg, sub_shape)
+                               for sub_shape in next(loops)])
+        return values
+
+    def _make_value(self, rnd, descr, scale_diff=0):
+        """Random value for element descriptor, rounded to its scale."""
+        if rnd.random() < self.missing:
+            return None
+        elem_b = self._tables.tab_b[descr]
+        if elem_b.typ in (TabBType.CODE, TabBType.FLAG):
+            return rnd.randint(0, (1 << elem_b.width) - 2)
+        lo, hi = VALUE_RANGES[descr]
+        scale = elem_b.scale + scale_diff
+        value = round(rnd.uniform(lo, hi) * 10 ** scale) / 10.0 ** scale
+        if scale <= 0:
+            return int(value)
+        return value
+
+    def make_bufr(self, index=0):
+        """Create and encode BUFR number index.
+
+        :return: BUFR, a byte array object
+        """
+        return Bufr(self._tab_fmt, self._tab_path,
+                    table_cache=self._table_cache).encode(self.make_json(index))
+
+    def write(self, path, messages=1):
+        """Write a file with number of BUFR.
+
+        :return: size of file.
+        """
+        size = 0
+        with open(path, "wb") as fh_out:
+            for i in range(messages):
+                bin_data = self.make_bufr(i)
+                fh_out.write(bin_data)
+                size += len(bin_data)
+        logger.info("FILE %s %d BUFR %d B", path, messages, size)
+        return size
+
+
+def run(argv=None):
+    '''Command line options.'''
+    parser = ArgumentParser(description=__doc__,
+                            formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument("-t", "--tables_path",
+                        default=os.getenv("BUFR_TABLES"),
+                        help="path to tables, if not set in $BUFR_TABLES",
+                        metavar="path")
+    parser.add_argument("-T", "--tables_type",
+                        default=load_tables.list_parser()[0],
+                        choices=load_tables.list_parser(),
+                        help="type of table format [%s], default: %s" % (
+                            "|".join(load_tables.list_parser()),
+                            load_tables.list_parser()[0]),
+                        metavar="name")
+    parser.add_argument("-o", "--output", dest="out_file", required=True,
+                        metavar="file",
+                        help="write BUFR to file")
+    parser.add_argument("-n", "--messages", type=int, default=1,
+                        help="number of BUFR [default: 1]")
+    parser.add_argument("-s", "--subsets", type=int, default=100,
+                        help="number of subsets per BUFR [default: 100]")
+    parser.add_argument("-c", "--compress", action="store_true",
+                        help="create BUFR with compression")
+    parser.add_argument("-d", "--depth", type=int, default=1,
+                        help="depth of nested delayed replications [default: 1]")
+    parser.add_argument("-r", "--replications", type=int, default=5,
+                        help="max. iterations per replication [default: 5]")
+    parser.add_argument("--no-strings", dest="strings", action="store_false",
+                        help="no string values")
+    parser.add_argument("-O", "--operators", default="",
+                        help="operators, comma-separated list of %s" %
+                        ",".join(str(o) for o in OPERATORS))
+    parser.add_argument("-m", "--missing", type=float, default=0.05,
+                        help="fraction of missing values [default: 0.05]")
+    parser.add_argument("-e", "--edition", type=int, default=4, choices=(3, 4),
+                        help="BUFR edition [default: 4]")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed for random values [default: 0]")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARN)
+    if args.tables_path is None:
+        sys.stderr.write("No path to tables given!\n")
+        return 1
+    generator = SyntheticBufr(args.tables_type, args.tables_path,
+                              subsets=args.subsets,
+                              compress=args.compress,
+                              depth=args.depth,
+                              replications=args.replications,
+                              strings=args.strings,
+                              operators=[o for o in args.operators.split(",") if o],
+                              missing=args.missing,
+                              edition=args.edition,
+                              seed=args.seed)
+    size = generator.write(args.out_file, args.messages)
+    print("%s: %d BUFR, %d B" % (generator, args.messages, size))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
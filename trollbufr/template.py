@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 trollbufr developers
+#
+# Author(s):
+#
+#   trollbufr developers
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+trollbufr.template.BufrTemplate
+===============================
+Encoder template for many BUFR with the same sections 0 to 3.
+
+The sections 0, 1, 2, and 3 are encoded once, the descriptors are expanded
+against the loaded tables. Encoding a new BUFR only sets the variable fields
+-- update sequence number, date/time, number of subsets -- and encodes the
+data section 4.
+"""
+import copy
+import json
+import struct
+from trollbufr.bufr import Bufr
+from trollbufr.coder import bufr_sect as sect
+from trollbufr.coder.subset import SubsetWriter
+from trollbufr.coder.bdata import Blob
+from trollbufr.coder.functions import dtg2str, get_descr_list, get_descr_extents
+from trollbufr.coder.errors import BufrEncodeError
+import logging
+
+logger = logging.getLogger("trollbufr")
+
+"""Octet offsets of the variable fields in section 1, per edition:
+(update sequence number, date/time, length of date/time)."""
+SECT1_OFFSETS = {3: (6, 12, 5),
+                 4: (8, 15, 7),
+                 }
+
+
+class BufrTemplate(object):
+    """Encodes BUFR with fixed sections 0-3 from a pre-rendered template."""
+
+    def __init__(self, tab_fmt, tab_path, json_head, table_cache=None):
+        """Encode sections 0-3 and load the tables.
+
+        :param tab_fmt: format of tables.
+        :param tab_path: path to tables.
+        :param json_head: JSON object with (at least) sections 0 to 3, as for
+            Bufr.encode().
+        :param table_cache: TableCache to share between templates, optional.
+        """
+        self.key = BufrTemplate.head_key(json_head)
+        bufr = Bufr(tab_fmt, tab_path, table_cache=table_cache)
+        bin_data = Blob()
+        # Encoding section 1 might alter the JSON object, use a copy.
+        sect_start = bufr._encode_head(bin_data, copy.deepcopy(json_head[:4]),
+                                       load_tables=True)
+        self._head = bin_data.get_bytes()
+        self._tables = bufr.get_tables()
+        self._desc = bufr._desc
+        self._has_backref = bufr._has_backref_oper
+        self._descr_plan = None
+        self.edition = bufr.edition
+        self.is_compressed = bufr.is_compressed
+        self.subsets = bufr.subsets
+        # Octet offsets of the variable fields in the pre-rendered head.
+        upd_offs, dtg_offs, self._dtg_len = SECT1_OFFSETS[self.edition]
+        self._upd_offs = sect_start[1] + upd_offs
+        self._dtg_offs = sect_start[1] + dtg_offs
+        self._subs_offs = sect_start[3] + 4
+
+    def __str__(self):
+        return "BufrTemplate ed.%d %s, compression:%s" % (
+            self.edition, ",".join("%06d" % d for d in self._desc), self.is_compressed)
+
+    @staticmethod
+    def head_key(json_data):
+        """Key identifying the fixed part of sections 0-3 in a JSON object.
+
+        BUFR with the same key can be encoded with the same template.
+
+        :param json_data: JSON object with (at least) sections 0 to 3.
+        :return: string.
+        """
+        sect1 = json_data[1]
+        if isinstance(sect1, dict):
+            sect1 = dict((k, v) for k, v in sect1.items()
+                         if k not in ("update", "datetime"))
+        else:
+            if isinstance(sect1[-1], (list, tuple)):
+                sect1 = list(sect1[:3]) + list(sect1[4:-7]) + [sect1[-1]]
+            else:
+                sect1 = list(sect1[:3]) + list(sect1[4:-6])
+        return json.dumps([json_data[0], sect1, json_data[2], json_data[3][1:]],
+                          sort_keys=True)
+
+    def get_tables(self):
+        return self._tables
+
+    def encode(self, data, subsets=None, datetime=None, update=None):
+        """Encode a BUFR with values from the lists per subset.
+
+        :param data: list of subsets, as section 4 for Bufr.encode().
+        :param subsets: number of subsets, default: length of data.
+        :param datetime: date/time list (y, m, d, H, M, S), default as template.
+        :param update: update sequence number, default as template.
+        :return: BUFR, a byte array object
+        """
+        if subsets is None:
+            subsets = len(data)
+        subset_writer, bin_data = self._data_writer(subsets)
+        subset_writer.process(data)
+        return self._render(bin_data, subsets, datetime, update)
+
+    def encode_columns(self, columns, subsets=None, loops=None, datetime=None, update=None):
+        """Encode a compressed BUFR with values from column arrays.
+
+        :param columns: dict {position: array}, as for Bufr.encode_columns().
+        :param subsets: number of subsets, default as template.
+        :param loops: dict {position: count}, optional.
+        :param datetime: date/time list (y, m, d, H, M, S), default as template.
+        :param update: update sequence number, default as template.
+        :return: BUFR, a byte array object
+        """
+        if not self.is_compressed:
+            raise BufrEncodeError("Column encoding requires compression.")
+        if subsets is None:
+            subsets = self.subsets
+        if self._descr_plan is None:
+            dl, _ = get_descr_list(self._tables, self._desc)
+            self._descr_plan = (dl, get_descr_extents(self._tables, dl))
+        subset_writer, bin_data = self._data_writer(subsets)
+        subset_writer.process_columns(columns, loops, descr_plan=self._descr_plan)
+        return self._render(bin_data, subsets, datetime, update)
+
+    def encode_json(self, json_data):
+        """Encode a JSON object, its sections 0-3 must match the template.
+
+        :param json_data: JSON object, as for Bufr.encode().
+        :return: BUFR, a byte array object
+        """
+        if len(json_data) != 6:
+            raise BufrEncodeError("JSON data has %d sections (not 6)." % len(json_data))
+        sect1 = json_data[1]
+        if isinstance(sect1, dict):
+            update, datetime = sect1["update"], sect1["datetime"]
+        else:
+            if isinstance(sect1[-1], (list, tuple)):
+                sect1 = sect1[:-1]
+            update, datetime = sect1[3], sect1[-6:]
+        return self.encode(json_data[4],
+                           subsets=json_data[3][0],
+                           datetime=datetime,
+                           update=update)
+
+    def _data_writer(self, subsets):
+        """Start section 4 in a new bitstream.
+
+        :return: SubsetWriter, Blob
+        """
+        bin_data = Blob()
+        subset_writer = SubsetWriter(self._tables,
+                                     bin_data,
+                                     self._desc,
+                                     self.is_compressed,
+                                     subsets,
+                                     edition=self.edition,
+                                     has_backref=self._has_backref)
+        sect.encode_sect4(bin_data, self.edition)
+        return subset_writer, bin_data
+
+    def _render(self, bin_data, subsets, datetime, update):
+        """Finish sections 4+5 and join them with the patched template head.
+
+        Since the head has an (even, Ed.3) number of octets, the padding in
+        section 4 is the same as if encoded as one bitstream.
+
+        :return: BUFR, a byte array object
+        """
+        # Pad last octet if needed, align to even octet number if Ed.3
+        bin_data.write_align(self.edition == 3)
+        sect5_start = sect.encode_sect5(bin_data)
+        sect.encode_sect4_size(bin_data, 0, sect5_start)
+        tail = bin_data.get_bytes()
+        head = bytearray(self._head)
+        if update is not None:
+            head[self._upd_offs] = update & 0xFF
+        if datetime is not None:
+            head[self._dtg_offs:self._dtg_offs + self._dtg_len] = \
+                bytearray(ord(c) for c in dtg2str(datetime, self.edition))
+        head[self._subs_offs:self._subs_offs + 2] = struct.pack(">H", subsets)
+        head[4:7] = struct.pack(">I", len(head) + len(tail))[1:]
+        return bytes(head) + tail